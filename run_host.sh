@@ -24,6 +24,15 @@ run_in_toolbox() {
     read
 }
 
+# 提交到容器内常驻任务队列 (jobs.py)，可与其他任务并发
+submit_job() {
+    # $1: 流水线名称 (见 jobs.py 中的 PIPELINES)
+    echo -e "${GREEN}📥 提交任务: $1 (Ctrl+C 仅停止查看日志，任务继续在后台运行)${NC}"
+    docker-compose exec -it ai_toolbox python /app/scripts/jobs.py submit $1 --follow
+    echo -e "${BLUE}按回车键继续...${NC}"
+    read
+}
+
 while true; do
     clear
     echo -e "${BLUE}=======================================================${NC}"
@@ -37,6 +46,7 @@ while true; do
     echo "   3. 🖌️  推理 (yolo_to_ls.py)"
     echo ""
     echo -e "${GREEN}[P4: 视频画面]${NC}"
+    echo "   f. ✂️  抽帧 (extract_frames.py: videos -> video_frames)"
     echo "   4. 🎬 训练 (auto_video_yolo.py)"
     echo "   5. 🖌️  推理 (yolo_to_ls.py)"
     echo ""
@@ -50,6 +60,10 @@ while true; do
     echo ""
     echo -e "${GREEN}[P8: 目标追踪]${NC}"
     echo "   10. ⚡ 自动追踪 (auto_tracker.py)"
+    echo "   v. 🎞️  追踪 + 语音转写 (video_pipeline.py: 一次解码同时生成 P8 和 P3 结果)"
+    echo ""
+    echo -e "${GREEN}[任务队列]${NC}"
+    echo "   j. 📋 查看任务列表 / 日志"
     echo ""
     echo "   q. 退出"
     
@@ -62,19 +76,30 @@ while true; do
             read 
             ;;
         # 👇 这里的路径已适配您的新目录名 (yolo_workspace)
-        2) run_in_toolbox "yolo_workspace/auto_yolo_manager.py --project_id 1" ;;
-        3) run_in_toolbox "yolo_to_ls.py --project 1" ;;
+        2) submit_job p1-train ;;
+        3) submit_job p1-infer ;;
         
-        4) run_in_toolbox "train_yolo_video/auto_video_yolo.py" ;;
-        5) run_in_toolbox "yolo_to_ls.py --project 4" ;;
+        f) submit_job p4-extract ;;
+        4) submit_job p4-train ;;
+        5) submit_job p4-infer ;;
         
-        6) run_in_toolbox "whisper_workspace/auto_train_manager.py" ;;
-        7) run_in_toolbox "whisper_to_ls.py --project 2" ;;
+        6) submit_job p2-train ;;
+        7) submit_job p2-infer ;;
         
-        8) run_in_toolbox "train_whisper_video/auto_video_whisper.py" ;;
-        9) run_in_toolbox "whisper_to_ls.py --project 3" ;;
+        8) submit_job p3-train ;;
+        9) submit_job p3-infer ;;
         
-        10) run_in_toolbox "video_tracking_workspace/auto_tracker.py" ;;
+        10) submit_job p8-track ;;
+        v) submit_job p38-video ;;
+
+        j)
+            docker-compose exec -it ai_toolbox python /app/scripts/jobs.py list
+            read -p "👉 输入任务 ID 查看日志 (回车返回): " job_id
+            if [ -n "$job_id" ]; then
+                docker-compose exec -it ai_toolbox python /app/scripts/jobs.py tail $job_id -f
+                read
+            fi
+            ;;
         
         q) exit 0 ;;
         *) echo "❌ 无效选择"; sleep 1 ;;
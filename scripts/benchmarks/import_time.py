@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+# ==========================================
+# ⏱️ 入口脚本冷启动 / 导入耗时基准
+# ==========================================
+#   python /app/scripts/benchmarks/import_time.py            # 表格 + 回归检查
+#   python /app/scripts/benchmarks/import_time.py --top 5    # 每个入口最慢的 5 个顶层导入
+#   python /app/scripts/benchmarks/import_time.py --json out.json
+# 任何入口在导入阶段加载了重型依赖、或超出时间预算时，以非零码退出。
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = [
+    "yolo_to_ls.py",
+    "whisper_to_ls.py",
+    "jobs.py",
+    "evaluate.py",
+    "select_tasks.py",
+    "yolo_workspace/auto_yolo_manager.py",
+    "yolo_workspace/train.py",
+    "train_yolo_video/auto_video_yolo.py",
+    "train_yolo_video/video_inference.py",
+    "whisper_workspace/auto_train_manager.py",
+    "whisper_workspace/prepare_data.py",
+    "whisper_workspace/train_whisper.py",
+    "train_whisper_video/auto_video_whisper.py",
+    "train_whisper_video/prepare_data.py",
+    "train_whisper_video/train_whisper.py",
+    "video_tracking_workspace/auto_tracker.py",
+    "video_tracking_workspace/video_pipeline.py",
+]
+
+# 只应在真正用到的代码路径里加载的依赖
+HEAVY_MODULES = [
+    "torch", "ultralytics", "transformers", "datasets", "evaluate", "librosa",
+    "pandas", "label_studio_sdk", "cv2", "pydub", "numpy",
+]
+
+# 提前退出的简单命令 (未知项目 / 空目录 / 查看队列)，整条命令都应在预算内完成
+CLI_CASES = [
+    ("yolo_to_ls.py", ["--project", "0"]),
+    ("yolo_to_ls.py", ["--project", "1"]),
+    ("whisper_to_ls.py", ["--project", "0"]),
+    ("whisper_to_ls.py", ["--project", "2"]),
+    ("video_tracking_workspace/auto_tracker.py", []),
+    ("video_tracking_workspace/video_pipeline.py", []),
+    ("jobs.py", ["list"]),
+    ("evaluate.py", ["--project", "1"]),
+    ("select_tasks.py", ["--project", "1"]),
+]
+
+_LOADER = r"""
+import sys, os, json, importlib.util
+path = sys.argv[1]
+sys.path.insert(0, os.path.dirname(path))
+spec = importlib.util.spec_from_file_location("bench_entry", path)
+mod = importlib.util.module_from_spec(spec)
+sys.stderr.write("__BEGIN__\n"); sys.stderr.flush()
+spec.loader.exec_module(mod)
+heavy = json.loads(sys.argv[2])
+sys.__stdout__.write("\n__LOADED__" + json.dumps([m for m in heavy if m in sys.modules]) + "\n")
+"""
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 输出，返回 (总耗时 us, 顶层导入列表[(模块, 累计 us)])"""
+    total_us = 0
+    top_level = []
+    # 跳过加载器自身的导入，只统计入口脚本触发的部分
+    lines = stderr.splitlines()
+    if "__BEGIN__" in lines:
+        lines = lines[lines.index("__BEGIN__") + 1:]
+    for line in lines:
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        self_us, cum_us, name = int(parts[0]), int(parts[1]), parts[2]
+        total_us += self_us
+        # 缩进为 0 的才是入口脚本直接触发的导入
+        if not name[1:].startswith(" "):
+            top_level.append((name.strip(), cum_us))
+    top_level.sort(key=lambda x: -x[1])
+    return total_us, top_level
+
+
+def _env(tmp_root):
+    env = dict(os.environ)
+    # 指向空的临时数据目录，避免碰到真实数据或 /data 不可写
+    env.update({"DATA_ROOT": tmp_root, "JOBS_ROOT": os.path.join(tmp_root, "jobs"), "PYTHONDONTWRITEBYTECODE": "1"})
+    return env
+
+
+def measure_baseline(env):
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], env=env, check=True)
+    return time.perf_counter() - t0
+
+
+def measure_import(rel_path, env, cwd):
+    path = os.path.join(SCRIPTS_DIR, rel_path)
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _LOADER, path, json.dumps(HEAVY_MODULES)],
+        env=env, cwd=cwd, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - t0
+    loaded = None
+    for line in proc.stdout.splitlines():
+        if line.startswith("__LOADED__"):
+            loaded = json.loads(line[len("__LOADED__"):])
+    total_us, top_level = parse_importtime(proc.stderr)
+    return {
+        "entry": rel_path, "ok": proc.returncode == 0 and loaded is not None,
+        "wall_s": wall, "import_ms": total_us / 1000, "heavy_loaded": loaded or [],
+        "top": [{"module": m, "cumulative_ms": us / 1000} for m, us in top_level],
+        "error": None if proc.returncode == 0 else proc.stderr.strip().splitlines()[-1:],
+    }
+
+
+def measure_cli(rel_path, argv, env, cwd):
+    path = os.path.join(SCRIPTS_DIR, rel_path)
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, path] + argv, env=env, cwd=cwd, capture_output=True, text=True)
+    return {"cmd": " ".join([rel_path] + argv), "wall_s": time.perf_counter() - t0, "returncode": proc.returncode}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="入口脚本导入耗时基准")
+    parser.add_argument("--top", type=int, default=3, help="每个入口显示最慢的 N 个顶层导入")
+    parser.add_argument("--budget", type=float, default=0.5, help="提前退出命令的耗时预算 (秒，已扣除解释器启动)")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp_root:
+        env = _env(tmp_root)
+        baseline = measure_baseline(env)
+        print(f"🐍 解释器空启动: {baseline * 1000:.0f} ms\n")
+
+        print(f"{'入口':<45} {'导入ms':>8} {'总耗时ms':>9}  重型依赖")
+        imports = []
+        for rel_path in ENTRY_POINTS:
+            r = measure_import(rel_path, env, tmp_root)
+            imports.append(r)
+            heavy = ",".join(r['heavy_loaded']) or "-"
+            flag = "✅" if r['ok'] and not r['heavy_loaded'] else "❌"
+            print(f"{flag} {rel_path:<43} {r['import_ms']:>8.1f} {r['wall_s'] * 1000:>9.0f}  {heavy}")
+            for t in r['top'][:args.top]:
+                print(f"      └─ {t['module']:<38} {t['cumulative_ms']:>8.1f}")
+            if not r['ok']:
+                failures.append(f"{rel_path} 导入失败: {r['error']}")
+            elif r['heavy_loaded']:
+                failures.append(f"{rel_path} 导入时加载了 {heavy}")
+
+        print(f"\n{'命令':<55} {'耗时ms':>8}")
+        cli = []
+        for rel_path, argv in CLI_CASES:
+            r = measure_cli(rel_path, argv, env, tmp_root)
+            cli.append(r)
+            over = r['wall_s'] - baseline > args.budget
+            print(f"{'❌' if over else '✅'} {r['cmd']:<53} {r['wall_s'] * 1000:>8.0f}")
+            if over:
+                failures.append(f"{r['cmd']} 超出预算 {args.budget}s")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"python": sys.version.split()[0], "baseline_s": baseline, "imports": imports, "cli": cli},
+                      f, indent=2, ensure_ascii=False)
+        print(f"\n💾 已写入: {args.json}")
+
+    if failures:
+        print("\n❌ 回归:")
+        for msg in failures:
+            print(f"   - {msg}")
+        sys.exit(1)
+    print("\n🎉 所有入口均为延迟加载")
+
+
+if __name__ == "__main__":
+    main()
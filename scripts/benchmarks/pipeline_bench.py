@@ -0,0 +1,427 @@
+import os
+import sys
+import json
+import time
+import wave
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+# ==========================================
+# 🏁 全流水线吞吐基准 (合成数据，离线，CPU)
+# ==========================================
+#   python /app/scripts/benchmarks/pipeline_bench.py                 # 跑全部阶段，追加到历史记录
+#   python /app/scripts/benchmarks/pipeline_bench.py --stages tracking,yolo_infer --scale 2
+#   python /app/scripts/benchmarks/pipeline_bench.py --list           # 查看历史记录
+# 每个阶段在独立子进程里运行 (峰值 RSS 互不干扰)，模型全部是随机初始化的小模型，不联网。
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_ROOT = os.getenv('DATA_ROOT', '/data')
+HISTORY_PATH = os.getenv('BENCH_HISTORY') or os.path.join(DATA_ROOT, "benchmarks", "history.jsonl")
+
+# 合成数据规模 (--scale 倍数)
+N_IMAGES = 24
+N_TASKS = 2000
+N_CLIPS = 6
+CLIP_SECONDS = 8
+VIDEO_FRAMES = 120
+IMG_SIZE = (960, 720)
+SAMPLE_RATE = 16000
+# 随机初始化 Whisper 每个窗口固定生成的 token 数 (保证每次计算量一致)
+WHISPER_NEW_TOKENS = 16
+
+STAGES = ["ls_export", "convert_ls_to_yolo", "dataset_build", "whisper_prepare",
+          "yolo_infer", "whisper_infer", "tracking", "tracking_batch"]
+CLASS_NAMES = ["物体框(Box)", "文字区域", "复杂轮廓(Poly)"]
+
+
+# ---------------- 合成数据 ----------------
+
+def _write_wav(path, seconds, seed):
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    freq = 220 + 40 * (seed % 10)
+    signal = 0.3 * np.sin(2 * np.pi * freq * t) + 0.05 * rng.standard_normal(len(t))
+    pcm = (np.clip(signal, -1, 1) * 32767).astype("<i2")
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(pcm.tobytes())
+
+
+def generate(root, scale=1.0):
+    """在 root 下生成与 project_data 相同布局的合成数据"""
+    import cv2
+    import numpy as np
+    rng = random.Random(0)
+    n_images, n_tasks = max(2, int(N_IMAGES * scale)), max(10, int(N_TASKS * scale))
+    n_clips, n_frames = max(1, int(N_CLIPS * scale)), max(10, int(VIDEO_FRAMES * scale))
+    for sub in ["images", "video_frames", "audio", "videos", "work"]:
+        os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    # 1. 画了矩形框的图片 + 对应的 Label Studio 标注
+    w, h = IMG_SIZE
+    image_tasks = []
+    for i in range(n_images):
+        img = np.full((h, w, 3), rng.randint(40, 200), dtype=np.uint8)
+        result = []
+        for j in range(rng.randint(1, 5)):
+            bw, bh = rng.randint(40, w // 3), rng.randint(40, h // 3)
+            x, y = rng.randint(0, w - bw), rng.randint(0, h - bh)
+            color = tuple(rng.randint(0, 255) for _ in range(3))
+            cv2.rectangle(img, (x, y), (x + bw, y + bh), color, -1)
+            result.append({"id": f"r{i}_{j}", "type": "rectanglelabels", "original_width": w, "original_height": h,
+                           "value": {"x": x / w * 100, "y": y / h * 100, "width": bw / w * 100, "height": bh / h * 100,
+                                     "rectanglelabels": [rng.choice(CLASS_NAMES)]}})
+        fname = f"img_{i:05d}.jpg"
+        cv2.imwrite(os.path.join(root, "images", fname), img)
+        cv2.imwrite(os.path.join(root, "video_frames", fname), img)
+        image_tasks.append((fname, result))
+
+    # 2. 伪造的 Label Studio 导出 (旧版 JSON 数组格式，任务数远多于图片数，循环引用图片)
+    with open(os.path.join(root, "work", "yolo_export.json"), 'w', encoding='utf-8') as f:
+        f.write("[")
+        for k in range(n_tasks):
+            fname, result = image_tasks[k % n_images]
+            task = {"id": k + 1, "data": {"image": f"/data/local-files/?d=images/{fname}"},
+                    "annotations": [{"id": k + 1, "result": result}]}
+            f.write(("," if k else "") + json.dumps(task, ensure_ascii=False))
+        f.write("]")
+
+    # 3. 正弦 + 噪声音频，以及带时间段转写的导出
+    audio_tasks = []
+    for i in range(n_clips):
+        fname = f"clip_{i:04d}.wav"
+        _write_wav(os.path.join(root, "audio", fname), CLIP_SECONDS, i)
+        result = [{"id": f"a{i}_{j}", "type": "textarea",
+                   "value": {"start": j * 2.0, "end": j * 2.0 + 1.8, "text": [f"合成语音 {i} {j}"]}}
+                  for j in range(int(CLIP_SECONDS // 2))]
+        audio_tasks.append({"id": i + 1, "data": {"audio": f"/data/local-files/?d=audio/{fname}"},
+                            "annotations": [{"id": i + 1, "result": result}]})
+    with open(os.path.join(root, "work", "whisper_export.jsonl"), 'w', encoding='utf-8') as f:
+        for task in audio_tasks:
+            f.write(json.dumps(task, ensure_ascii=False) + "\n")
+
+    # 4. 两个方块匀速运动的短视频
+    vw = cv2.VideoWriter(os.path.join(root, "videos", "synthetic.mp4"), cv2.VideoWriter_fourcc(*"mp4v"), 25, (w, h))
+    for i in range(n_frames):
+        frame = np.full((h, w, 3), 90, dtype=np.uint8)
+        cv2.rectangle(frame, (20 + i * 3 % (w - 120), 100), (120 + i * 3 % (w - 120), 220), (0, 0, 255), -1)
+        cv2.rectangle(frame, (w // 2, 300 + i % 200), (w // 2 + 80, 380 + i % 200), (0, 255, 0), -1)
+        vw.write(frame)
+    vw.release()
+    return {"images": n_images, "tasks": n_tasks, "clips": n_clips, "frames": n_frames}
+
+
+# ---------------- 计时工具 ----------------
+
+class Recorder:
+    """记录每个条目的耗时 (秒)"""
+
+    def __init__(self):
+        self.latencies = []
+
+    def wrap(self, fn):
+        def _timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.latencies.append(time.perf_counter() - t0)
+        return _timed
+
+    def wrap_iter(self, make_iter):
+        """包装生成器函数: 统计相邻两次产出之间的耗时，即处理一个条目 (含读取) 的时间"""
+        def _timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            for item in make_iter(*args, **kwargs):
+                yield item
+                t1 = time.perf_counter()
+                self.latencies.append(t1 - t0)
+                t0 = t1
+        return _timed
+
+
+def _import_script(rel_path):
+    import importlib.util
+    path = os.path.join(SCRIPTS_DIR, rel_path)
+    sys.path.insert(0, os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(path))[0], path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def _tiny_yolo(rec, method):
+    from ultralytics import YOLO
+    # 从 yaml 构建随机初始化的 yolov8n，不需要下载权重
+    model = YOLO("yolov8n.yaml")
+    setattr(model, method, rec.wrap(getattr(model, method)))
+    return model
+
+
+# ---------------- 各阶段 (在子进程中运行) ----------------
+
+def stage_ls_export(root, rec):
+    sys.path.insert(0, SCRIPTS_DIR)
+    from common.ls_export import iter_tasks
+    n = 0
+    for _ in rec.wrap_iter(iter_tasks)(os.path.join(root, "work", "yolo_export.json")):
+        n += 1
+    return n
+
+
+def stage_convert_ls_to_yolo(root, rec):
+    mod = _import_script("yolo_workspace/auto_yolo_manager.py")
+    sys.path.insert(0, SCRIPTS_DIR)
+    from common.ls_export import iter_tasks
+    convert = rec.wrap(mod.convert_ls_to_yolo)
+    n = 0
+    for task in iter_tasks(os.path.join(root, "work", "yolo_export.json")):
+        for ann in task['annotations']:
+            convert(ann['result'], IMG_SIZE[0], IMG_SIZE[1])
+            n += 1
+    return n
+
+
+def stage_dataset_build(root, rec):
+    mod = _import_script("yolo_workspace/auto_yolo_manager.py")
+    from common.yolo_dataset import add_sample
+    dataset_dir = os.path.join(root, "work", "datasets")
+    for split in ['train', 'val']:
+        os.makedirs(os.path.join(dataset_dir, f"images/{split}"), exist_ok=True)
+        os.makedirs(os.path.join(dataset_dir, f"labels/{split}"), exist_ok=True)
+    add = rec.wrap(add_sample)
+    n = 0
+    for fname in sorted(os.listdir(os.path.join(root, "images"))):
+        result = [{"type": "rectanglelabels", "value": {"x": 10, "y": 10, "width": 20, "height": 30,
+                                                        "rectanglelabels": [CLASS_NAMES[0]]}}]
+        lines = mod.convert_ls_to_yolo(result, IMG_SIZE[0], IMG_SIZE[1])
+        add(dataset_dir, os.path.join(root, "images", fname), fname, lines, 640)
+        n += 1
+    return n
+
+
+def stage_whisper_prepare(root, rec):
+    mod = _import_script("whisper_workspace/prepare_data.py")
+    mod.EXPORT_FILE = os.path.join(root, "work", "whisper_export.jsonl")
+    mod.OUTPUT_DIR = os.path.join(root, "work", "whisper_dataset")
+    mod.iter_tasks = rec.wrap_iter(mod.iter_tasks)
+    mod.prepare_dataset()
+    return len(rec.latencies)
+
+
+def stage_yolo_infer(root, rec):
+    import ultralytics
+    model = _tiny_yolo(rec, "predict")
+    ultralytics.YOLO = lambda *a, **k: model
+    mod = _import_script("yolo_to_ls.py")
+    mod.run_inference('4')
+    return len(rec.latencies)
+
+
+def stage_whisper_infer(root, rec):
+    from transformers import WhisperConfig, WhisperFeatureExtractor, WhisperForConditionalGeneration
+
+    config = WhisperConfig(vocab_size=512, num_mel_bins=80, d_model=64, encoder_layers=1, decoder_layers=1,
+                           encoder_attention_heads=2, decoder_attention_heads=2,
+                           encoder_ffn_dim=128, decoder_ffn_dim=128, max_target_positions=64,
+                           pad_token_id=0, bos_token_id=1, eos_token_id=2, decoder_start_token_id=1)
+    model = WhisperForConditionalGeneration(config).eval()
+    generate = model.generate
+
+    def _generate(input_features, language=None, task=None, **kwargs):
+        # 随机模型的配置里没有语言 token，忽略 language/task，固定生成长度；
+        # 其余参数 (return_dict_in_generate / output_scores，取 token 概率用) 原样传下去
+        return generate(input_features, max_new_tokens=WHISPER_NEW_TOKENS, min_new_tokens=WHISPER_NEW_TOKENS, **kwargs)
+    model.generate = rec.wrap(_generate)
+
+    class _Tokenizer:
+        all_special_ids = [config.pad_token_id, config.bos_token_id, config.eos_token_id]
+
+    class _Processor:
+        feature_extractor = WhisperFeatureExtractor()
+        tokenizer = _Tokenizer()
+
+        def __call__(self, speech, sampling_rate, return_tensors):
+            return self.feature_extractor(speech, sampling_rate=sampling_rate, return_tensors=return_tensors)
+
+        def batch_decode(self, ids, skip_special_tokens=True):
+            return [" ".join(map(str, row.tolist())) for row in ids]
+
+    # 直接替换脚本里的 load_whisper: transformers 5 的惰性模块会在之后的导入中把打在 transformers.Whisper* 上的补丁还原
+    mod = _import_script("whisper_to_ls.py")
+    mod.load_whisper = lambda *a, **k: (model, _Processor(), "cpu")
+    mod.run_inference('2')
+    return len(rec.latencies)
+
+
+def stage_tracking(root, rec):
+    """逐帧 model.track (batch=1)，与历史记录里的 tracking 可比: 每个延迟是一帧"""
+    mod = _import_script("video_tracking_workspace/auto_tracker.py")
+    model = _tiny_yolo(rec, "track")
+    stats = mod.run_tracking(os.path.join(root, "videos", "synthetic.mp4"),
+                             os.path.join(root, "work", "track_synthetic.json"), model, checkpoint_seconds=0, batch=1)
+    return stats['frames'] if stats else 0
+
+
+def stage_tracking_batch(root, rec):
+    """批量检测 (batch=EVAL_BATCH，BatchTracker 走 model.predict): 每个延迟是一批帧"""
+    mod = _import_script("video_tracking_workspace/auto_tracker.py")
+    model = _tiny_yolo(rec, "predict")
+    stats = mod.run_tracking(os.path.join(root, "videos", "synthetic.mp4"),
+                             os.path.join(root, "work", "track_synthetic.json"), model, checkpoint_seconds=0,
+                             batch=mod.EVAL_BATCH)
+    return stats['frames'] if stats else 0
+
+
+def run_stage(name, root):
+    rec = Recorder()
+    t0 = time.perf_counter()
+    try:
+        items = globals()[f"stage_{name}"](root, rec)
+        error = None
+    except ImportError as e:
+        items, error = 0, f"skipped: {e}"
+    except Exception as e:
+        items, error = 0, f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - t0
+    sys.__stdout__.write("\n__RESULT__" + json.dumps(
+        {"items": items, "seconds": seconds, "latencies": rec.latencies, "error": error}) + "\n")
+
+
+# ---------------- 汇总 ----------------
+
+def _percentile(sorted_vals, q):
+    if not sorted_vals:
+        return None
+    k = (len(sorted_vals) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+def measure(name, root, env):
+    """子进程运行一个阶段，用 wait4 拿到该子进程自己的峰值 RSS"""
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--run-stage", name, "--root", root],
+                            env=env, cwd=os.path.join(root, "work"), stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, text=True)
+    output = proc.stdout.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    result = None
+    for line in output.splitlines():
+        if line.startswith("__RESULT__"):
+            result = json.loads(line[len("__RESULT__"):])
+    if result is None:
+        tail = output.strip().splitlines()[-1:] or ["无输出"]
+        result = {"items": 0, "seconds": 0.0, "latencies": [], "error": f"exit {proc.returncode}: {tail[0]}"}
+    lat = sorted(result.pop("latencies"))
+    result.update({
+        "items_per_sec": result["items"] / result["seconds"] if result["items"] and result["seconds"] else 0.0,
+        "p50_ms": _percentile(lat, 0.50) * 1000 if lat else None,
+        "p90_ms": _percentile(lat, 0.90) * 1000 if lat else None,
+        "p99_ms": _percentile(lat, 0.99) * 1000 if lat else None,
+        # Linux 上 ru_maxrss 单位是 KB
+        "peak_rss_mb": usage.ru_maxrss / 1024,
+    })
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "-C", SCRIPTS_DIR, "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _fmt_ms(v):
+    return f"{v:>8.2f}" if v is not None else f"{'-':>8}"
+
+
+def print_history(history):
+    for run in history:
+        print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(run['time']))}  commit={run.get('commit') or '-'}  "
+              f"scale={run['scale']}")
+        for name, r in run['stages'].items():
+            status = r['error'] or f"{r['items_per_sec']:.1f}/s"
+            print(f"   {name:<20} {status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成数据全流水线吞吐基准")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"逗号分隔，可选: {','.join(STAGES)}")
+    parser.add_argument("--scale", type=float, default=1.0, help="合成数据规模倍数")
+    parser.add_argument("--history", default=HISTORY_PATH, help="历史记录 (JSONL，每次运行追加一行)")
+    parser.add_argument("--keep", help="把合成数据保留在该目录 (默认用完即删)")
+    parser.add_argument("--list", action="store_true", help="只打印历史记录")
+    parser.add_argument("--run-stage", help=argparse.SUPPRESS)
+    parser.add_argument("--root", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        run_stage(args.run_stage, args.root)
+        return
+    if args.list:
+        print_history(_load_history(args.history))
+        return
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        print(f"❌ 未知阶段: {', '.join(unknown)}")
+        sys.exit(1)
+
+    root = args.keep or tempfile.mkdtemp(prefix="bench_")
+    try:
+        t0 = time.time()
+        sizes = generate(root, args.scale)
+        print(f"🧪 合成数据: {sizes} ({time.time() - t0:.1f}s) -> {root}\n")
+        env = dict(os.environ)
+        # 所有脚本的 DATA_ROOT / 工作目录都指向合成数据，强制离线
+        env.update({"DATA_ROOT": root, "JOB_WORK_DIR": os.path.join(root, "work"), "JOBS_ROOT": os.path.join(root, "jobs"),
+                    "HF_HUB_OFFLINE": "1", "YOLO_OFFLINE": "1", "CUDA_VISIBLE_DEVICES": ""})
+
+        history = _load_history(args.history)
+        # 只和相同数据规模的上一次运行对比
+        same_scale = [run for run in history if run.get('scale') == args.scale]
+        prev = same_scale[-1]['stages'] if same_scale else {}
+        print(f"{'阶段':<20} {'条目':>6} {'条目/s':>9} {'p50ms':>8} {'p90ms':>8} {'p99ms':>8} {'峰值MB':>7}  对比上次")
+        results = {}
+        for name in stages:
+            r = measure(name, root, env)
+            results[name] = r
+            if r['error']:
+                print(f"⚠️ {name:<18} {r['error']}")
+                continue
+            delta = ""
+            old = prev.get(name)
+            if old and not old.get('error') and old['items_per_sec']:
+                delta = f"{(r['items_per_sec'] / old['items_per_sec'] - 1) * 100:+.1f}%"
+            print(f"✅ {name:<18} {r['items']:>6} {r['items_per_sec']:>9.1f} {_fmt_ms(r['p50_ms'])} "
+                  f"{_fmt_ms(r['p90_ms'])} {_fmt_ms(r['p99_ms'])} {r['peak_rss_mb']:>7.0f}  {delta}")
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    entry = {"time": time.time(), "commit": _git_commit(), "python": platform.python_version(),
+             "cpus": os.cpu_count(), "scale": args.scale, "sizes": sizes, "stages": results}
+    os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+    with open(args.history, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    print(f"\n💾 已追加到: {args.history}")
+
+
+if __name__ == "__main__":
+    main()
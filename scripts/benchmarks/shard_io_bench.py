@@ -0,0 +1,118 @@
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+# ==========================================
+# 📦 训练集读取方式对比: 逐文件随机读 vs 分片顺序读
+# ==========================================
+#   python /app/scripts/benchmarks/shard_io_bench.py                       # 生成 2000 张合成图，在临时目录对比
+#   python /app/scripts/benchmarks/shard_io_bench.py --dir /data/tmp_bench  # 放到网络盘上测 (这才是要看的场景)
+#   python /app/scripts/benchmarks/shard_io_bench.py --images /data/images --limit 5000
+# 模拟一个 epoch 的图片读取 (不解码)：文件格式按随机顺序逐个 open，分片格式按 ShardSampler 的顺序读。
+# 报告 open 次数、读取次数、平均单次读取大小和耗时，并校验两种方式读到的字节完全一致。
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTS_DIR)
+
+
+def make_images(out_dir, n, side):
+    import cv2
+    import numpy as np
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(n):
+        img = np.full((side, side, 3), 114, np.uint8)
+        x, y = rng.integers(0, side - 64, 2)
+        img[y:y + 64, x:x + 64] = rng.integers(0, 255, (64, 64, 3), dtype=np.uint8)
+        path = os.path.join(out_dir, f"img_{i:06d}.jpg")
+        cv2.imwrite(path, img)
+        paths.append(path)
+    return paths
+
+
+def build(images, root, shard_mb):
+    from common.yolo_dataset import add_sample
+    from common.yolo_shards import ShardWriter
+    files_dir, shards_dir = os.path.join(root, "files"), os.path.join(root, "sharded")
+    for d in ["images/train", "labels/train", "images/val", "labels/val"]:
+        os.makedirs(os.path.join(files_dir, d), exist_ok=True)
+    writer = ShardWriter(shards_dir, shard_mb=shard_mb)
+    lines = ["0 0.5 0.5 0.1 0.1"]
+    t0 = time.perf_counter()
+    for p in images:
+        add_sample(files_dir, p, os.path.basename(p), lines)
+    t_files = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for p in images:
+        writer.add(p, os.path.basename(p), lines)
+    writer.close()
+    t_shards = time.perf_counter() - t0
+    print(f"🧱 构建: 文件格式 {t_files:.2f}s，分片格式 {t_shards:.2f}s")
+    return files_dir, writer.out_dir
+
+
+def epoch_files(files_dir, names, seed):
+    order = list(names)
+    random.Random(seed).shuffle(order)
+    t0 = time.perf_counter()
+    data, nbytes = {}, 0
+    for name in order:
+        with open(os.path.join(files_dir, "images/train", name), 'rb') as f:
+            data[name] = f.read()
+        nbytes += len(data[name])
+    return {"seconds": time.perf_counter() - t0, "opens": len(order), "reads": len(order), "bytes": nbytes}, data
+
+
+def epoch_shards(shard_dir, seed):
+    from common.yolo_shards import ShardReader, ShardSampler
+    reader = ShardReader(shard_dir)
+    sampler = ShardSampler([s["shard"] for s in reader.samples], seed=seed)
+    t0 = time.perf_counter()
+    data = {}
+    for i in sampler:
+        data[reader.samples[i]["file"]] = bytes(reader.read(i))
+    nbytes = sum(os.path.getsize(os.path.join(shard_dir, s)) for s in reader.shards)
+    return {"seconds": time.perf_counter() - t0, "opens": reader.shard_reads, "reads": reader.shard_reads,
+            "bytes": nbytes}, data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="逐文件随机读 vs 分片顺序读")
+    parser.add_argument("--images", help="使用已有图片目录 (默认生成合成图)")
+    parser.add_argument("--limit", type=int, default=2000, help="图片数量")
+    parser.add_argument("--side", type=int, default=640, help="合成图边长")
+    parser.add_argument("--shard-mb", type=int, default=16, help="分片大小 (MB)")
+    parser.add_argument("--dir", help="工作目录 (默认系统临时目录，测完删除)")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="shard_bench_", dir=args.dir)
+    try:
+        if args.images:
+            images = sorted(os.path.join(args.images, f) for f in os.listdir(args.images)
+                            if f.lower().endswith((".jpg", ".jpeg", ".png")))[:args.limit]
+        else:
+            images = make_images(os.path.join(root, "src"), args.limit, args.side)
+        print(f"🖼️  {len(images)} 张图片，工作目录 {root}")
+        files_dir, shard_dir = build(images, root, args.shard_mb)
+
+        names = [os.path.basename(p) for p in images]
+        r_files, d_files = epoch_files(files_dir, names, seed=1)
+        r_shards, d_shards = epoch_shards(shard_dir, seed=1)
+        print(f"{'format':<10}{'opens':>8}{'reads':>8}{'avg read':>12}{'seconds':>10}{'MB/s':>9}")
+        for name, r in (("files", r_files), ("shards", r_shards)):
+            print(f"{name:<10}{r['opens']:>8}{r['reads']:>8}{r['bytes'] / max(r['reads'], 1) / 1024:>10.0f}KB"
+                  f"{r['seconds']:>10.3f}{r['bytes'] / 1e6 / max(r['seconds'], 1e-9):>9.0f}")
+        if d_files != d_shards:
+            print("❌ 两种格式读到的内容不一致")
+            sys.exit(1)
+        print("✅ 内容一致")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+
+# ==========================================
+# 🎤 Whisper 后端对比: PyTorch vs ONNX Runtime (fp32 / int8)
+# ==========================================
+#   python /app/scripts/benchmarks/whisper_backend_bench.py                        # project_data/audio 前 20 个文件
+#   python /app/scripts/benchmarks/whisper_backend_bench.py --model /app/scripts/whisper_workspace/whisper-finetuned-model
+#   python /app/scripts/benchmarks/whisper_backend_bench.py --backends torch,onnx --json out.json
+# 以 PyTorch 的转写为参考，报告各后端的逐字一致率、字错率 (CER)、单条延迟和实时率。
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTS_DIR)
+DATA_ROOT = os.getenv('DATA_ROOT', '/data')
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+
+def _edit_distance(a, b):
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+        prev = cur
+    return prev[-1]
+
+
+def _percentile(sorted_vals, q):
+    return sorted_vals[min(int(q * len(sorted_vals)), len(sorted_vals) - 1)]
+
+
+def run_backend(name, model_path, clips, language):
+    from common.whisper_infer import load_whisper, transcribe_window
+    t0 = time.perf_counter()
+    whisper = load_whisper(model_path, backend="onnx" if name.startswith("onnx") else "torch",
+                           int8=name.endswith("int8"))
+    load_s = time.perf_counter() - t0
+    # 预热一次 (分配内存 / ORT 图优化)，不计时
+    transcribe_window(whisper, clips[0][1], language)
+    texts, latencies = [], []
+    for _, speech in clips:
+        t0 = time.perf_counter()
+        texts.append(transcribe_window(whisper, speech, language).strip())
+        latencies.append(time.perf_counter() - t0)
+    return {"load_s": load_s, "texts": texts, "latencies": latencies}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Whisper PyTorch / ONNX Runtime 后端对比")
+    parser.add_argument("--audio-dir", default=os.path.join(DATA_ROOT, "audio"), help="参考音频目录")
+    parser.add_argument("--limit", type=int, default=20, help="最多取多少个文件 (每个截取前 30 秒)")
+    parser.add_argument("--model", default="/app/models/whisper", help="Whisper 模型目录")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help=f"逗号分隔，可选: {','.join(BACKENDS)}")
+    parser.add_argument("--language", default="zh")
+    parser.add_argument("--json", help="把结果写到该文件")
+    args = parser.parse_args()
+
+    files = sorted(f for ext in ("*.wav", "*.mp3", "*.flac", "*.m4a", "*.ogg")
+                   for f in glob.glob(os.path.join(args.audio_dir, ext)))[:args.limit]
+    if not files:
+        print(f"❌ 未找到音频文件: {args.audio_dir}")
+        sys.exit(1)
+    import librosa
+    from common.whisper_infer import SAMPLE_RATE, WINDOW_SECONDS
+    clips = [(f, librosa.load(f, sr=SAMPLE_RATE, duration=WINDOW_SECONDS)[0]) for f in files]
+    audio_s = sum(len(s) for _, s in clips) / SAMPLE_RATE
+    print(f"🎧 参考集: {len(clips)} 个文件, 共 {audio_s:.1f}s 音频")
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    results = {}
+    for name in backends:
+        print(f"▶️  {name}")
+        results[name] = run_backend(name, args.model, clips, args.language)
+
+    ref = results.get("torch")
+    print("-" * 96)
+    print(f"{'backend':<12}{'load s':>9}{'p50 ms':>10}{'p90 ms':>10}{'total s':>10}{'RTFx':>8}"
+          f"{'same text':>12}{'CER vs torch':>14}")
+    summary = {}
+    for name, r in results.items():
+        lat = sorted(r["latencies"])
+        total = sum(lat)
+        row = {"load_s": r["load_s"], "p50_ms": _percentile(lat, 0.5) * 1000, "p90_ms": _percentile(lat, 0.9) * 1000,
+               "total_s": total, "rtfx": audio_s / max(total, 1e-9)}
+        if ref is not None:
+            same = sum(a == b for a, b in zip(r["texts"], ref["texts"]))
+            errors = sum(_edit_distance(a, b) for a, b in zip(r["texts"], ref["texts"]))
+            row["same_text"] = same / len(clips)
+            row["cer_vs_torch"] = errors / max(sum(len(t) for t in ref["texts"]), 1)
+        summary[name] = row
+        agree = f"{row['same_text']:>12.0%}{row['cer_vs_torch']:>14.2%}" if ref is not None else f"{'-':>12}{'-':>14}"
+        print(f"{name:<12}{row['load_s']:>9.1f}{row['p50_ms']:>10.0f}{row['p90_ms']:>10.0f}{total:>10.1f}"
+              f"{row['rtfx']:>8.1f}" + agree)
+    if ref is not None:
+        for name, r in results.items():
+            if name == "torch": continue
+            diffs = [(f, a, b) for (f, _), a, b in zip(clips, r["texts"], ref["texts"]) if a != b][:3]
+            for f, a, b in diffs:
+                print(f"   ≠ {name} {os.path.basename(f)}\n      torch: {b}\n      {name}: {a}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"files": [f for f, _ in clips], "audio_seconds": audio_s, "summary": summary,
+                       "texts": {k: v["texts"] for k, v in results.items()}}, f, indent=2, ensure_ascii=False)
+        print(f"📄 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+# ==========================================
+# 🧪 文件租约队列的多进程自检 (不需要模型)
+# ==========================================
+#   python /app/scripts/benchmarks/work_queue_check.py                  # 本机 4 个进程，其中 1 个中途崩溃
+#   python /app/scripts/benchmarks/work_queue_check.py --dir /data/tmp  # 指定目录 (例如 NFS 挂载点)
+# 每个 worker 把条目名写进分片；崩溃的 worker 持有的批次在租约超时后由其他 worker 回收。
+# 最终输出必须按原顺序恰好包含每个条目一次，否则以非零码退出。
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTS_DIR)
+
+
+def run_worker(root, n_items, batch_size, lease_seconds, item_seconds, crash_after):
+    from common.work_queue import WorkQueue
+    items = [f"item_{i:05d}" for i in range(n_items)]
+    q = WorkQueue(os.path.join(root, "queue"), items, batch_size=batch_size, lease_seconds=lease_seconds)
+    done = 0
+    for batch_id, batch in q.batches():
+        results = []
+        for item in batch:
+            time.sleep(item_seconds)
+            if crash_after and done >= crash_after:
+                # 模拟节点宕机: 不释放租约、不写分片，直接退出
+                os._exit(17)
+            results.append({"item": item, "worker": q.worker_id})
+            done += 1
+        q.complete(batch_id, results)
+    q.merge(os.path.join(root, "output.json"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文件租约队列多进程自检")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--lease-seconds", type=float, default=2.0)
+    parser.add_argument("--item-seconds", type=float, default=0.005)
+    parser.add_argument("--dir", help="队列目录所在位置 (默认临时目录)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--root", help=argparse.SUPPRESS)
+    parser.add_argument("--crash-after", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.root, args.items, args.batch_size, args.lease_seconds, args.item_seconds, args.crash_after)
+        return
+
+    root = tempfile.mkdtemp(prefix="wq_check_", dir=args.dir)
+    common = ["--items", str(args.items), "--batch-size", str(args.batch_size),
+              "--lease-seconds", str(args.lease_seconds), "--item-seconds", str(args.item_seconds)]
+    t0 = time.time()
+    procs = []
+    for i in range(args.workers):
+        # 第一个 worker 处理几个条目后崩溃
+        crash = ["--crash-after", str(args.batch_size + args.batch_size // 2)] if i == 0 else []
+        procs.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker", "--root", root]
+                                      + common + crash))
+    codes = [p.wait() for p in procs]
+    elapsed = time.time() - t0
+
+    ok = True
+    try:
+        with open(os.path.join(root, "output.json"), encoding='utf-8') as f:
+            output = json.load(f)
+        with open(os.path.join(root, "queue", "merged.json"), encoding='utf-8') as f:
+            marker = json.load(f)
+    except OSError as e:
+        print(f"❌ 没有生成合并结果: {e}")
+        output, marker, ok = [], {}, False
+    expected = [f"item_{i:05d}" for i in range(args.items)]
+    got = [r["item"] for r in output]
+    if ok and got != expected:
+        missing = len(set(expected) - set(got))
+        print(f"❌ 合并结果不正确: {len(got)} 条，缺 {missing} 条，重复 {len(got) - len(set(got))} 条")
+        ok = False
+    print(f"进程退出码: {codes} (第一个 worker 预期为 17)")
+    if ok:
+        print(f"各 worker 完成批次: {marker['workers']}")
+        print(f"✅ {args.workers} 个 worker 在 {elapsed:.1f}s 内处理完 {args.items} 个条目，崩溃批次已回收，输出无缺无重")
+    shutil.rmtree(root, ignore_errors=True)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# 各工作区脚本共用的工具模块 (通过 sys.path 指向 scripts 目录后导入)
@@ -0,0 +1,105 @@
+# ==========================================
+# 🧮 批量检测 + 逐帧关联的追踪引擎
+# ==========================================
+# model.track(frame, persist=True) 每次只检测一帧，CPU 上吃不到 batch 的好处。
+# 这里把 N 帧一起送进 model.predict (一次前向)，再按帧顺序把每帧的检测结果交给
+# 与 model.track 相同的追踪器 (ultralytics 默认配置里的 tracker, conf 0.1) 做关联，
+# 关联逻辑与 ultralytics 的 on_predict_postprocess_end 一致: 每帧都调用 update，没有检测框的帧也一样
+# (空帧同样推进帧计数、让丢失的轨迹老化)，所以轨迹 ID 和轨迹寿命与逐帧 model.track 相同。
+# 新版 ultralytics 默认的 TrackTrack 要用 predictor 里 NMS 前的原始输出找回被压掉的框，批量检测复现不了，
+# 这类追踪器不支持批量，自动退回逐帧。
+# 注意: 同一个 YOLO 实例不要混用 model.track 和本引擎 —— track 注册的回调会挂在 predictor 上。
+# 默认仍逐帧检测；--batch-eval 在目标环境验证 same_id 为 100% 后再用 --batch / TRACK_BATCH 开启
+DETECT_BATCH = 1
+# --batch-eval 未指定 --batch 时用的批量大小
+EVAL_BATCH = 8
+# model.track 的置信度下限 (ByteTrack 类方法需要低分框参与二次关联)
+TRACK_CONF = 0.1
+TRACK_FRAME_RATE = 30
+
+
+def default_tracker_cfg():
+    """model.track 不传 tracker 时用的配置 (随 ultralytics 版本变化)"""
+    try:
+        from ultralytics.cfg import DEFAULT_CFG
+        return DEFAULT_CFG.tracker or "botsort.yaml"
+    except (ImportError, AttributeError):
+        return "botsort.yaml"
+
+
+def _load_tracker_cfg(name):
+    from ultralytics.utils import IterableSimpleNamespace
+    from ultralytics.utils.checks import check_yaml
+    try:
+        from ultralytics.utils import YAML
+        cfg = YAML.load(check_yaml(name))
+    except ImportError:
+        # 旧版 ultralytics
+        from ultralytics.utils import yaml_load
+        cfg = yaml_load(check_yaml(name))
+    return IterableSimpleNamespace(**cfg)
+
+
+class BatchTracker:
+    """
+    tracker = BatchTracker(model)
+    for ids, xywh, masks in tracker(frames):   # frames: 按时间顺序的一批 BGR 帧
+        ...     # ids (n,) int32, xywh (n, 4) 中心点格式像素坐标, masks 见 seg_masks.encode_masks
+    每个视频新建一个实例 (轨迹 ID 从 1 开始)。
+    """
+
+    def __init__(self, model, tracker_cfg=None, conf=TRACK_CONF, masks="none"):
+        from ultralytics.trackers.track import TRACKER_MAP
+        cfg = _load_tracker_cfg(tracker_cfg or default_tracker_cfg())
+        tracker_cls = TRACKER_MAP[cfg.tracker_type]
+        if hasattr(tracker_cls, "compute_frame_extras") or hasattr(tracker_cls, "setup_predictor"):
+            raise ValueError(f"{cfg.tracker_type} 需要 predictor 的 NMS 前原始输出，批量检测无法与 model.track 一致")
+        self.model = model
+        self.conf = conf
+        self.masks = masks
+        try:
+            self.tracker = tracker_cls(args=cfg, frame_rate=TRACK_FRAME_RATE)
+        except TypeError:
+            # 新版 ultralytics 去掉了 frame_rate 参数 (丢失容忍帧数直接取 track_buffer，等同于 30fps)
+            self.tracker = tracker_cls(args=cfg)
+        # 轨迹 ID 计数器是全局的，换视频时与 _reset_tracker 一样清零
+        self.tracker.reset()
+
+    def __call__(self, frames):
+        import numpy as np
+        from common.seg_masks import encode_masks
+        empty = (np.zeros(0, dtype=np.int32), np.zeros((0, 4), dtype=np.float32),
+                 None if self.masks == "none" else [])
+        if not frames:
+            return []
+        # RLE 需要原分辨率 (解码帧) 的掩码；多边形由 ultralytics 从低分辨率掩码的轮廓缩放得到
+        results = self.model.predict(list(frames), conf=self.conf, verbose=False,
+                                     retina_masks=self.masks == "rle")
+        out = []
+        for r in results:
+            det = r.boxes.cpu().numpy()
+            # tracks: x1, y1, x2, y2, track_id, score, cls, 检测下标 (最后一列)
+            tracks = self.tracker.update(det, r.orig_img)
+            if len(tracks) == 0:
+                out.append(empty)
+                continue
+            x1, y1, x2, y2 = tracks[:, 0], tracks[:, 1], tracks[:, 2], tracks[:, 3]
+            xywh = np.stack([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], axis=1).astype(np.float32)
+            masks = encode_masks(r, self.masks, tracks[:, -1].astype(np.int64))
+            out.append((tracks[:, 4].astype(np.int32), xywh, masks))
+        return out
+
+
+def track_single(model, frames, masks="none"):
+    """逐帧 model.track (batch=1 时的原有行为)，返回格式同 BatchTracker"""
+    import numpy as np
+    from common.seg_masks import encode_masks
+    out = []
+    for frame in frames:
+        r = model.track(frame, persist=True, verbose=False, retina_masks=masks == "rle")[0]
+        if r.boxes and r.boxes.id is not None:
+            out.append((r.boxes.id.int().cpu().numpy(), r.boxes.xywh.cpu().numpy(), encode_masks(r, masks)))
+        else:
+            out.append((np.zeros(0, dtype=np.int32), np.zeros((0, 4), dtype=np.float32),
+                        None if masks == "none" else []))
+    return out
@@ -0,0 +1,202 @@
+import unicodedata
+
+# ==========================================
+# 📏 离线评估指标: 检测 mAP / P / R (向量化 IoU 匹配)，转写 WER / CER
+# ==========================================
+# COCO 的 10 个 IoU 阈值 0.50:0.05:0.95
+IOU_THRESHOLDS = tuple(round(0.5 + 0.05 * i, 2) for i in range(10))
+# AP 插值的召回率采样点 (COCO 101 点)
+RECALL_POINTS = 101
+
+
+def pair_iou(a, b):
+    """逐行计算左上角 (x, y, w, h) 框的 IoU，a/b 形状均为 (n, 4)"""
+    import numpy as np
+    ix = np.clip(np.minimum(a[:, 0] + a[:, 2], b[:, 0] + b[:, 2]) - np.maximum(a[:, 0], b[:, 0]), 0, None)
+    iy = np.clip(np.minimum(a[:, 1] + a[:, 3], b[:, 1] + b[:, 3]) - np.maximum(a[:, 1], b[:, 1]), 0, None)
+    inter = ix * iy
+    union = a[:, 2] * a[:, 3] + b[:, 2] * b[:, 3] - inter
+    return inter / np.maximum(union, 1e-12)
+
+
+def _ranges(starts, lengths):
+    """把若干 [start, start+len) 区间展开成一个下标数组"""
+    import numpy as np
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + np.arange(total) - offsets
+
+
+def match_detections(gt_group, gt_box, pr_group, pr_score, pr_box, thresholds=IOU_THRESHOLDS):
+    """
+    与 COCO 相同的贪心匹配: 同一分组 (图片 x 类别) 内按分数从高到低，
+    每个预测取 IoU 最高且未被占用的真值框。返回 tp (n_pred, n_thr) 布尔矩阵 (按输入顺序)。
+    所有分组同时推进: 第 k 轮处理每个分组里排名第 k 的预测，轮数只取决于单组最大预测数，
+    所有候选 (预测, 真值) 对的 IoU 一次算完。
+    """
+    import numpy as np
+    thr = np.asarray(thresholds, dtype=np.float64)
+    n_pr, n_gt, n_thr = len(pr_group), len(gt_group), len(thr)
+    tp = np.zeros((n_pr, n_thr), dtype=bool)
+    if n_pr == 0 or n_gt == 0:
+        return tp
+
+    # 真值按分组排序，记录每组的起点和数量
+    g_order = np.argsort(gt_group, kind="stable")
+    g_sorted = gt_group[g_order]
+    groups, g_start, g_count = np.unique(g_sorted, return_index=True, return_counts=True)
+    # 预测按 (分组, -分数) 排序，并算出组内排名
+    p_order = np.lexsort((-pr_score, pr_group))
+    p_group = pr_group[p_order]
+    pos = np.searchsorted(groups, p_group)
+    has_gt = (pos < len(groups)) & (groups[np.minimum(pos, len(groups) - 1)] == p_group)
+    first = np.concatenate(([True], p_group[1:] != p_group[:-1]))
+    run_start = np.maximum.accumulate(np.where(first, np.arange(n_pr), 0))
+    rank = np.arange(n_pr) - run_start
+
+    # 展开所有候选对: 每个预测 x 同组全部真值
+    n_cand = np.where(has_gt, g_count[np.minimum(pos, len(groups) - 1)], 0)
+    cand_start = np.cumsum(n_cand) - n_cand
+    pair_pred = np.repeat(np.arange(n_pr), n_cand)
+    pair_gt = g_order[_ranges(np.where(has_gt, g_start[np.minimum(pos, len(groups) - 1)], 0), n_cand)]
+    pair_iou_all = pair_iou(pr_box[p_order][pair_pred], gt_box[pair_gt])
+
+    taken = np.zeros((n_gt, n_thr), dtype=bool)
+    tp_sorted = np.zeros((n_pr, n_thr), dtype=bool)
+    by_rank = np.argsort(rank, kind="stable")
+    rank_sorted = rank[by_rank]
+    bounds = np.searchsorted(rank_sorted, np.arange(rank.max() + 2))
+    for k in range(rank.max() + 1):
+        preds = by_rank[bounds[k]:bounds[k + 1]]
+        preds = preds[n_cand[preds] > 0]
+        if not len(preds): continue
+        rows = _ranges(cand_start[preds], n_cand[preds])
+        seg = np.cumsum(n_cand[preds]) - n_cand[preds]
+        gts = pair_gt[rows]
+        # (行, 阈值): 已被占用或低于阈值的候选记为 -1
+        score = np.where((pair_iou_all[rows][:, None] >= thr) & ~taken[gts], pair_iou_all[rows][:, None], -1.0)
+        best = np.maximum.reduceat(score, seg, axis=0)
+        # 每段里第一个达到最大值的行
+        hit = (score == np.repeat(best, n_cand[preds], axis=0)) & (score >= 0)
+        idx = np.where(hit, np.arange(len(rows))[:, None], len(rows))
+        first_hit = np.minimum.reduceat(idx, seg, axis=0)
+        matched = first_hit < len(rows)
+        p_idx, t_idx = np.nonzero(matched)
+        taken[gts[first_hit[p_idx, t_idx]], t_idx] = True
+        tp_sorted[preds[p_idx], t_idx] = True
+
+    tp[p_order] = tp_sorted
+    return tp
+
+
+def average_precision(tp, scores, n_gt):
+    """tp: (n, n_thr)，按 scores 降序累计得到 PR 曲线，返回每个阈值的 AP (COCO 101 点插值)"""
+    import numpy as np
+    n_thr = tp.shape[1]
+    if n_gt == 0 or len(scores) == 0:
+        return np.zeros(n_thr)
+    order = np.argsort(-scores, kind="stable")
+    ctp = np.cumsum(tp[order], axis=0)
+    cfp = np.cumsum(~tp[order], axis=0)
+    recall = ctp / n_gt
+    precision = ctp / np.maximum(ctp + cfp, 1)
+    # 精度包络: 从右往左取最大值
+    precision = np.maximum.accumulate(precision[::-1], axis=0)[::-1]
+    points = np.linspace(0, 1, RECALL_POINTS)
+    ap = np.zeros(n_thr)
+    for t in range(n_thr):
+        idx = np.searchsorted(recall[:, t], points, side="left")
+        valid = idx < len(recall)
+        ap[t] = precision[idx[valid], t].sum() / RECALL_POINTS
+    return ap
+
+
+def evaluate_boxes(gt, pred, conf=0.25, thresholds=IOU_THRESHOLDS):
+    """
+    gt / pred: dict，数组字段 image (int)、cls (int)、box (n,4 左上角 xywh)，pred 另有 score。
+    返回 {"classes": {cls: {...}}, "mAP50": .., "mAP50_95": .., "precision": .., "recall": ..}；
+    precision / recall 只统计分数 >= conf 的预测在 IoU 0.5 下的结果。
+    """
+    import numpy as np
+    n_img = int(max(gt["image"].max(initial=-1), pred["image"].max(initial=-1))) + 1
+    gt_group = gt["cls"].astype(np.int64) * n_img + gt["image"]
+    pr_group = pred["cls"].astype(np.int64) * n_img + pred["image"]
+    tp = match_detections(gt_group, gt["box"], pr_group, pred["score"], pred["box"], thresholds)
+    i50 = list(thresholds).index(0.5) if 0.5 in thresholds else 0
+
+    classes = {}
+    for c in np.union1d(np.unique(gt["cls"]), np.unique(pred["cls"])).tolist():
+        sel = pred["cls"] == c
+        n_gt = int((gt["cls"] == c).sum())
+        ap = average_precision(tp[sel], pred["score"][sel], n_gt)
+        keep = pred["score"][sel] >= conf
+        n_tp = int(tp[sel][keep, i50].sum())
+        classes[c] = {"gt": n_gt, "pred": int(keep.sum()), "tp": n_tp,
+                      "precision": n_tp / max(int(keep.sum()), 1), "recall": n_tp / max(n_gt, 1),
+                      "AP50": float(ap[i50]), "AP50_95": float(ap.mean())}
+    scored = [v for v in classes.values() if v["gt"] > 0]
+    keep = pred["score"] >= conf
+    n_tp = int(tp[keep, i50].sum())
+    return {
+        "classes": classes,
+        "mAP50": float(np.mean([v["AP50"] for v in scored])) if scored else 0.0,
+        "mAP50_95": float(np.mean([v["AP50_95"] for v in scored])) if scored else 0.0,
+        "precision": n_tp / max(int(keep.sum()), 1),
+        "recall": n_tp / max(len(gt["cls"]), 1),
+    }
+
+
+# ---------------- 转写 ----------------
+
+def edit_distance(a, b):
+    """
+    Levenshtein 距离 (a/b 为字符串或 token 列表)。
+    逐行 DP，行内用 "插入" 的前缀最小值公式 cur[j] = j + cummin(base[k] - k) 一次向量化完成。
+    """
+    import numpy as np
+    if len(a) < len(b):
+        a, b = b, a
+    if not b:
+        return len(a)
+    vocab = {}
+    av = np.array([vocab.setdefault(x, len(vocab)) for x in a])
+    bv = np.array([vocab.setdefault(x, len(vocab)) for x in b])
+    idx = np.arange(len(b) + 1)
+    prev = idx.copy()
+    for i in range(1, len(av) + 1):
+        base = np.empty_like(prev)
+        base[0] = i
+        # 删除 / 替换
+        base[1:] = np.minimum(prev[1:] + 1, prev[:-1] + (bv != av[i - 1]))
+        # 插入: cur[j] = min_k<=j (base[k] + j - k)
+        prev = np.minimum.accumulate(base - idx) + idx
+    return int(prev[-1])
+
+
+def normalize_text(text):
+    """去掉标点和空白、统一大小写和全半角，用于 CER"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return "".join(ch for ch in text if not unicodedata.category(ch).startswith(("P", "Z", "C")))
+
+
+def _words(text):
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return "".join(" " if unicodedata.category(ch).startswith("P") else ch for ch in text).split()
+
+
+def error_rates(refs, hyps):
+    """按语料整体累计 (编辑距离之和 / 参考长度之和)，返回 {"wer", "cer", "sentence_acc", ...}"""
+    char_err = char_len = word_err = word_len = exact = 0
+    for ref, hyp in zip(refs, hyps):
+        r, h = normalize_text(ref), normalize_text(hyp)
+        char_err += edit_distance(r, h)
+        char_len += len(r)
+        rw, hw = _words(ref), _words(hyp)
+        word_err += edit_distance(rw, hw)
+        word_len += len(rw)
+        exact += r == h
+    n = max(len(refs), 1)
+    return {"cer": char_err / max(char_len, 1), "wer": word_err / max(word_len, 1), "sentence_acc": exact / n,
+            "chars": char_len, "words": word_len, "utterances": len(refs)}
@@ -0,0 +1,189 @@
+import os
+import glob
+import json
+import time
+import hashlib
+
+# ==========================================
+# 🔁 增量训练: 热启动 + 时间预算 + 早停 + 新样本过采样
+# ==========================================
+# 每次重训不再从 yolov8n.pt 跑满 epoch:
+#   1. 从当前最佳权重 (outputs/my_best_model.pt 或最新的 best.pt) 热启动，SGD 小学习率、不做 warmup
+#   2. --time-budget 分钟数到点即停 (ultralytics 的 time 参数)，验证集 fitness 连续 --patience 轮不涨也停
+#   3. 上次训练之后新增 / 改过标注的样本在 train 里多放几份硬链接 (过采样)
+# 每次训练 (全量或增量) 的 mAP 曲线记在 outputs/train_state/<名称>_history.json，
+# 增量训练结束时对照最近一次全量训练，算出两者达到相同 mAP 各用了多久 / 节省多少。
+DATA_ROOT = os.getenv('DATA_ROOT', '/data')
+JOBS_ROOT = os.getenv('JOBS_ROOT', os.path.join(DATA_ROOT, "jobs"))
+STATE_DIR = os.path.join(DATA_ROOT, "outputs", "train_state")
+# 新样本在 train 中的总份数 (含原图)
+NEW_SAMPLE_REPEAT = 3
+# 增量训练默认的 epoch 上限 / 早停轮数 / 优化器和初始学习率 (全量 SGD 为 0.01)
+# 必须显式指定优化器: ultralytics 默认 optimizer='auto' 会忽略 lr0，按迭代数自己选 AdamW / SGD 和学习率
+INCREMENTAL_EPOCHS = 30
+INCREMENTAL_PATIENCE = 5
+INCREMENTAL_OPTIMIZER = "SGD"
+INCREMENTAL_LR0 = 0.002
+MAP_KEY = "metrics/mAP50-95(B)"
+
+
+def add_cli_args(parser):
+    parser.add_argument("--incremental", action="store_true",
+                        help="从当前最佳权重热启动，只针对新样本做短训练")
+    parser.add_argument("--time-budget", type=float, default=0,
+                        help="训练时间上限 (分钟)，0 表示不限；设置后 ultralytics 在首轮结束时按耗时重算 epoch 数，"
+                             "--epochs 不再生效")
+    parser.add_argument("--patience", type=int, help=f"验证集不提升多少轮后早停 (增量默认 {INCREMENTAL_PATIENCE})")
+    parser.add_argument("--epochs", type=int,
+                        help=f"epoch 数 (增量默认 {INCREMENTAL_EPOCHS})；与 --time-budget 同时使用时以时间预算为准")
+    parser.add_argument("--new-repeat", type=int, default=NEW_SAMPLE_REPEAT,
+                        help="增量模式下新样本在 train 中的份数")
+
+
+def forward_args(args):
+    """把增量训练参数原样拼成命令行 (auto_yolo_manager -> train.py)"""
+    out = []
+    if args.incremental: out.append("--incremental")
+    if args.time_budget: out += ["--time-budget", str(args.time_budget)]
+    if args.patience is not None: out += ["--patience", str(args.patience)]
+    if args.epochs is not None: out += ["--epochs", str(args.epochs)]
+    return " ".join(out)
+
+
+def train_kwargs(args, full_epochs):
+    """model.train() 的 epoch / 早停 / 时间预算 / 学习率参数"""
+    kwargs = {"epochs": args.epochs or (INCREMENTAL_EPOCHS if args.incremental else full_epochs)}
+    if args.patience is not None:
+        kwargs["patience"] = args.patience
+    elif args.incremental:
+        kwargs["patience"] = INCREMENTAL_PATIENCE
+    if args.time_budget:
+        # ultralytics 的 time 以小时为单位，首轮结束后按首轮耗时把 epochs 改写成预算内能跑完的轮数 (会覆盖上面的 epochs)，到点即停
+        kwargs["time"] = args.time_budget / 60
+    if args.incremental:
+        # 已收敛的权重: 小学习率、跳过 warmup，避免前几轮把已学到的特征冲掉 (lr0 只有显式指定优化器时才生效)
+        kwargs.update({"optimizer": INCREMENTAL_OPTIMIZER, "lr0": INCREMENTAL_LR0, "warmup_epochs": 0})
+    return kwargs
+
+
+def find_warm_start(patterns):
+    """所有 glob 匹配到的权重中最新的一个 (手动放入的 my_best_model.pt 或上一次训练的 best.pt)"""
+    found = {p for pattern in patterns for p in glob.glob(pattern)}
+    return max(found, key=os.path.getmtime) if found else None
+
+
+# ---------------- 新样本 ----------------
+
+def label_digest(yolo_lines):
+    return hashlib.sha1("\n".join(yolo_lines).encode()).hexdigest()[:12]
+
+
+def _samples_path(name):
+    return os.path.join(STATE_DIR, f"{name}_samples.json")
+
+
+def load_trained_samples(name):
+    """上次成功训练时的样本 {文件名: 标签摘要}"""
+    try:
+        with open(_samples_path(name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_trained_samples(name, samples):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    tmp = _samples_path(name) + f".tmp.{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(samples, f, ensure_ascii=False)
+    os.replace(tmp, _samples_path(name))
+
+
+def new_samples(name, samples):
+    """samples: {文件名: 标签摘要}，返回新增或标注有变化的文件名"""
+    trained = load_trained_samples(name)
+    return [fname for fname, digest in samples.items() if trained.get(fname) != digest]
+
+
+def write_pending(path, samples, new):
+    """数据集构建脚本写出本次的样本清单，训练成功后训练脚本再用 save_trained_samples 记下"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"samples": samples, "new": new}, f, ensure_ascii=False)
+
+
+def read_pending(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"samples": {}, "new": []}
+
+
+# ---------------- mAP 曲线与节省时间 ----------------
+
+def attach_map_curve(model):
+    """注册回调记录每轮验证后的 (累计秒数, mAP50-95)，返回该列表"""
+    curve = []
+    state = {}
+
+    def _start(trainer):
+        state['t0'] = time.time()
+
+    def _fit_end(trainer):
+        value = (getattr(trainer, "metrics", None) or {}).get(MAP_KEY)
+        if value is not None and 't0' in state:
+            curve.append((round(time.time() - state['t0'], 1), round(float(value), 4)))
+
+    model.add_callback("on_train_start", _start)
+    model.add_callback("on_fit_epoch_end", _fit_end)
+    return curve
+
+
+def _history_path(name):
+    return os.path.join(STATE_DIR, f"{name}_history.json")
+
+
+def load_history(name):
+    try:
+        with open(_history_path(name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def time_to_reach(curve, target):
+    """曲线首次达到 target mAP 的累计秒数，从未达到时返回 None"""
+    for seconds, value in curve:
+        if value >= target:
+            return seconds
+    return None
+
+
+def record_run(name, mode, curve, seconds, weights=None, samples=0, new=0):
+    """追加一条训练记录；增量训练时对照最近一次全量训练计算节省的时间"""
+    best = max((v for _, v in curve), default=0.0)
+    entry = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "mode": mode, "seconds": round(seconds, 1),
+             "epochs": len(curve), "best_map50_95": best, "weights": weights,
+             "samples": samples, "new_samples": new, "curve": curve}
+    history = load_history(name)
+    full = [h for h in history if h["mode"] == "full" and h.get("curve")]
+    if mode == "incremental" and full and curve:
+        ref = full[-1]
+        # 相同 mAP: 取两次训练中较低的最好成绩，分别看各自曲线第一次达到它用了多久
+        target = min(best, ref["best_map50_95"])
+        inc_s = time_to_reach(curve, target)
+        full_s = time_to_reach(ref["curve"], target)
+        entry["baseline"] = {"time": ref["time"], "target_map50_95": target, "incremental_seconds": inc_s,
+                             "full_seconds": full_s, "saved_seconds": round(full_s - inc_s, 1)}
+        print(f"⏱️  达到 mAP50-95 {target:.3f}: 增量 {inc_s / 60:.1f} 分钟，全量 ({ref['time']}) {full_s / 60:.1f} 分钟 "
+              f"-> 节省 {(full_s - inc_s) / 60:.1f} 分钟 (全量最好 {ref['best_map50_95']:.3f}，本次 {best:.3f})")
+    elif mode == "incremental":
+        print("ℹ️  还没有全量训练记录，无法计算节省的时间 (不加 --incremental 跑一次全量作为基线)")
+    history.append(entry)
+    os.makedirs(STATE_DIR, exist_ok=True)
+    tmp = _history_path(name) + f".tmp.{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, _history_path(name))
+    print(f"📄 训练记录: {_history_path(name)}")
+    return entry
@@ -0,0 +1,116 @@
+import os
+import json
+import codecs
+
+# 下载分块大小 (字节)
+CHUNK_SIZE = 1024 * 1024
+
+
+def iter_json_array(chunks):
+    """增量解析 JSON 数组字节流，逐个产出顶层元素 (内存只保留当前任务)"""
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    started = False
+    retry_at = 0  # 解析失败后，等缓冲翻倍再重试，避免大任务被反复解析
+
+    def _skip(text, i):
+        while i < len(text) and text[i] in " \t\r\n,":
+            i += 1
+        return i
+
+    for chunk in chunks:
+        buf += utf8.decode(chunk)
+        if len(buf) < retry_at:
+            continue
+        pos = 0
+        while True:
+            pos = _skip(buf, pos)
+            if not started:
+                if pos >= len(buf): break
+                if buf[pos] != '[':
+                    raise ValueError("导出内容不是 JSON 数组")
+                started = True
+                pos += 1
+                continue
+            if pos >= len(buf) or buf[pos] == ']': break
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break
+            # 末尾元素可能被分块截断 (例如数字)，留到下一块再确认
+            if end >= len(buf): break
+            yield obj
+            pos = end
+        buf = buf[pos:]
+        retry_at = 2 * len(buf)
+
+    buf += utf8.decode(b"", final=True)
+    pos = _skip(buf, 0)
+    if not started:
+        if pos < len(buf) and buf[pos] == '[':
+            started, pos = True, pos + 1
+        else:
+            return
+    while True:
+        pos = _skip(buf, pos)
+        if pos >= len(buf) or buf[pos] == ']': return
+        obj, pos = decoder.raw_decode(buf, pos)
+        yield obj
+
+
+def _iter_file_chunks(path):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk: return
+            yield chunk
+
+
+def _iter_export_chunks(client, project_id):
+    exports = client.projects.exports
+    if hasattr(exports, 'download_sync'):
+        # 社区版直接流式下载，不经过 as_json 的整包缓存
+        yield from exports.download_sync(
+            project_id, export_type="JSON", download_all_tasks=True,
+            request_options={'chunk_size': CHUNK_SIZE}
+        )
+    else:
+        # 旧版 SDK 兜底：只能整包拿到，再逐条写出
+        tasks = exports.as_json(project_id)
+        yield b"["
+        for i, task in enumerate(tasks):
+            yield (b"," if i else b"") + json.dumps(task, ensure_ascii=False).encode('utf-8')
+        yield b"]"
+
+
+def export_tasks_jsonl(client, project_id, jsonl_path):
+    """把 Label Studio 导出流式写成紧凑 JSONL (每行一个任务)，返回任务数"""
+    tmp_path = jsonl_path + ".part"
+    count = 0
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for task in iter_json_array(_iter_export_chunks(client, project_id)):
+            f.write(json.dumps(task, ensure_ascii=False, separators=(',', ':')))
+            f.write("\n")
+            count += 1
+    os.replace(tmp_path, jsonl_path)
+    return count
+
+
+def iter_tasks(path):
+    """逐条读取导出任务；兼容 JSONL 和旧的 JSON 数组文件"""
+    if path.endswith('.jsonl'):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line: yield json.loads(line)
+    else:
+        yield from iter_json_array(_iter_file_chunks(path))
+
+
+def resolve_export_path(base):
+    """优先使用 JSONL 导出，找不到时回退到旧的 project_export.json"""
+    stem = os.path.splitext(base)[0]
+    for candidate in (stem + ".jsonl", stem + ".json"):
+        if os.path.exists(candidate): return candidate
+    return None
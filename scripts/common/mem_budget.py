@@ -0,0 +1,284 @@
+import os
+import gc
+import math
+
+from common import metrics
+
+# ==========================================
+# 🧮 按内存预算选 batch (YOLO / Whisper 的推理和训练共用)
+# ==========================================
+#   budget = parse_budget(args.memory_budget, device)    # "6" (GB) / "auto" (当前可用内存或显存) / None (不启用)
+#   batch = fit_batch(budget, device, lambda: yolo_predict_probe(model), "YOLO 推理")
+#                                                         # 探测函数返回 (run, extra): run(b) 用 b 个样本跑一次前向 (训练含反向)
+#   results, batch = map_batches(fn, items, batch, device) # 分块处理，分配失败时 batch 减半重试
+# 探测: 分别用 1 个和 PROBE_ITEMS 个样本各跑一次，记录峰值 (GPU: max_memory_allocated，CPU: 进程 VmHWM)，
+# 线性拟合出 "固定开销 + 每样本开销"，取 当前占用 + 固定开销 + extra + b x 每样本 <= 预算 x SAFETY 的最大 b。
+# 预算通过环境变量 MEMORY_BUDGET 传给管理脚本拉起的训练子进程。
+SAFETY = 0.85
+PROBE_ITEMS = 4
+MAX_BATCH = 64
+BUDGET_ENV = "MEMORY_BUDGET"
+
+# 各框架 / 运行时内存不足时的报错片段 (PyTorch CUDA / CPU、cuBLAS、ONNX Runtime、DataLoader worker 被 OOM killer 杀掉)
+_OOM_MESSAGES = ("out of memory", "can't allocate memory", "CUBLAS_STATUS_ALLOC_FAILED",
+                 "Failed to allocate memory", "bad allocation", "killed by signal: Killed")
+
+
+def add_cli_args(parser):
+    parser.add_argument("--memory-budget", default=os.getenv(BUDGET_ENV),
+                        help="内存 / 显存预算 (GB)，或 auto 按当前可用量；按模型实测的每样本开销选最大 batch (默认沿用固定 batch)")
+
+
+def export_budget(value):
+    """管理脚本把预算交给 os.system 拉起的训练子进程"""
+    if value:
+        os.environ[BUDGET_ENV] = str(value)
+
+
+def is_cuda(device):
+    if str(device) == "cpu":
+        return False
+    try:
+        import torch
+    except ImportError:
+        return False
+    return torch.cuda.is_available()
+
+
+def _meminfo(key):
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith(key + ":"):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+def _cgroup_limit():
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+    return None
+
+
+def _rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def parse_budget(value, device="cpu"):
+    """预算 (字节)；None / 空 / 0 表示不启用"""
+    if not value or str(value) == "0":
+        return None
+    if str(value).lower() != "auto":
+        return int(float(value) * 2**30)
+    if is_cuda(device):
+        import torch
+        free, _ = torch.cuda.mem_get_info()
+        return free + torch.cuda.memory_allocated()
+    # 容器里 MemAvailable 看到的是宿主机，再用 cgroup 上限卡一下
+    available = (_meminfo("MemAvailable") or 0) + _rss()
+    limit = _cgroup_limit()
+    return min(available, limit) if limit else available
+
+
+def is_oom(exc):
+    if isinstance(exc, MemoryError):
+        return True
+    try:
+        import torch
+        if isinstance(exc, torch.cuda.OutOfMemoryError):
+            return True
+    except (ImportError, AttributeError):
+        pass
+    return any(m in str(exc) for m in _OOM_MESSAGES)
+
+
+def release(device):
+    gc.collect()
+    if is_cuda(device):
+        import torch
+        torch.cuda.empty_cache()
+
+
+def _reset_peak(device):
+    """清零峰值计数，返回当前占用"""
+    release(device)
+    if is_cuda(device):
+        import torch
+        torch.cuda.reset_peak_memory_stats()
+        return torch.cuda.memory_allocated()
+    try:
+        # 写 5 清零 VmHWM (Linux 4.0+)；不支持时峰值只增不减，拟合偏保守
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+    return _rss()
+
+
+def _peak(device):
+    if is_cuda(device):
+        import torch
+        return torch.cuda.max_memory_allocated()
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    return _rss()
+
+
+def probe(run, device, items=PROBE_ITEMS):
+    """返回 (当前占用, 固定开销, 每样本开销) 字节；run(b) 跑一次 b 个样本"""
+    peaks = {}
+    current = None
+    for b in (1, items):
+        base = _reset_peak(device)
+        current = base if current is None else min(current, base)
+        run(b)
+        peaks[b] = max(_peak(device) - base, 0)
+    release(device)
+    per_item = (peaks[items] - peaks[1]) / (items - 1)
+    if per_item <= 0:
+        # 分配器复用了上一次的内存，增量测不出来: 按整体均摊 (偏大，安全)
+        per_item = peaks[items] / items
+    fixed = max(peaks[1] - per_item, 0)
+    return current, fixed, per_item
+
+
+def fit_batch(budget, device, make_probe, name, default=1, max_batch=MAX_BATCH):
+    """
+    budget 为 None 时直接返回 default (不做探测)。
+    make_probe() 返回 (run, extra)，extra 是探测里没有覆盖的固定开销 (例如优化器状态)；探测完即释放。
+    """
+    if not budget:
+        return default
+    try:
+        run, extra = make_probe()
+        current, fixed, per_item = probe(run, device)
+        del run
+        release(device)
+    except Exception as e:
+        release(device)
+        if is_oom(e):
+            print(f"⚠️ {name}: 探测 {PROBE_ITEMS} 个样本时内存已不足，batch=1")
+            return 1
+        print(f"⚠️ {name}: 内存探测失败，沿用默认 batch={default}: {e}")
+        return default
+    room = budget * SAFETY - current - fixed - extra
+    batch = int(min(max(room // max(per_item, 1), 1), max_batch))
+    where = "显存" if is_cuda(device) else "内存"
+    print(f"🧮 {name}: {where}预算 {budget / 2**30:.1f}GB，已用 {current / 2**30:.2f}GB，"
+          f"固定开销 {(fixed + extra) / 2**20:.0f}MB，每样本 {per_item / 2**20:.0f}MB -> batch={batch}")
+    metrics.gauge(f"batch_{name}", batch)
+    return batch
+
+
+def halve(batch, device, name, exc):
+    """分配失败后的下一个 batch；已经是 1 时原样抛出"""
+    if not is_oom(exc) or batch <= 1:
+        raise exc
+    release(device)
+    batch = max(batch // 2, 1)
+    metrics.count("oom_retries")
+    print(f"⚠️ {name}: 内存不足 ({str(exc).splitlines()[0][:80]})，batch 减半为 {batch} 重试")
+    return batch
+
+
+def map_batches(fn, items, batch, device="cpu", name="batch"):
+    """按 batch 分块调用 fn(chunk) (返回与 chunk 等长的列表) 并拼接；分配失败时同一块减半重试"""
+    out = []
+    i = 0
+    while i < len(items):
+        chunk = items[i:i + batch]
+        try:
+            out.extend(fn(chunk))
+        except Exception as e:
+            batch = halve(batch, device, name, e)
+            continue
+        i += len(chunk)
+    return out, batch
+
+
+def retry_batches(fn, batch, device="cpu", name="train"):
+    """fn(batch) 整体重跑 (训练)，分配失败时 batch 减半重来；返回 (结果, 最终 batch)"""
+    while True:
+        try:
+            return fn(batch), batch
+        except Exception as e:
+            batch = halve(batch, device, name, e)
+
+
+def param_bytes(module):
+    return sum(p.numel() * p.element_size() for p in module.parameters())
+
+
+def grad_accum(batch, target):
+    """batch 小于原来的固定值时用梯度累积补足有效 batch"""
+    return max(1, math.ceil(target / batch))
+
+
+# ---------------- 各模型的探测函数 ----------------
+
+def yolo_predict_probe(model, imgsz=640):
+    """YOLO 推理: 一次 predict b 张 imgsz 的图"""
+    import numpy as np
+    img = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    return lambda b: model.predict([img] * b, batch=b, imgsz=imgsz, verbose=False), 0
+
+
+def yolo_train_probe(model, imgsz, device):
+    """YOLO 训练: 模型副本在 b 张图上做一次前向 + 反向 (不碰原模型的梯度)"""
+    import copy
+    import torch
+    net = copy.deepcopy(model.model).float().to("cuda" if is_cuda(device) else "cpu").train()
+    for p in net.parameters():
+        p.requires_grad_(True)
+    dev = next(net.parameters()).device
+
+    def run(b):
+        out = net(torch.zeros(b, 3, imgsz, imgsz, device=dev))
+        outs = out if isinstance(out, (list, tuple)) else [out]
+        sum(o.float().sum() for o in outs if torch.is_tensor(o)).backward()
+        net.zero_grad(set_to_none=True)
+
+    # AdamW 的两份动量 (SGD 只有一份，按大的算)
+    return run, 2 * param_bytes(net)
+
+
+def whisper_generate_probe(whisper, tokens=128):
+    """Whisper 推理: b 段 30 秒音频过编码器，解码器一次前向 tokens 步 (约等于生成同样长度时的缓存占用)"""
+    import torch
+    model, _, device = whisper
+    n_mels = getattr(model.config, "num_mel_bins", 80)
+    start = model.config.decoder_start_token_id
+
+    def run(b):
+        with torch.no_grad():
+            model(input_features=torch.zeros(b, n_mels, 3000, device=device),
+                  decoder_input_ids=torch.full((b, tokens), start, dtype=torch.long, device=device))
+    return run, 0
+
+
+def whisper_train_probe(model, device, tokens=64):
+    """Whisper 训练: 模型副本在 b 段 30 秒音频 + tokens 长的标签上做一次前向 + 反向 (不碰原模型的设备 / 梯度)"""
+    import copy
+    import torch
+    n_mels = getattr(model.config, "num_mel_bins", 80)
+    dev = "cuda" if is_cuda(device) else "cpu"
+    net = copy.deepcopy(model).to(dev).train()
+
+    def run(b):
+        out = net(input_features=torch.zeros(b, n_mels, 3000, device=dev),
+                  labels=torch.zeros(b, tokens, dtype=torch.long, device=dev))
+        out.loss.backward()
+        net.zero_grad(set_to_none=True)
+
+    return run, 2 * param_bytes(net)
@@ -0,0 +1,286 @@
+import os
+import sys
+import json
+import time
+import random
+import atexit
+import threading
+import resource
+from contextlib import contextmanager
+
+# ==========================================
+# 📈 轻量埋点: 命名 span / 计数器 / gauge，退出时写 JSON 摘要 + Prometheus 文本
+# ==========================================
+#   from common import metrics
+#   metrics.setup("yolo_to_ls", args)        # args 来自 metrics.add_cli_args(parser)
+#   with metrics.span("predict"): ...
+#   metrics.count("images")
+#   metrics.gauge("decode_queue", q.qsize())
+#   metrics.step()                           # 主循环每处理一个条目调用一次 (--profile 采样窗口)
+DATA_ROOT = os.getenv('DATA_ROOT', '/data')
+METRICS_DIR = os.getenv('METRICS_DIR') or os.path.join(DATA_ROOT, "outputs", "metrics")
+# Prometheus 直方图桶 (秒)
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 每个 span 保留的样本数上限 (蓄水池抽样，用于分位数)
+RESERVOIR = 4096
+# --profile 时跳过的预热条目数
+PROFILE_WARMUP = 5
+
+_lock = threading.Lock()
+_state = {"entry": None, "started": time.time(), "spans": {}, "counters": {}, "gauges": {},
+          "profile": None, "server": None}
+
+
+class _Span:
+    __slots__ = ("count", "total", "min", "max", "buckets", "samples")
+
+    def __init__(self):
+        self.count, self.total, self.min, self.max = 0, 0.0, float("inf"), 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.samples = []
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        for i, le in enumerate(BUCKETS):
+            if seconds <= le:
+                self.buckets[i] += 1
+                break
+        if len(self.samples) < RESERVOIR:
+            self.samples.append(seconds)
+        else:
+            k = random.randrange(self.count)
+            if k < RESERVOIR:
+                self.samples[k] = seconds
+
+
+def observe(name, seconds):
+    with _lock:
+        sp = _state["spans"].get(name)
+        if sp is None:
+            sp = _state["spans"][name] = _Span()
+        sp.add(seconds)
+
+
+@contextmanager
+def span(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0)
+
+
+def timed(name):
+    """装饰器版本的 span"""
+    def _wrap(fn):
+        def _inner(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return _inner
+    return _wrap
+
+
+def count(name, n=1):
+    with _lock:
+        _state["counters"][name] = _state["counters"].get(name, 0) + n
+
+
+def gauge(name, value):
+    """记录瞬时值 (队列深度等)，摘要里保留最后值和最大值"""
+    with _lock:
+        g = _state["gauges"].get(name)
+        if g is None:
+            _state["gauges"][name] = {"last": value, "max": value}
+        else:
+            g["last"] = value
+            g["max"] = max(g["max"], value)
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def _quantile(sorted_vals, q):
+    if not sorted_vals:
+        return None
+    return sorted_vals[min(int(q * len(sorted_vals)), len(sorted_vals) - 1)]
+
+
+def summary():
+    with _lock:
+        wall = time.time() - _state["started"]
+        spans = {}
+        for name, sp in _state["spans"].items():
+            vals = sorted(sp.samples)
+            spans[name] = {
+                "count": sp.count, "total_s": sp.total, "share": sp.total / wall if wall > 0 else 0.0,
+                "mean_ms": sp.total / sp.count * 1000, "min_ms": sp.min * 1000, "max_ms": sp.max * 1000,
+                "p50_ms": _quantile(vals, 0.5) * 1000, "p90_ms": _quantile(vals, 0.9) * 1000,
+                "p99_ms": _quantile(vals, 0.99) * 1000, "per_sec": sp.count / wall if wall > 0 else 0.0,
+            }
+        counters = {name: {"total": v, "per_sec": v / wall if wall > 0 else 0.0}
+                    for name, v in _state["counters"].items()}
+        return {
+            "entry": _state["entry"], "pid": os.getpid(), "started": _state["started"], "wall_s": wall,
+            "rss_mb": _rss_bytes() / 2**20,
+            # Linux 上 ru_maxrss 单位是 KB
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "spans": spans, "counters": counters, "gauges": dict(_state["gauges"]),
+        }
+
+
+def prometheus_text():
+    lines = []
+    with _lock:
+        spans = list(_state["spans"].items())
+        counters = list(_state["counters"].items())
+        gauges = list(_state["gauges"].items())
+    entry = _state["entry"] or "unknown"
+    lines += ["# TYPE ai_span_seconds histogram"]
+    for name, sp in spans:
+        labels = f'entry="{entry}",span="{name}"'
+        acc = 0
+        for le, n in zip(BUCKETS, sp.buckets):
+            acc += n
+            lines.append(f'ai_span_seconds_bucket{{{labels},le="{le}"}} {acc}')
+        lines.append(f'ai_span_seconds_bucket{{{labels},le="+Inf"}} {sp.count}')
+        lines.append(f'ai_span_seconds_sum{{{labels}}} {sp.total:.6f}')
+        lines.append(f'ai_span_seconds_count{{{labels}}} {sp.count}')
+    lines += ["# TYPE ai_items_total counter"]
+    lines += [f'ai_items_total{{entry="{entry}",name="{name}"}} {v}' for name, v in counters]
+    lines += ["# TYPE ai_gauge gauge"]
+    lines += [f'ai_gauge{{entry="{entry}",name="{name}"}} {g["last"]}' for name, g in gauges]
+    lines += ["# TYPE ai_rss_bytes gauge", f'ai_rss_bytes{{entry="{entry}"}} {_rss_bytes()}']
+    return "\n".join(lines) + "\n"
+
+
+def _serve(port):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"📈 指标端点: http://0.0.0.0:{port}/metrics")
+    return server
+
+
+def _output_base():
+    # 任务队列里运行时写进任务目录，否则写到 outputs/metrics
+    out_dir = os.getenv('JOB_WORK_DIR') or METRICS_DIR
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(_state["started"]))
+    return os.path.join(out_dir, f"metrics_{_state['entry']}_{stamp}_{os.getpid()}")
+
+
+def write_reports():
+    if _state["entry"] is None:
+        return
+    _stop_profile()
+    data = summary()
+    if not data["spans"] and not data["counters"]:
+        return
+    base = _output_base()
+    try:
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        with open(base + ".json", 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        with open(base + ".prom", 'w', encoding='utf-8') as f:
+            f.write(prometheus_text())
+    except OSError as e:
+        print(f"⚠️ 指标写入失败: {e}")
+        return
+    top = sorted(data["spans"].items(), key=lambda kv: -kv[1]["total_s"])[:5]
+    print(f"📈 耗时分布 (共 {data['wall_s']:.1f}s, 峰值内存 {data['peak_rss_mb']:.0f}MB): "
+          + ", ".join(f"{k} {v['share']:.0%}" for k, v in top))
+    print(f"📈 指标摘要: {base}.json")
+
+
+# ---------------- --profile 采样窗口 ----------------
+
+def _start_profile(prof):
+    if "torch" in sys.modules:
+        import torch
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        prof["impl"] = torch.profiler.profile(activities=activities, record_shapes=True)
+        prof["kind"] = "torch"
+        prof["impl"].__enter__()
+    else:
+        import cProfile
+        prof["impl"] = cProfile.Profile()
+        prof["kind"] = "cprofile"
+        prof["impl"].enable()
+    print(f"🔬 开始采样 {prof['steps']} 个条目 ({prof['kind']})")
+
+
+def _stop_profile():
+    prof = _state["profile"]
+    if not prof or "impl" not in prof or prof.get("done"):
+        return
+    prof["done"] = True
+    base = _output_base()
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    if prof["kind"] == "torch":
+        prof["impl"].__exit__(None, None, None)
+        path = base + ".trace.json"
+        prof["impl"].export_chrome_trace(path)
+    else:
+        prof["impl"].disable()
+        path = base + ".prof"
+        prof["impl"].dump_stats(path)
+    print(f"🔬 采样结果: {path}")
+
+
+def step():
+    """主循环每处理完一个条目调用一次: 预热后对接下来的 N 个条目做 profile"""
+    prof = _state["profile"]
+    if not prof or prof.get("done"):
+        return
+    prof["seen"] += 1
+    if prof["seen"] == PROFILE_WARMUP:
+        _start_profile(prof)
+    elif prof["seen"] == PROFILE_WARMUP + prof["steps"]:
+        _stop_profile()
+
+
+# ---------------- 入口 ----------------
+
+def add_cli_args(parser):
+    parser.add_argument("--profile", type=int, nargs="?", const=20, default=0,
+                        help="对预热后的 N 个条目做 profile (默认 20；已加载 torch 时用 torch profiler，否则 cProfile)")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv('METRICS_PORT', 0)),
+                        help="在该端口提供 Prometheus /metrics (默认读 METRICS_PORT，0 表示不开)")
+    return parser
+
+
+def setup(entry, args=None):
+    """开始计时；退出时自动写出 JSON 摘要和 .prom 文件"""
+    if _state["entry"] is not None:
+        return
+    _state["entry"] = entry
+    _state["started"] = time.time()
+    profile = getattr(args, "profile", 0) or 0
+    if profile > 0:
+        _state["profile"] = {"steps": profile, "seen": 0}
+    port = getattr(args, "metrics_port", 0) if args is not None else int(os.getenv('METRICS_PORT', 0))
+    if port:
+        _state["server"] = _serve(port)
+    atexit.register(write_reports)
@@ -0,0 +1,64 @@
+# ==========================================
+# 🚦 运动门控: 画面静止时跳过检测
+# ==========================================
+# 在缩小的灰度图上比较当前帧与上一次检测帧，变化像素占比低于阈值就跳过检测，
+# 由调用方用运动模型把已有轨迹外推到这一帧；变化超过阈值或连续跳过太久时恢复检测。
+# 缩略图长边 (像素)，64~128 足够发现小目标移动
+THUMB_SIDE = 96
+# 单个像素灰度变化超过多少算"变了" (过滤压缩噪声)
+PIXEL_DELTA = 12
+# 变化像素占比阈值
+MOTION_THRESHOLD = 0.003
+# 最多连续跳过多少帧 (原视频帧号)，防止缓慢漂移一直不触发检测
+MAX_SKIP_FRAMES = 15
+
+
+class MotionGate:
+    """should_detect() 返回 True 时以当前帧为新的参考帧 (调用方随后会跑检测)"""
+
+    def __init__(self, threshold=MOTION_THRESHOLD, max_skip=MAX_SKIP_FRAMES, thumb_side=THUMB_SIDE,
+                 pixel_delta=PIXEL_DELTA):
+        self.threshold = threshold
+        self.max_skip = max_skip
+        self.thumb_side = thumb_side
+        self.pixel_delta = pixel_delta
+        self._ref = None
+        self._ref_idx = None
+        self.checked = 0
+        self.skipped = 0
+        self.last_score = 0.0
+
+    def _thumb(self, frame):
+        import cv2
+        h, w = frame.shape[:2]
+        scale = self.thumb_side / max(h, w)
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        # INTER_AREA 本身就是均值滤波，顺带压掉噪点
+        return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+    def score(self, thumb):
+        """与参考帧相比，灰度变化超过 pixel_delta 的像素占比 (0~1)"""
+        import cv2
+        diff = cv2.absdiff(thumb, self._ref)
+        return float((diff > self.pixel_delta).mean())
+
+    def should_detect(self, frame_idx, frame):
+        self.checked += 1
+        thumb = self._thumb(frame)
+        if self._ref is None or thumb.shape != self._ref.shape or frame_idx - self._ref_idx >= self.max_skip:
+            self.last_score = 1.0
+        else:
+            self.last_score = self.score(thumb)
+            if self.last_score < self.threshold:
+                self.skipped += 1
+                return False
+        self._ref, self._ref_idx = thumb, frame_idx
+        return True
+
+    def reset(self):
+        self._ref = self._ref_idx = None
+
+    @property
+    def skip_ratio(self):
+        return self.skipped / max(self.checked, 1)
@@ -0,0 +1,120 @@
+import os
+import json
+
+# ==========================================
+# 🎭 追踪时的分割掩码: 不需要就不算，需要时紧凑输出
+# ==========================================
+# 追踪优先加载 yolov8n-seg.pt，但只用检测框: 原型掩码 (proto) 和掩码上采样每帧都在白算。
+#   strip_mask_head(model)   就地把 Segment 头换成 Detect 的前向 (检测框与原来完全相同)，
+#                            predictor 按检测任务后处理，不再生成掩码
+#   encode_masks(result, fmt) 需要掩码时编码成 COCO 非压缩 RLE 或简化多边形，写进 track_xxx.masks.jsonl
+MASK_FORMATS = ("none", "rle", "polygon")
+# 多边形简化 (approxPolyDP) 允许的像素偏差 (解码帧坐标)
+POLYGON_EPSILON = 1.0
+
+
+def is_seg_model(model):
+    return getattr(model, "task", None) == "segment"
+
+
+def strip_mask_head(model):
+    """分割模型去掉掩码分支，返回是否成功 (失败时模型保持原样)"""
+    import types
+    import torch
+    from ultralytics.nn.modules.head import Detect
+    if not is_seg_model(model):
+        return False
+    head = model.model.model[-1]
+    head.forward = types.MethodType(Detect.forward, head)
+    # 确认输出是 (bs, 4 + nc, anchors) 的检测格式 (不同版本的 ultralytics 头部实现不同，对不上就不动)
+    try:
+        with torch.no_grad():
+            y = model.model(torch.zeros(1, 3, 64, 64))
+        y = y[0] if isinstance(y, (list, tuple)) else y
+        ok = y.ndim == 3 and y.shape[1] == 4 + len(model.names)
+    except Exception:
+        ok = False
+    if not ok:
+        del head.forward
+        return False
+    model.task = "detect"
+    model.overrides["task"] = "detect"
+    return True
+
+
+def masks_to_rle(masks):
+    """
+    (n, h, w) bool -> COCO 非压缩 RLE 列表 [{"size": [h, w], "counts": [...]}]
+    列优先展开，counts 从 0 的游程开始；所有掩码的变化点由一次 diff 求出。
+    """
+    import numpy as np
+    n, h, w = masks.shape
+    if n == 0:
+        return []
+    length = h * w
+    flat = np.zeros((n, length + 1), dtype=bool)
+    flat[:, 1:] = masks.transpose(0, 2, 1).reshape(n, length)
+    rows, cols = np.nonzero(flat[:, 1:] != flat[:, :-1])
+    out = []
+    for c in np.split(cols, np.searchsorted(rows, np.arange(1, n))):
+        counts = np.diff(np.concatenate(([0], c, [length])))
+        out.append({"size": [h, w], "counts": counts.tolist()})
+    return out
+
+
+def simplify_polygons(segments, epsilon=POLYGON_EPSILON):
+    """ultralytics 的轮廓点 (每个掩码最大的外轮廓) 用 Douglas-Peucker 简化，返回 (k, 2) float32 数组列表"""
+    import cv2
+    import numpy as np
+    out = []
+    for seg in segments:
+        seg = np.asarray(seg, dtype=np.float32).reshape(-1, 2)
+        if len(seg) >= 3:
+            seg = cv2.approxPolyDP(seg.reshape(-1, 1, 2), epsilon, True).reshape(-1, 2)
+        out.append(seg)
+    return out
+
+
+def encode_masks(result, fmt, idx=None):
+    """取 result 里的掩码 (idx: 追踪保留下来的检测下标) 按 fmt 编码，与框一一对应；不输出掩码时返回 None"""
+    if fmt == "none":
+        return None
+    if result.masks is None:
+        return []
+    masks = result.masks if idx is None else result.masks[idx]
+    if fmt == "rle":
+        return masks_to_rle(masks.data.cpu().numpy() > 0.5)
+    return simplify_polygons(masks.xy)
+
+
+def mask_path(output_json):
+    return os.devnull if output_json == os.devnull else os.path.splitext(output_json)[0] + ".masks.jsonl"
+
+
+class MaskWriter:
+    """
+    track_xxx.masks.jsonl: 第一行是元信息，之后每个检测帧一行
+        {"frame": 帧号, "ids": [...], "rle": [...]}         RLE 在解码帧分辨率 (mask_width x mask_height)
+        {"frame": 帧号, "ids": [...], "polygons": [[x, y, ...]]}  原视频像素坐标
+    断点续跑时追加写入，同一帧出现多次以最后一行为准。
+    """
+
+    def __init__(self, path, fmt, header, append=False):
+        self.fmt = fmt
+        self.path = path
+        self.frames = 0
+        self.f = open(path, 'a' if append else 'w', encoding='utf-8')
+        if not append or self.f.tell() == 0:
+            self.f.write(json.dumps(dict(header, format=fmt)) + "\n")
+
+    def write(self, frame_idx, ids, masks, scale):
+        row = {"frame": int(frame_idx), "ids": ids.tolist()}
+        if self.fmt == "rle":
+            row["rle"] = masks
+        else:
+            row["polygons"] = [(p * scale[:2]).round(1).ravel().tolist() for p in masks]
+        self.f.write(json.dumps(row, separators=(",", ":")) + "\n")
+        self.frames += 1
+
+    def close(self):
+        self.f.close()
@@ -0,0 +1,228 @@
+# Label Studio 视频轨迹压缩: 只保留线性插值所需的关键帧
+import os
+
+# 默认容差: 插值框与真实框的最大像素偏差 / 最小 IoU (0 表示不检查 IoU)
+MAX_PIXEL_ERROR = 2.0
+MIN_IOU = 0.0
+
+
+def _box_iou(a, b):
+    """逐行计算 (x, y, w, h) 框的 IoU，a/b 形状均为 (n, 4)"""
+    import numpy as np
+    ix = np.clip(np.minimum(a[:, 0] + a[:, 2], b[:, 0] + b[:, 2]) - np.maximum(a[:, 0], b[:, 0]), 0, None)
+    iy = np.clip(np.minimum(a[:, 1] + a[:, 3], b[:, 1] + b[:, 3]) - np.maximum(a[:, 1], b[:, 1]), 0, None)
+    inter = ix * iy
+    union = a[:, 2] * a[:, 3] + b[:, 2] * b[:, 3] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 1.0)
+
+
+def _interp_error(frames, boxes, f0, b0, f1, b1):
+    """frames/boxes 相对于 (f0,b0)->(f1,b1) 线性插值的 (像素误差, IoU)"""
+    t = ((frames - f0) / max(f1 - f0, 1e-9))[:, None]
+    interp = b0 + (b1 - b0) * t
+    px = abs(boxes - interp).max(axis=1)
+    return px, _box_iou(boxes, interp)
+
+
+def simplify_track(frames, boxes, max_px=MAX_PIXEL_ERROR, min_iou=MIN_IOU):
+    """
+    对一条轨迹做 Ramer–Douglas–Peucker 简化 (按帧号线性插值，四维 x,y,w,h 同时判断)。
+    frames: (n,) 帧号；boxes: (n, 4) 像素坐标。返回需要保留的关键帧下标 (升序)。
+    每个分段的误差一次性向量化计算，只对超出容差的最大误差点继续二分。
+    """
+    import numpy as np
+    frames = np.asarray(frames, dtype=np.float64)
+    boxes = np.asarray(boxes, dtype=np.float64)
+    n = len(frames)
+    if n <= 2:
+        return np.arange(n)
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2: continue
+        px, iou = _interp_error(frames[i + 1:j], boxes[i + 1:j], frames[i], boxes[i], frames[j], boxes[j])
+        # 两种容差归一化到同一尺度: >1 即超标
+        score = px / max(max_px, 1e-9)
+        if min_iou > 0:
+            score = np.maximum(score, (1.0 - iou) / max(1.0 - min_iou, 1e-9))
+        k = int(score.argmax())
+        if score[k] > 1.0:
+            k += i + 1
+            keep[k] = True
+            stack.append((i, k))
+            stack.append((k, j))
+    return np.flatnonzero(keep)
+
+
+def reconstruction_error(frames, boxes, keep):
+    """用关键帧重建整条轨迹，返回 (最大像素误差, 最小 IoU)"""
+    import numpy as np
+    frames = np.asarray(frames, dtype=np.float64)
+    boxes = np.asarray(boxes, dtype=np.float64)
+    if len(frames) == 0:
+        return 0.0, 1.0
+    kf = frames[keep]
+    interp = np.stack([np.interp(frames, kf, boxes[keep, d]) for d in range(4)], axis=1)
+    px = abs(boxes - interp).max(axis=1)
+    return float(px.max()), float(_box_iou(boxes, interp).min())
+
+
+class TrackTable:
+    """
+    按列存储的追踪结果: 每行一个检测 (帧号, 轨迹 ID, 左上角 x, y, 宽, 高 像素坐标)。
+    每帧整批追加到预分配的 NumPy 数组，容量不够时翻倍，不为单个检测创建 Python 对象。
+    """
+
+    def __init__(self, capacity=4096):
+        import numpy as np
+        self.n = 0
+        self.frames = np.empty(capacity, dtype=np.int32)
+        self.ids = np.empty(capacity, dtype=np.int32)
+        self.boxes = np.empty((capacity, 4), dtype=np.float32)
+
+    def __len__(self):
+        return self.n
+
+    def _reserve(self, need):
+        import numpy as np
+        cap = len(self.frames)
+        if need <= cap: return
+        while cap < need:
+            cap *= 2
+        for name in ("frames", "ids", "boxes"):
+            old = getattr(self, name)
+            new = np.empty((cap,) + old.shape[1:], dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+
+    def append(self, frame_idx, track_ids, xywh):
+        """追加一帧的全部检测; xywh 为 (k, 4) 中心点格式 (ultralytics boxes.xywh)"""
+        k = len(track_ids)
+        if not k: return
+        self._reserve(self.n + k)
+        s = slice(self.n, self.n + k)
+        self.frames[s] = frame_idx
+        self.ids[s] = track_ids
+        self.boxes[s] = xywh
+        # 中心点 -> 左上角
+        self.boxes[s, :2] -= self.boxes[s, 2:] / 2
+        self.n += k
+
+    def _extend(self, frames, ids, boxes):
+        k = len(frames)
+        self._reserve(self.n + k)
+        s = slice(self.n, self.n + k)
+        self.frames[s], self.ids[s], self.boxes[s] = frames, ids, boxes
+        self.n += k
+
+    def max_id(self):
+        return int(self.ids[:self.n].max()) if self.n else 0
+
+    def save_rows(self, path, start=0):
+        """把第 start 行之后的数据写成一个 .npz 分片 (先写临时文件再替换)"""
+        import numpy as np
+        with open(path + ".tmp", 'wb') as f:
+            np.savez(f, frames=self.frames[start:self.n], ids=self.ids[start:self.n], boxes=self.boxes[start:self.n])
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, paths):
+        import numpy as np
+        table = cls()
+        for path in paths:
+            with np.load(path) as z:
+                table._extend(z['frames'], z['ids'], z['boxes'])
+        return table
+
+    def tracks(self):
+        """按 (轨迹 ID, 帧号) 排序后分组，返回 [(track_id, frames, boxes)]，各轨迹共享同一份排序后的数组"""
+        import numpy as np
+        frames, ids, boxes = self.frames[:self.n], self.ids[:self.n], self.boxes[:self.n]
+        order = np.lexsort((frames, ids))
+        frames, ids, boxes = frames[order], ids[order], boxes[order]
+        cuts = np.flatnonzero(np.diff(ids)) + 1
+        starts = np.concatenate(([0], cuts)) if self.n else cuts
+        ends = np.concatenate((cuts, [self.n])) if self.n else cuts
+        return [(int(ids[a]), frames[a:b], boxes[a:b]) for a, b in zip(starts, ends)]
+
+
+def match_overlap_ids(table, overlap, min_iou=0.5):
+    """
+    断点续跑时，新追踪器在重叠窗口内重新产生的轨迹 ID -> 旧 ID。
+    同一帧上按 IoU 匹配新旧框并投票，每个旧 ID 只分给票数最多的新 ID。
+    """
+    import numpy as np
+    votes = {}
+    old_frames = table.frames[:table.n]
+    for f in np.unique(overlap.frames[:overlap.n]):
+        old_sel = old_frames == f
+        new_sel = overlap.frames[:overlap.n] == f
+        if not old_sel.any(): continue
+        old_b, old_ids = table.boxes[:table.n][old_sel], table.ids[:table.n][old_sel]
+        for box, new_id in zip(overlap.boxes[:overlap.n][new_sel], overlap.ids[:overlap.n][new_sel]):
+            iou = _box_iou(np.repeat(box[None], len(old_b), axis=0), old_b)
+            k = int(iou.argmax())
+            if iou[k] >= min_iou:
+                key = (int(new_id), int(old_ids[k]))
+                votes[key] = votes.get(key, 0) + 1
+    id_map, taken = {}, set()
+    for (new_id, old_id), _ in sorted(votes.items(), key=lambda kv: -kv[1]):
+        if new_id in id_map or old_id in taken: continue
+        id_map[new_id] = old_id
+        taken.add(old_id)
+    return id_map
+
+
+def track_agreement(base, test, min_iou=0.5):
+    """
+    两次追踪结果的一致性 (base 通常是逐帧检测的基线)。
+    同一帧内按 IoU 从高到低贪心一对一匹配，返回:
+      recall: 基线框中被匹配上的比例；precision: 测试框中被匹配上的比例；
+      mean_iou: 匹配对的平均 IoU；id_consistency: 匹配对里 ID 对应关系与多数一致的比例；
+      same_id: 匹配对里 ID 完全相同的比例。
+    """
+    import numpy as np
+    bf, bi, bb = base.frames[:base.n], base.ids[:base.n], base.boxes[:base.n]
+    tf, ti, tb = test.frames[:test.n], test.ids[:test.n], test.boxes[:test.n]
+    b_order, t_order = np.argsort(bf, kind="stable"), np.argsort(tf, kind="stable")
+    bf, bi, bb = bf[b_order], bi[b_order], bb[b_order]
+    tf, ti, tb = tf[t_order], ti[t_order], tb[t_order]
+    pairs, ious = [], []
+    for f in np.intersect1d(bf, tf):
+        bs = slice(np.searchsorted(bf, f), np.searchsorted(bf, f, side="right"))
+        ts = slice(np.searchsorted(tf, f), np.searchsorted(tf, f, side="right"))
+        a, b = bb[bs], tb[ts]
+        # (na, nb) IoU 矩阵
+        ix = np.clip(np.minimum((a[:, 0] + a[:, 2])[:, None], (b[:, 0] + b[:, 2])[None])
+                     - np.maximum(a[:, 0][:, None], b[:, 0][None]), 0, None)
+        iy = np.clip(np.minimum((a[:, 1] + a[:, 3])[:, None], (b[:, 1] + b[:, 3])[None])
+                     - np.maximum(a[:, 1][:, None], b[:, 1][None]), 0, None)
+        inter = ix * iy
+        union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None] - inter
+        iou = inter / np.maximum(union, 1e-9)
+        used_a, used_b = set(), set()
+        for k in np.argsort(-iou, axis=None):
+            i, j = divmod(int(k), iou.shape[1])
+            if iou[i, j] < min_iou: break
+            if i in used_a or j in used_b: continue
+            used_a.add(i); used_b.add(j)
+            pairs.append((int(bi[bs][i]), int(ti[ts][j])))
+            ious.append(float(iou[i, j]))
+    matched = len(pairs)
+    votes = {}
+    for p in pairs:
+        votes[p] = votes.get(p, 0) + 1
+    # 每个基线 ID 取票数最多的测试 ID
+    best = {}
+    for (b_id, _), n in votes.items():
+        best[b_id] = max(best.get(b_id, 0), n)
+    return {
+        "recall": matched / max(base.n, 1),
+        "precision": matched / max(test.n, 1),
+        "mean_iou": float(np.mean(ious)) if ious else 0.0,
+        "id_consistency": sum(best.values()) / max(matched, 1),
+        "same_id": sum(b == t for b, t in pairs) / max(matched, 1),
+    }
@@ -0,0 +1,83 @@
+import os
+import json
+import math
+import time
+
+# ==========================================
+# 🎯 预标注不确定度: 写进 prediction score，并汇总成旁路索引供挑选下一批标注任务
+# ==========================================
+# 检测 (YOLO): 同一次前向里把 NMS 的置信度下限放低到 CANDIDATE_CONF，输出仍只保留 >= 输出阈值的框；
+#   每个候选框的置信度 c 看作 "是/不是目标" 的二分类: 熵 H(c) (归一化到 0~1)、边距 |2c-1|。
+#   任务分数取最模糊的那个框的熵 —— 一个拿不准的框就值得人工看一眼；没有任何候选框时为 0。
+# 转写 (Whisper): 生成时顺带取每个 token 的 log 概率，分数 = 1 - exp(平均 log 概率) (1 - 几何平均概率)。
+# 分数越高越值得优先标注；索引写在预标注文件旁边: pre_annotations_xxx.uncertainty.json
+CANDIDATE_CONF = 0.05
+
+
+def _binary_entropy(p):
+    p = min(max(p, 1e-6), 1 - 1e-6)
+    return -(p * math.log(p) + (1 - p) * math.log(1 - p)) / math.log(2)
+
+
+def detection_uncertainty(confs):
+    """confs: 一张图所有候选框 (>= CANDIDATE_CONF) 的置信度"""
+    if not confs:
+        return {"score": 0.0, "margin": 1.0, "entropy": 0.0, "candidates": 0}
+    entropies = [_binary_entropy(c) for c in confs]
+    return {"score": round(max(entropies), 4),
+            "margin": round(min(abs(2 * c - 1) for c in confs), 4),
+            "entropy": round(sum(entropies) / len(entropies), 4),
+            "candidates": len(confs)}
+
+
+def token_uncertainty(logprobs):
+    """logprobs: 生成的文本 token 的 log 概率 (不含特殊 token)"""
+    if not logprobs:
+        return {"score": 1.0, "avg_logprob": None, "tokens": 0}
+    avg = sum(logprobs) / len(logprobs)
+    return {"score": round(1 - math.exp(avg), 4), "avg_logprob": round(avg, 4),
+            "min_logprob": round(min(logprobs), 4), "tokens": len(logprobs)}
+
+
+# ---------------- 旁路索引 ----------------
+
+def index_path(output_path):
+    return os.path.splitext(output_path)[0] + ".uncertainty.json"
+
+
+def selected_path(output_path):
+    """已经挑出去的任务记录 (select_tasks.py 每次接着往后取)"""
+    return os.path.splitext(output_path)[0] + ".selected.json"
+
+
+def task_file(task):
+    """任务对应的数据文件 (相对 DATA_ROOT)，作为索引的主键"""
+    url = next(iter(task.get("data", {}).values()), "")
+    return url.split("?d=", 1)[1].split("/data/", 1)[-1] if "?d=" in url else url
+
+
+def write_index(output_path, tasks, metric):
+    """按分数从高到低写出 [{file, score, ...细项}]，预标注文件写完 (或队列合并完) 后调用"""
+    entries = []
+    for task in tasks:
+        detail = dict((task.get("meta") or {}).get("uncertainty") or {})
+        score = detail.pop("score", (task.get("predictions") or [{}])[0].get("score"))
+        if score is None: continue
+        entries.append({"file": task_file(task), "score": score, **detail})
+    entries.sort(key=lambda e: -e["score"])
+    path = index_path(output_path)
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({"source": os.path.basename(output_path), "metric": metric, "created": time.time(),
+                   "tasks": entries}, f, indent=1, ensure_ascii=False)
+    os.replace(tmp, path)
+    if entries:
+        top = entries[:max(1, len(entries) // 10)]
+        print(f"🎯 不确定度索引: {path} (前 10% 平均 {sum(e['score'] for e in top) / len(top):.3f}，"
+              f"全部平均 {sum(e['score'] for e in entries) / len(entries):.3f})")
+    return path
+
+
+def load_index(output_path):
+    with open(index_path(output_path), 'r', encoding='utf-8') as f:
+        return json.load(f)
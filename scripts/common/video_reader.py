@@ -0,0 +1,242 @@
+import os
+import time
+import queue
+import shutil
+import threading
+import subprocess
+
+from common import metrics
+
+# 后台解码队列长度 (帧)。缩放后的 640 帧约 0.7MB，8 帧足够平滑解码抖动
+QUEUE_SIZE = 8
+
+
+def _ffprobe_size(path):
+    """ffprobe 读视频流的编码宽高和旋转角度，换算成摆正后的 (宽, 高)；失败返回 None"""
+    import json
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0",
+           "-show_entries", "stream=width,height:stream_tags=rotate:stream_side_data=rotation", "-of", "json", path]
+    try:
+        stream = json.loads(subprocess.run(cmd, capture_output=True, text=True).stdout)["streams"][0]
+        w, h = int(stream["width"]), int(stream["height"])
+    except (OSError, ValueError, KeyError, IndexError):
+        return None
+    # 旧的 mp4 写在 tags.rotate，新版 ffmpeg 写在 side_data 的 display matrix
+    rotation = stream.get("tags", {}).get("rotate", 0)
+    for side in stream.get("side_data_list", []):
+        rotation = side.get("rotation", rotation)
+    return (h, w) if int(float(rotation)) % 180 else (w, h)
+
+
+def _display_size(path, cap, backend):
+    """
+    解码输出的 (宽, 高)。ffmpeg 默认按旋转元数据自动转正，而 cv2 的 FRAME_WIDTH / HEIGHT 在不同版本里
+    有的是编码尺寸、有的是转正后的尺寸，不能直接用来 reshape / 缩放。
+    ffmpeg 后端以 ffprobe 为准；cv2 后端 (或没有 ffprobe 时) 直接解一帧看实际尺寸。
+    """
+    import cv2
+    if backend == "ffmpeg" and shutil.which("ffprobe"):
+        size = _ffprobe_size(path)
+        if size:
+            return size
+    ok, frame = cap.read()
+    if ok:
+        return frame.shape[1], frame.shape[0]
+    return int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+
+class VideoReader:
+    """
+    后台线程解码视频，按 (帧号, BGR 帧) 迭代。
+    有 ffmpeg 时在解码端用 select/scale 滤镜跳帧并缩小到 max_side (长边)，
+    否则回退到 cv2: 跳过的帧只 grab()，保留的帧在解码线程里 resize。
+    帧号始终是原视频中的帧号，orig_w / orig_h 是原始分辨率，坐标换算以它们为准。
+    带旋转元数据的视频 (手机竖拍) 两种后端都输出摆正后的帧，orig_w / orig_h 也是摆正后的宽高
+    (与浏览器播放时看到的画面一致)。
+    传入 audio_sr / on_audio 时 (仅 ffmpeg)，同一个 ffmpeg 进程还会把单声道 PCM 音轨
+    从额外的管道输出，按块以 float32 数组回调 on_audio，视频只需解封装一次。
+    """
+
+    def __init__(self, path, max_side=None, stride=1, start=0, queue_size=QUEUE_SIZE, backend="auto",
+                 audio_sr=None, on_audio=None):
+        import cv2
+        self.path = path
+        self.stride = max(1, int(stride))
+        # 起点对齐到跳帧网格，续跑前后取到的是同一批帧
+        self.start = max(0, int(start)) // self.stride * self.stride
+
+        if backend == "auto":
+            backend = "ffmpeg" if shutil.which("ffmpeg") else "cv2"
+        self.backend = backend
+
+        cap = cv2.VideoCapture(path)
+        self.opened = cap.isOpened()
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        self.total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.orig_w, self.orig_h = _display_size(path, cap, backend) if self.opened else (0, 0)
+        cap.release()
+
+        self.out_w, self.out_h = self.orig_w, self.orig_h
+        if max_side and max(self.orig_w, self.orig_h) > max_side:
+            scale = max_side / max(self.orig_w, self.orig_h)
+            # 偶数尺寸，兼容 ffmpeg 的 yuv 缩放
+            self.out_w = max(2, int(round(self.orig_w * scale / 2)) * 2)
+            self.out_h = max(2, int(round(self.orig_h * scale / 2)) * 2)
+
+        self.audio_sr = audio_sr if on_audio is not None else None
+        self.on_audio = on_audio
+        self.audio_samples = 0
+        self._audio_thread = None
+        self.decoded = 0
+        self.decode_seconds = 0.0
+        self.error = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._proc = None
+        self._thread = None
+
+    @property
+    def decode_fps(self):
+        return self.decoded / max(self.decode_seconds, 1e-6)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _put(self, item):
+        # 队列满时阻塞等待消费者，但要能响应 close()
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run_ffmpeg(self):
+        import numpy as np
+        vf = []
+        if self.stride > 1:
+            vf.append(f"select='not(mod(n\\,{self.stride}))'")
+        if (self.out_w, self.out_h) != (self.orig_w, self.orig_h):
+            vf.append(f"scale={self.out_w}:{self.out_h}:flags=area")
+        cmd = ["ffmpeg", "-v", "error", "-nostdin"]
+        if self.start and self.fps > 0:
+            cmd += ["-ss", f"{self.start / self.fps:.6f}"]
+        cmd += ["-i", self.path]
+        if vf:
+            cmd += ["-vf", ",".join(vf)]
+        cmd += ["-map", "0:v:0", "-vsync", "0", "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1"]
+        audio_fd = None
+        if self.audio_sr:
+            # 第二个输出: 16bit 单声道 PCM 写到额外的管道 (子进程里 fd 号不变)
+            audio_fd, write_fd = os.pipe()
+            cmd += ["-map", "0:a:0", "-ac", "1", "-ar", str(self.audio_sr), "-f", "s16le", f"pipe:{write_fd}"]
+        self._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                      pass_fds=(write_fd,) if audio_fd is not None else ())
+        if audio_fd is not None:
+            os.close(write_fd)
+            # 两路输出必须同时读走，否则 ffmpeg 会卡在写满的管道上
+            self._audio_thread = threading.Thread(target=self._read_audio, args=(audio_fd,), daemon=True)
+            self._audio_thread.start()
+
+        size = self.out_w * self.out_h * 3
+        idx = self.start
+        eof = False
+        try:
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                buf = self._proc.stdout.read(size)
+                if len(buf) < size:
+                    eof = True
+                    break
+                frame = np.frombuffer(buf, dtype=np.uint8).reshape(self.out_h, self.out_w, 3)
+                dt = time.perf_counter() - t0
+                self.decode_seconds += dt
+                metrics.observe("decode", dt)
+                self.decoded += 1
+                if not self._put((idx, frame)): break
+                idx += self.stride
+        finally:
+            # 正常读完画面时让 ffmpeg 把剩余音频写完再退出，中途停止才强制结束
+            if not eof and self._proc.poll() is None:
+                self._proc.kill()
+            self._proc.wait()
+            self._proc.stdout.close()
+            if self._audio_thread is not None:
+                self._audio_thread.join()
+
+    def _read_audio(self, fd):
+        import numpy as np
+        carry = b""
+        with os.fdopen(fd, 'rb') as f:
+            while True:
+                buf = f.read(1 << 16)
+                if not buf: break
+                buf = carry + buf
+                # 保证按 2 字节样本对齐
+                cut = len(buf) - len(buf) % 2
+                carry = buf[cut:]
+                samples = np.frombuffer(buf[:cut], dtype="<i2").astype(np.float32) / 32768.0
+                self.audio_samples += len(samples)
+                self.on_audio(samples)
+
+    def _run_cv2(self):
+        import cv2
+        cap = cv2.VideoCapture(self.path)
+        if self.start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, self.start)
+        resize = (self.out_w, self.out_h) != (self.orig_w, self.orig_h)
+        idx = self.start
+        try:
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                if (idx - self.start) % self.stride:
+                    # grab() 只解码，不做色彩转换和拷贝
+                    if not cap.grab(): break
+                    self.decode_seconds += time.perf_counter() - t0
+                    idx += 1
+                    continue
+                ok, frame = cap.read()
+                if not ok: break
+                if resize:
+                    frame = cv2.resize(frame, (self.out_w, self.out_h), interpolation=cv2.INTER_AREA)
+                dt = time.perf_counter() - t0
+                self.decode_seconds += dt
+                metrics.observe("decode", dt)
+                self.decoded += 1
+                if not self._put((idx, frame)): break
+                idx += 1
+        finally:
+            cap.release()
+
+    def _worker(self):
+        try:
+            self._run_ffmpeg() if self.backend == "ffmpeg" else self._run_cv2()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._put(None)
+
+    def __iter__(self):
+        if not self.opened:
+            return
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None: break
+                yield item
+        finally:
+            self.close()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        self._stop.set()
+        # 杀掉 ffmpeg 让阻塞中的 read() 返回，清理由解码线程自己完成
+        proc = self._proc
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+
+from common import metrics
+
+# ==========================================
+# 👀 监听目录: 新到 / 改动的文件攒成小批送进常驻模型，结果追加到已有输出
+# ==========================================
+#   watcher = FolderWatcher(folder, (".jpg", ".png"), state_path)
+#   watch_loop(watcher, handle_batch)     # handle_batch(paths) 处理一批，返回后这些文件记为已处理
+# 用轮询而不是 inotify: Docker Desktop (Mac / Windows) 的目录挂载收不到宿主机的 inotify 事件。
+# 空闲时每 POLL_SECONDS 只 stat 一次目录 (新建 / 删除 / 改名会改变目录 mtime)，
+# 目录 mtime 变了或还有未写完的文件时才列目录；原地覆盖写不改目录 mtime，由每 RESCAN_SECONDS 一次的全量扫描兜底。
+# 半截文件: 文件的 (大小, mtime) 在两次扫描之间不变、且 mtime 距今超过 SETTLE_SECONDS 才处理。
+# 已处理文件的 (大小, mtime) 记在 state_path，重启后不重复处理；文件内容变了会重新处理。
+POLL_SECONDS = 1.0
+SETTLE_SECONDS = 2.0
+RESCAN_SECONDS = 30.0
+# 每个微批最多多少个文件 (一次处理完再写一次输出)
+WATCH_BATCH = 16
+
+
+def add_cli_args(parser):
+    parser.add_argument("--watch", action="store_true", help="持续监听输入目录，新文件到达后增量推理并追加到输出 (Ctrl+C 退出)")
+    parser.add_argument("--watch-batch", type=int, default=WATCH_BATCH, help="监听模式下每个微批最多处理的文件数")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS, help="监听模式下文件多久没有变化才认为已写完 (秒)")
+
+
+def watch_state_path(output_path):
+    return os.path.splitext(output_path)[0] + ".watch.json"
+
+
+class FolderWatcher:
+
+    def __init__(self, folder, extensions, state_path, settle=SETTLE_SECONDS,
+                 poll=POLL_SECONDS, rescan=RESCAN_SECONDS):
+        self.folder = folder
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.state_path = state_path
+        self.settle = settle
+        self.poll = poll
+        self.rescan = rescan
+        self.done = {}
+        if os.path.exists(state_path):
+            with open(state_path, 'r', encoding='utf-8') as f:
+                self.done = {k: tuple(v) for k, v in json.load(f).items()}
+        self._seen = {}
+        self._ready_sigs = {}
+        self._dir_mtime = None
+        self._last_scan = 0.0
+
+    def _scan(self):
+        files = {}
+        try:
+            entries = list(os.scandir(self.folder))
+        except FileNotFoundError:
+            return files
+        for e in entries:
+            if e.name.startswith(".") or not e.name.lower().endswith(self.extensions):
+                continue
+            try:
+                st = e.stat()
+            except FileNotFoundError:
+                continue
+            if e.is_file():
+                files[e.path] = (st.st_size, st.st_mtime_ns)
+        return files
+
+    def seed(self, paths):
+        """已经在输出里的文件 (例如之前整批跑过) 按当前状态记为已处理"""
+        files = self._scan()
+        added = 0
+        for p in paths:
+            if p in files and p not in self.done:
+                self.done[p] = files[p]
+                added += 1
+        if added:
+            self._save()
+        return added
+
+    def ready(self):
+        """返回已写完、且是新的或内容变了的文件 (按 mtime 先后)；目录没有变化时不列目录"""
+        now = time.time()
+        try:
+            dir_mtime = os.stat(self.folder).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        if dir_mtime == self._dir_mtime and not self._seen and now - self._last_scan < self.rescan:
+            return []
+        self._dir_mtime, self._last_scan = dir_mtime, now
+        with metrics.span("watch_scan"):
+            files = self._scan()
+        out, seen = [], {}
+        for path, sig in files.items():
+            if self.done.get(path) == sig:
+                continue
+            # 大小和 mtime 与上次扫描相同、且已经静止 settle 秒
+            if self._seen.get(path) == sig and now - sig[1] / 1e9 >= self.settle:
+                out.append(path)
+            else:
+                seen[path] = sig
+        self._seen = seen
+        # 删除的文件不再记录
+        gone = [p for p in self.done if p not in files]
+        for p in gone:
+            del self.done[p]
+        if gone and not out:
+            self._save()
+        self._ready_sigs = {p: files[p] for p in out}
+        return sorted(out, key=lambda p: files[p][1])
+
+    def mark_done(self, paths):
+        for p in paths:
+            self.done[p] = self._ready_sigs.get(p) or self.done.get(p)
+        self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp = f"{self.state_path}.tmp.{os.getpid()}"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.done, f, ensure_ascii=False)
+        os.replace(tmp, self.state_path)
+
+
+def watch_loop(watcher, handle_batch, batch_size=WATCH_BATCH):
+    """阻塞运行: 有新文件就按 batch_size 分批交给 handle_batch，空闲时只 sleep + stat"""
+    print(f"👀 监听 {watcher.folder} (每 {watcher.poll:.0f}s 检查一次，文件静止 {watcher.settle:.0f}s 后处理，Ctrl+C 退出)")
+    total = 0
+    try:
+        while True:
+            paths = watcher.ready()
+            if not paths:
+                time.sleep(watcher.poll)
+                continue
+            for i in range(0, len(paths), max(batch_size, 1)):
+                chunk = paths[i:i + batch_size]
+                t0 = time.time()
+                handle_batch(chunk)
+                watcher.mark_done(chunk)
+                total += len(chunk)
+                metrics.count("watch_files", len(chunk))
+                # 从文件写完到结果落盘的延迟 (含 settle 等待和排队)
+                written = min(watcher.done[p][1] for p in chunk) / 1e9
+                print(f"   ⚡ {len(chunk)} 个新文件，处理 {time.time() - t0:.1f}s，"
+                      f"距最早一个写完 {time.time() - written:.1f}s，累计 {total} 个")
+    except KeyboardInterrupt:
+        print(f"\n👋 停止监听，本次共处理 {total} 个文件")
+
+
+class TaskOutput:
+    """Label Studio 预标注文件 (JSON 列表) 的增量更新: 同一数据文件的任务以新结果替换，其余追加"""
+
+    def __init__(self, output_path, metric):
+        from common.uncertainty import task_file
+        self.output_path = output_path
+        self.metric = metric
+        self._key = task_file
+        self.tasks = []
+        if os.path.exists(output_path):
+            with open(output_path, 'r', encoding='utf-8') as f:
+                self.tasks = json.load(f)
+
+    def files(self):
+        return [self._key(t) for t in self.tasks]
+
+    def update(self, new_tasks):
+        from common.uncertainty import write_index
+        if not new_tasks:
+            return
+        pos = {self._key(t): i for i, t in enumerate(self.tasks)}
+        for t in new_tasks:
+            i = pos.get(self._key(t))
+            if i is None:
+                pos[self._key(t)] = len(self.tasks)
+                self.tasks.append(t)
+            else:
+                self.tasks[i] = t
+        os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
+        tmp = f"{self.output_path}.tmp.{os.getpid()}"
+        with metrics.span("serialize"), open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.tasks, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, self.output_path)
+        write_index(self.output_path, self.tasks, self.metric)
@@ -0,0 +1,142 @@
+import os
+import queue
+import threading
+
+from common import metrics
+
+SAMPLE_RATE = 16000
+# Whisper 一次只看 30 秒
+WINDOW_SECONDS = 30
+
+
+def load_whisper(model_path="/app/models/whisper", backend="torch", int8=False):
+    """加载 Whisper (优先离线目录)，返回 (model, processor, device)；backend="onnx" 时走 ONNX Runtime"""
+    print(f"🧠 加载模型: {model_path}")
+    if not os.path.exists(os.path.join(model_path, "config.json")):
+        print("⚠️ 离线模型未找到，尝试联网加载 openai/whisper-small...")
+        os.environ["HF_HUB_OFFLINE"] = "0"  # 临时开启联网
+        model_path = "openai/whisper-small"
+    if backend == "onnx":
+        from common.whisper_onnx import load_onnx_whisper
+        return load_onnx_whisper(model_path, int8=int8)
+
+    import torch
+    from transformers import WhisperProcessor, WhisperForConditionalGeneration
+    model = WhisperForConditionalGeneration.from_pretrained(model_path)
+    processor = WhisperProcessor.from_pretrained(model_path)
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model.to(device)
+    print(f"🚀 模型已加载至 {device}")
+    return model, processor, device
+
+
+def transcribe_window(whisper, speech, language="zh"):
+    import torch
+    model, processor, device = whisper
+    input_features = processor(speech, sampling_rate=SAMPLE_RATE, return_tensors="pt").input_features.to(device)
+    with torch.no_grad():
+        predicted_ids = model.generate(input_features, language=language, task="transcribe")
+    return processor.batch_decode(predicted_ids, skip_special_tokens=True)[0]
+
+
+def transcribe_window_scored(whisper, speech, language="zh"):
+    """同 transcribe_window，另外返回文本 token 的 log 概率 (用于不确定度)"""
+    model, processor, device = whisper
+    input_features = processor(speech, sampling_rate=SAMPLE_RATE, return_tensors="pt").input_features.to(device)
+    return generate_scored(whisper, input_features, language)
+
+
+def generate_scored(whisper, input_features, language="zh"):
+    """生成并顺带取每个文本 token 的 log 概率 (同一次 generate，不额外前向)，返回 (文本, [log 概率])"""
+    return generate_scored_batch(whisper, input_features, language)[0]
+
+
+def generate_scored_batch(whisper, input_features, language="zh"):
+    """一批音频 (input_features 第 0 维) 一次 generate，返回 [(文本, [log 概率])]"""
+    import torch
+    model, processor, _ = whisper
+    # 强制贪心解码 (num_beams=1、不采样): 下面按 "每步 log_softmax 的最大值就是选中 token 的 log 概率" 取分数，
+    # 只有贪心时成立；模型目录的 generation_config 若开了 beam search / 采样，这里也不跟随，否则分数错位、排序失真
+    with torch.no_grad():
+        out = model.generate(input_features, language=language, task="transcribe", num_beams=1, do_sample=False,
+                             return_dict_in_generate=True, output_scores=True)
+    # 不依赖 sequences 与 scores 的对齐方式 (不同 transformers 版本对强制前缀的处理不一样)。
+    # 批量时先结束的样本之后每步填的是 pad，从它选中 eos 的那一步起不再计入
+    special = set(processor.tokenizer.all_special_ids)
+    eos = model.generation_config.eos_token_id
+    eos = set(eos) if isinstance(eos, (list, tuple)) else {eos}
+    n = out.sequences.shape[0]
+    logprobs = [[] for _ in range(n)]
+    finished = [False] * n
+    for step in out.scores:
+        logp, token = torch.log_softmax(step.float(), dim=-1).max(dim=-1)
+        for i, (lp, t) in enumerate(zip(logp.tolist(), token.tolist())):
+            if finished[i]:
+                continue
+            if t in eos:
+                finished[i] = True
+            elif t not in special:
+                logprobs[i].append(lp)
+    texts = processor.batch_decode(out.sequences, skip_special_tokens=True)
+    return list(zip(texts, logprobs))
+
+
+class StreamingTranscriber:
+    """
+    边收音频边转写: feed() 接收任意长度的 16kHz float32 片段，
+    凑满 30 秒就在后台线程里转写一个窗口；finish() 转写剩余部分并返回 [(起始秒, 文本)]。
+    每个窗口的文本 token log 概率按顺序累积在 logprobs (整段的不确定度)，window_scores 是各窗口的分数。
+    """
+
+    def __init__(self, whisper, language="zh"):
+        self.whisper = whisper
+        self.language = language
+        self.segments = []
+        self.logprobs = []
+        self.window_scores = []
+        self.error = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def feed(self, samples):
+        self._queue.put(samples)
+        metrics.gauge("audio_queue", self._queue.qsize())
+
+    def _run(self):
+        import numpy as np
+        from common.uncertainty import token_uncertainty
+        window = WINDOW_SECONDS * SAMPLE_RATE
+        pending, n_pending, offset = [], 0, 0
+        while True:
+            chunk = self._queue.get()
+            if chunk is not None:
+                pending.append(chunk)
+                n_pending += len(chunk)
+            if n_pending < window and chunk is not None:
+                continue
+            buf = np.concatenate(pending) if pending else np.zeros(0, dtype=np.float32)
+            # 结束时把不足一个窗口的尾巴也转写掉
+            while len(buf) >= window or (chunk is None and len(buf) > 0):
+                speech, buf = buf[:window], buf[window:]
+                try:
+                    with metrics.span("transcribe"):
+                        text, logprobs = transcribe_window_scored(self.whisper, speech, self.language)
+                    text = text.strip()
+                except Exception as e:
+                    self.error = e
+                    text, logprobs = "", []
+                if text:
+                    self.logprobs.extend(logprobs)
+                    self.window_scores.append(token_uncertainty(logprobs)["score"])
+                    self.segments.append((offset / SAMPLE_RATE, text))
+                offset += len(speech)
+            pending, n_pending = [buf], len(buf)
+            if chunk is None:
+                return
+
+    def finish(self):
+        self._queue.put(None)
+        self._thread.join()
+        return self.segments
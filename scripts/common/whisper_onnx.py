@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+
+# ==========================================
+# ⚡ Whisper ONNX Runtime 后端
+# ==========================================
+# 第一次使用时把 HF 格式的 Whisper (离线模型或 whisper-finetuned-model) 导出成
+#   encoder_model.onnx / decoder_model.onnx (首步) / decoder_with_past_model.onnx (后续步骤复用 KV cache)
+# 缓存到 DATA_ROOT/.cache/whisper_onnx/<模型签名>/，之后直接加载；--int8 时再做一次动态量化 (权重 int8)。
+DATA_ROOT = os.getenv('DATA_ROOT', '/data')
+CACHE_ROOT = os.path.join(DATA_ROOT, ".cache", "whisper_onnx")
+ONNX_FILES = ("encoder_model.onnx", "decoder_model.onnx", "decoder_with_past_model.onnx")
+# 参与签名的文件: 配置 + 权重 (按 大小 / 修改时间，不读内容)
+SIGNATURE_FILES = ("config.json", "generation_config.json", "model.safetensors", "pytorch_model.bin")
+
+
+def model_signature(model_path):
+    """模型目录的签名: 重新训练 / 替换权重后缓存自动失效"""
+    h = hashlib.sha1(os.path.abspath(model_path).encode())
+    for name in SIGNATURE_FILES:
+        p = os.path.join(model_path, name)
+        if os.path.exists(p):
+            st = os.stat(p)
+            h.update(f"{name}:{st.st_size}:{int(st.st_mtime)}".encode())
+    return f"{os.path.basename(os.path.normpath(model_path))}-{h.hexdigest()[:12]}"
+
+
+def _ready(out_dir):
+    return all(os.path.exists(os.path.join(out_dir, f)) for f in ONNX_FILES + ("config.json",))
+
+
+def _publish(tmp_dir, out_dir):
+    # 先导出到临时目录再改名，多个进程同时导出时只有一个结果生效
+    try:
+        os.rename(tmp_dir, out_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def export_whisper(model_path, cache_root=CACHE_ROOT):
+    """导出 fp32 encoder / decoder / decoder-with-past 三个图，已缓存时直接返回目录"""
+    out_dir = os.path.join(cache_root, model_signature(model_path))
+    if _ready(out_dir):
+        return out_dir
+    from optimum.exporters.onnx import main_export
+    from transformers import WhisperProcessor
+
+    print(f"📦 导出 ONNX (仅首次): {model_path} -> {out_dir}")
+    t0 = time.time()
+    tmp_dir = f"{out_dir}.tmp.{os.getpid()}"
+    # no_post_process: 保留独立的 decoder_with_past 图，不合并成带 if 分支的单个 decoder
+    main_export(model_path, output=tmp_dir, task="automatic-speech-recognition-with-past",
+                no_post_process=True)
+    WhisperProcessor.from_pretrained(model_path).save_pretrained(tmp_dir)
+    with open(os.path.join(tmp_dir, "export_meta.json"), 'w', encoding='utf-8') as f:
+        json.dump({"source": os.path.abspath(model_path), "exported": time.time(),
+                   "seconds": time.time() - t0}, f, indent=2)
+    _publish(tmp_dir, out_dir)
+    print(f"✅ 导出完成 ({time.time() - t0:.0f}s)")
+    return out_dir
+
+
+def quantize_int8(fp32_dir):
+    """动态量化: 权重 int8、激活运行时量化，输出到 <目录>-int8/，文件名不变"""
+    out_dir = fp32_dir + "-int8"
+    if _ready(out_dir):
+        return out_dir
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    print(f"📦 int8 量化 (仅首次): {out_dir}")
+    tmp_dir = f"{out_dir}.tmp.{os.getpid()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    for name in os.listdir(fp32_dir):
+        if not name.endswith(".onnx"):
+            shutil.copy2(os.path.join(fp32_dir, name), tmp_dir)
+    for name in ONNX_FILES:
+        quantize_dynamic(os.path.join(fp32_dir, name), os.path.join(tmp_dir, name), weight_type=QuantType.QInt8)
+    _publish(tmp_dir, out_dir)
+    return out_dir
+
+
+def load_onnx_whisper(model_path, int8=False, threads=0):
+    """返回 (model, processor, "cpu")，与 whisper_infer.load_whisper 的返回值一致"""
+    import onnxruntime as ort
+    from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+    from transformers import WhisperProcessor
+
+    onnx_dir = export_whisper(model_path)
+    if int8:
+        onnx_dir = quantize_int8(onnx_dir)
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads:
+        options.intra_op_num_threads = threads
+    # use_cache + 非合并模式: 首个 token 走 decoder_model，之后每步把上一步的 past_key_values 喂给 decoder_with_past
+    model = ORTModelForSpeechSeq2Seq.from_pretrained(onnx_dir, use_cache=True, use_merged=False,
+                                                     provider="CPUExecutionProvider", session_options=options)
+    processor = WhisperProcessor.from_pretrained(onnx_dir)
+    print(f"🚀 ONNX Runtime 已加载 ({'int8' if int8 else 'fp32'}): {onnx_dir}")
+    return model, processor, "cpu"
@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import random
+import socket
+import threading
+
+from common import metrics
+
+# ==========================================
+# 🗂️ 共享存储上的文件租约队列 (多台 ai_toolbox 共用同一个 project_data)
+# ==========================================
+#   q = WorkQueue(queue_dir, files)
+#   for batch_id, items in q.batches():
+#       q.complete(batch_id, [处理(x) for x in items])
+#   q.merge(output_path)
+# 只依赖 O_EXCL 创建、rename 和 mtime，NFS 上也是原子的 (SQLite 的文件锁在 NFS 上不可靠)。
+#   queue_dir/manifest.json          文件列表与批大小 (第一个 worker 写入，其余 worker 复用)
+#   queue_dir/leases/b00012.lease    租约，持有者定期刷新 mtime，超时后可被其他 worker 回收
+#   queue_dir/shards/b00012.json     每个批次的结果分片 (由处理它的 worker 写出)
+#   queue_dir/merged.json            合并完成标记
+BATCH_SIZE = 16
+# 租约超时 (秒)，持有者每 1/3 超时刷新一次
+LEASE_SECONDS = 120
+# 没有可领取批次时的轮询间隔上限 (秒)
+POLL_SECONDS = 5.0
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.tmp.{socket.gethostname()}.{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class WorkQueue:
+    """
+    把 items (通常是文件路径) 按 batch_size 切成批次，多个进程 / 节点通过租约文件领取。
+    worker 崩溃后租约不再刷新，超过 lease_seconds 由其他 worker 回收重做；
+    结果按批次写分片，全部完成后由抢到合并锁的 worker 按原顺序合并成一个输出。
+    """
+
+    def __init__(self, root, items, batch_size=BATCH_SIZE, lease_seconds=LEASE_SECONDS, worker_id=None):
+        self.root = root
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.lease_dir = os.path.join(root, "leases")
+        self.shard_dir = os.path.join(root, "shards")
+        for d in (self.lease_dir, self.shard_dir):
+            os.makedirs(d, exist_ok=True)
+        self.manifest = self._load_manifest(sorted(items), batch_size)
+        self.items = self.manifest["items"]
+        self.batch_size = self.manifest["batch_size"]
+        self.n_batches = -(-len(self.items) // self.batch_size)
+        self._held = {}  # batch_id -> (租约路径, 租约内容)，用于刷新和确认租约没被别人回收
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    # ---------------- 清单 ----------------
+
+    def _load_manifest(self, items, batch_size):
+        path = os.path.join(self.root, "manifest.json")
+        data = _read_json(path)
+        if data is None:
+            # 先写临时文件再 link: link 目标已存在时失败，保证只有一个 worker 的清单生效
+            tmp = f"{path}.{self.worker_id}"
+            _write_atomic(tmp, {"items": items, "batch_size": batch_size, "created": time.time(),
+                                "creator": self.worker_id})
+            try:
+                os.link(tmp, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(tmp)
+            data = _read_json(path)
+        if data["items"] != items:
+            print(f"⚠️ 当前目录的文件列表与队列清单不一致，沿用清单中的 {len(data['items'])} 个文件 "
+                  f"(重新开始请换一个队列名)")
+        return data
+
+    # ---------------- 租约 ----------------
+
+    def _lease_path(self, batch_id):
+        return os.path.join(self.lease_dir, f"b{batch_id:05d}.lease")
+
+    def _shard_path(self, batch_id):
+        return os.path.join(self.shard_dir, f"b{batch_id:05d}.json")
+
+    def _storage_now(self):
+        """以共享存储的时钟为准 (各节点系统时间可能不一致)：刷新自己的时钟文件再读 mtime"""
+        path = os.path.join(self.lease_dir, f".clock_{self.worker_id}")
+        with open(path, 'a'):
+            os.utime(path, None)
+        return os.stat(path).st_mtime
+
+    def _try_create(self, path, batch_id):
+        token = {"worker": self.worker_id, "claimed": time.time(), "nonce": random.getrandbits(32)}
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            json.dump(token, f)
+        with self._lock:
+            self._held[batch_id] = (path, token)
+        return True
+
+    def _try_reclaim(self, path, batch_id, now):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return self._try_create(path, batch_id)
+        if now - st.st_mtime <= self.lease_seconds:
+            return False
+        # rename 只有一个 worker 能成功，成功者才有资格重新创建租约
+        stale = f"{path}.stale.{self.worker_id}"
+        try:
+            os.rename(path, stale)
+        except FileNotFoundError:
+            return False
+        old = _read_json(stale) or {}
+        os.remove(stale)
+        if not self._try_create(path, batch_id):
+            return False
+        print(f"♻️  回收超时租约: 批次 {batch_id} (原持有者 {old.get('worker', '?')})")
+        metrics.count("leases_reclaimed")
+        return True
+
+    def _owns(self, batch_id):
+        with self._lock:
+            held = self._held.get(batch_id)
+        return held is not None and _read_json(held[0]) == held[1]
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            with self._lock:
+                paths = [path for path, _ in self._held.values()]
+            for path in paths:
+                try:
+                    os.utime(path, None)
+                except FileNotFoundError:
+                    pass
+
+    def _release(self, batch_id):
+        if self._owns(batch_id):
+            try:
+                os.remove(self._held[batch_id][0])
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._held.pop(batch_id, None)
+
+    # ---------------- 领取 / 提交 ----------------
+
+    def done_batches(self):
+        return {int(n[1:6]) for n in os.listdir(self.shard_dir) if n.endswith(".json") and n.startswith("b")}
+
+    def _claim(self):
+        done = self.done_batches()
+        if len(done) >= self.n_batches:
+            return None, True
+        now = self._storage_now()
+        # 各 worker 从不同位置开始扫描，减少同时抢同一个批次
+        offset = random.randrange(self.n_batches)
+        for k in range(self.n_batches):
+            batch_id = (offset + k) % self.n_batches
+            if batch_id in done: continue
+            path = self._lease_path(batch_id)
+            if self._try_create(path, batch_id) or self._try_reclaim(path, batch_id, now):
+                # 前一个持有者可能刚好写完分片
+                if os.path.exists(self._shard_path(batch_id)):
+                    self._release(batch_id)
+                    continue
+                return batch_id, False
+        return None, False
+
+    def batches(self):
+        """逐个领取批次，产出 (batch_id, items)；处理完调用 complete()。队列全部完成后返回"""
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self._heartbeat.start()
+        try:
+            while True:
+                batch_id, finished = self._claim()
+                if finished:
+                    return
+                if batch_id is None:
+                    # 剩余批次都在别人手里: 等它们完成或超时
+                    time.sleep(min(POLL_SECONDS, self.lease_seconds / 4))
+                    continue
+                metrics.count("batches_claimed")
+                start = batch_id * self.batch_size
+                try:
+                    yield batch_id, self.items[start:start + self.batch_size]
+                finally:
+                    self._release(batch_id)
+        finally:
+            self._stop.set()
+
+    def complete(self, batch_id, results):
+        if not self._owns(batch_id):
+            # 租约已被回收 (比如处理太慢)，结果仍然有效，先写完的分片为准
+            print(f"⚠️ 批次 {batch_id} 的租约已被其他 worker 接手")
+            if os.path.exists(self._shard_path(batch_id)):
+                return
+        _write_atomic(self._shard_path(batch_id), {"batch": batch_id, "worker": self.worker_id,
+                                                   "finished": time.time(), "results": results})
+
+    # ---------------- 合并 ----------------
+
+    def status(self):
+        done = self.done_batches()
+        leased = [n for n in os.listdir(self.lease_dir) if n.endswith(".lease")]
+        return {"batches": self.n_batches, "done": len(done), "leased": len(leased),
+                "merged": os.path.exists(os.path.join(self.root, "merged.json"))}
+
+    def merge(self, output_path):
+        """全部分片到齐后按批次顺序合并；只有抢到合并锁的 worker 执行，返回是否由本 worker 合并"""
+        marker = os.path.join(self.root, "merged.json")
+        if os.path.exists(marker) or len(self.done_batches()) < self.n_batches:
+            return False
+        lock = os.path.join(self.lease_dir, "merge.lease")
+        if not (self._try_create(lock, -1) or self._try_reclaim(lock, -1, self._storage_now())):
+            return False
+        try:
+            if os.path.exists(marker):
+                return False
+            with metrics.span("merge"):
+                merged, workers = [], {}
+                for batch_id in range(self.n_batches):
+                    shard = _read_json(self._shard_path(batch_id))
+                    merged.extend(shard["results"])
+                    workers[shard["worker"]] = workers.get(shard["worker"], 0) + 1
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                tmp = f"{output_path}.tmp.{self.worker_id}"
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(merged, f, indent=2, ensure_ascii=False)
+                os.replace(tmp, output_path)
+            _write_atomic(marker, {"output": output_path, "results": len(merged), "workers": workers,
+                                   "merged_by": self.worker_id, "finished": time.time()})
+            print(f"🧩 已合并 {self.n_batches} 个分片 ({len(merged)} 条) -> {output_path}")
+            print("   各 worker 完成批次: " + ", ".join(f"{w} {n}" for w, n in sorted(workers.items())))
+            return True
+        finally:
+            self._release(-1)
+
+
+def add_cli_args(parser):
+    parser.add_argument("--queue", default=os.getenv('WORK_QUEUE'),
+                        help="分布式模式: 同名队列的多个 worker (可在不同节点) 共同处理目录，最后合并输出")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="分布式模式: 每次领取的文件数")
+    parser.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS,
+                        help="分布式模式: 租约超时秒数，超时未刷新的批次会被其他 worker 回收")
+    parser.add_argument("--worker-id", default=None, help="分布式模式: worker 名 (默认 主机名-pid)")
+    return parser
+
+
+def queue_dir(output_path, name):
+    """队列目录放在输出文件旁边: outputs/.queue/<输出文件名>-<队列名>/"""
+    base = os.path.splitext(os.path.basename(output_path))[0]
+    return os.path.join(os.path.dirname(output_path), ".queue", f"{base}-{name}")
@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+
+DATA_ROOT = os.getenv('DATA_ROOT', '/data')
+# 预缩放图片缓存 (按 源文件哈希 + imgsz 索引，可跨项目/多次训练复用)
+CACHE_ROOT = os.path.join(DATA_ROOT, ".cache", "yolo_images")
+# 缓存格式版本: v2 起只缩放不填充 (v1 的 114 灰边画布不再复用)
+CACHE_VERSION = 2
+JPEG_QUALITY = 95
+# 过采样副本的文件名后缀
+DUP_TAG = "__dup"
+
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()[:16]
+
+
+def resize_cached(src_path, imgsz, cache_root=CACHE_ROOT):
+    """
+    解码一次并把长边缩到 imgsz (与 ultralytics load_image 的尺寸相同，不填充)，返回 (缓存图片路径, 几何信息)。
+    不在缓存里加灰边: mosaic / 随机透视会把灰边当成画面内容，rect 验证也需要原始宽高比。
+    整张图等比缩放，相对图片归一化的 YOLO 标签不用改。
+    比 imgsz 小的图保持原尺寸 (训练时 ultralytics 自己放大，缓存不必存大图)。
+    """
+    key = f"{file_hash(src_path)}_{imgsz}_v{CACHE_VERSION}"
+    sub_dir = os.path.join(cache_root, str(imgsz), key[:2])
+    img_path = os.path.join(sub_dir, key + ".jpg")
+    meta_path = os.path.join(sub_dir, key + ".json")
+    if os.path.exists(img_path) and os.path.exists(meta_path):
+        with open(meta_path, 'r') as f:
+            return img_path, json.load(f)
+
+    # 只有缓存未命中时才需要解码
+    import cv2
+    import math
+    img = cv2.imread(src_path)
+    if img is None:
+        return None, None
+    h, w = img.shape[:2]
+    scale = min(imgsz / max(h, w), 1.0)
+    new_w, new_h = min(math.ceil(w * scale), imgsz), min(math.ceil(h * scale), imgsz)
+    if (new_w, new_h) != (w, h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
+
+    meta = {"imgsz": imgsz, "orig_w": w, "orig_h": h, "w": new_w, "h": new_h}
+    os.makedirs(sub_dir, exist_ok=True)
+    # 先写临时文件再改名，中途中断不会留下半张图
+    tmp_img = os.path.join(sub_dir, key + ".tmp.jpg")
+    cv2.imwrite(tmp_img, img, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    os.replace(tmp_img, img_path)
+    with open(meta_path + ".tmp", 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+    return img_path, meta
+
+
+def cached_name(fname):
+    """缓存图一律是 JPEG: 非 .jpg 的文件名把原扩展名并进主名 (a.png -> a_png.jpg)，避免与 a.jpg 重名"""
+    stem, ext = os.path.splitext(fname)
+    return fname if ext.lower() == ".jpg" else f"{stem}_{ext[1:].lower()}.jpg"
+
+
+def _place(src, dst):
+    # 同一文件系统用硬链接，避免重复占用磁盘
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy(src, dst)
+
+
+def add_sample(dataset_dir, src_path, fname, yolo_lines, imgsz=None):
+    """写入 train/val 两份样本；给定 imgsz 时使用预缩放缓存，返回实际写入的文件名"""
+    if imgsz:
+        cached, _ = resize_cached(src_path, imgsz)
+        if cached is None:
+            return None
+        src_path = cached
+        fname = cached_name(fname)
+
+    txt_name = os.path.splitext(fname)[0] + ".txt"
+    for split in ['train', 'val']:
+        _place(src_path, os.path.join(dataset_dir, f"images/{split}", fname))
+        with open(os.path.join(dataset_dir, f"labels/{split}", txt_name), "w") as f:
+            f.write("\n".join(yolo_lines))
+    return fname
+
+
+def oversample(dataset_dir, fnames, repeat):
+    """给 train 里的指定样本再加 repeat-1 份硬链接 (val 不动)，返回新增的份数"""
+    added = 0
+    for fname in fnames:
+        stem, ext = os.path.splitext(fname)
+        img = os.path.join(dataset_dir, "images/train", fname)
+        txt = os.path.join(dataset_dir, "labels/train", stem + ".txt")
+        if not os.path.exists(img):
+            continue
+        for k in range(1, repeat):
+            dup = f"{stem}{DUP_TAG}{k}"
+            _place(img, os.path.join(dataset_dir, "images/train", dup + ext))
+            _place(txt, os.path.join(dataset_dir, "labels/train", dup + ".txt"))
+            added += 1
+    return added
+
+
+def attach_epoch_timer(model):
+    """注册回调记录每个 epoch 的耗时，返回耗时列表 (秒)"""
+    epoch_times = []
+    state = {}
+
+    def _start(trainer):
+        state['t0'] = time.time()
+
+    def _end(trainer):
+        if 't0' in state:
+            epoch_times.append(time.time() - state['t0'])
+
+    model.add_callback("on_train_epoch_start", _start)
+    model.add_callback("on_train_epoch_end", _end)
+    return epoch_times
+
+
+def report_epoch_times(epoch_times):
+    if not epoch_times:
+        return
+    avg = sum(epoch_times) / len(epoch_times)
+    print(f"⏱️  {len(epoch_times)} 个 epoch，平均 {avg:.1f}s/epoch (首轮 {epoch_times[0]:.1f}s)")
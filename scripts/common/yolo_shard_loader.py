@@ -0,0 +1,110 @@
+import os
+import math
+
+import cv2
+import numpy as np
+import torch
+from ultralytics.data import YOLODataset
+from ultralytics.data.build import InfiniteDataLoader, seed_worker
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.utils import colorstr
+
+from common.yolo_shards import INDEX_NAME, ShardReader, ShardSampler
+
+# ==========================================
+# 📦 ultralytics 读取分片数据集 (common/yolo_shards.py 写出的格式)
+# ==========================================
+#   model.train(data=yaml, trainer=ShardTrainer, ...)
+# data.yaml 的 train / val 指向 shards/ 目录时生效，否则与 DetectionTrainer 完全相同。
+# 只在训练时导入 (依赖 torch / ultralytics)。
+
+
+class ShardYOLODataset(YOLODataset):
+    """im_files 是 "分片目录/样本名" 的虚拟路径；标签来自索引，图片从分片里取"""
+
+    def __init__(self, *args, expand_repeat=True, **kwargs):
+        self.expand_repeat = expand_repeat
+        super().__init__(*args, **kwargs)
+
+    def get_img_files(self, img_path):
+        self.reader = ShardReader(img_path)
+        # 过采样的样本在训练集里重复出现 (val 不展开)
+        self.sample_ids = [i for i, s in enumerate(self.reader.samples)
+                           for _ in range(s.get("repeat", 1) if self.expand_repeat else 1)]
+        return [os.path.join(img_path, self.reader.samples[i]["file"]) for i in self.sample_ids]
+
+    @property
+    def shard_ids(self):
+        return [self.reader.samples[i]["shard"] for i in self.sample_ids]
+
+    def get_labels(self):
+        labels = []
+        for im_file, i in zip(self.im_files, self.sample_ids):
+            s = self.reader.samples[i]
+            rows = np.array([line.split() for line in s["labels"]], dtype=np.float32).reshape(-1, 5)
+            labels.append({"im_file": im_file, "shape": (s["h"], s["w"]), "cls": rows[:, :1],
+                           "bboxes": rows[:, 1:], "segments": [], "keypoints": None,
+                           "normalized": True, "bbox_format": "xywh"})
+        return labels
+
+    def load_image(self, i, rect_mode=True):
+        """与 BaseDataset.load_image 相同的缩放 / 缓冲逻辑，只是图片来自分片而不是磁盘文件"""
+        if self.ims[i] is not None:
+            return self.ims[i], self.im_hw0[i], self.im_hw[i]
+        data = np.frombuffer(self.reader.read(self.sample_ids[i]), np.uint8)
+        im = cv2.imdecode(data, getattr(self, "cv2_flag", cv2.IMREAD_COLOR))
+        if im is None:
+            raise FileNotFoundError(f"分片中的图片无法解码: {self.im_files[i]}")
+        if im.ndim == 2:
+            im = im[..., None]
+        h0, w0 = im.shape[:2]
+        if rect_mode:
+            r = self.imgsz / max(h0, w0)
+            if r != 1:
+                w, h = (min(math.ceil(w0 * r), self.imgsz), min(math.ceil(h0 * r), self.imgsz))
+                im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+        elif not (h0 == w0 == self.imgsz):
+            im = cv2.resize(im, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+        if im.ndim == 2:
+            im = im[..., None]
+
+        if self.augment:
+            self.ims[i], self.im_hw0[i], self.im_hw[i] = im, (h0, w0), im.shape[:2]
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                j = self.buffer.pop(0)
+                if self.cache != "ram":
+                    self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+        return im, (h0, w0), im.shape[:2]
+
+
+class ShardTrainer(DetectionTrainer):
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        if not os.path.exists(os.path.join(img_path, INDEX_NAME)):
+            return super().build_dataset(img_path, mode, batch)
+        model = getattr(self.model, "module", self.model)
+        gs = max(int(model.stride.max() if model else 0), 32)
+        cfg = self.args
+        # val 不用 rect: rect 会按长宽比重排样本，读取顺序跨分片乱跳；
+        # 磁盘缓存 (.npy) 需要逐张的图片路径，分片格式下只支持内存缓存
+        return ShardYOLODataset(
+            img_path=img_path, imgsz=cfg.imgsz, batch_size=batch, augment=mode == "train", hyp=cfg,
+            rect=False, cache="ram" if cfg.cache in (True, "ram") else None,
+            single_cls=cfg.single_cls or False, stride=gs,
+            pad=0.0 if mode == "train" else 0.5, prefix=colorstr(f"{mode}: "), task=cfg.task,
+            classes=cfg.classes, data=self.data, fraction=cfg.fraction if mode == "train" else 1.0,
+            expand_repeat=mode == "train",
+        )
+
+    def get_dataloader(self, dataset_path, batch_size=16, rank=0, mode="train"):
+        if mode != "train" or rank != -1 or not os.path.exists(os.path.join(dataset_path, INDEX_NAME)):
+            # val 按索引顺序读 (本来就是按分片顺序)；多卡时退回默认的随机采样
+            return super().get_dataloader(dataset_path, batch_size, rank, mode)
+        dataset = self.build_dataset(dataset_path, mode, batch_size)
+        workers = min(os.cpu_count() or 1, self.args.workers)
+        return InfiniteDataLoader(
+            dataset=dataset, batch_size=batch_size, shuffle=False, num_workers=workers,
+            sampler=ShardSampler(dataset.shard_ids, seed=self.args.seed), pin_memory=torch.cuda.is_available(),
+            collate_fn=getattr(dataset, "collate_fn", None), worker_init_fn=seed_worker,
+        )
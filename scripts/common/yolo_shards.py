@@ -0,0 +1,203 @@
+import os
+import io
+import json
+import random
+import tarfile
+
+# ==========================================
+# 📦 YOLO 训练集的分片打包格式 (tar / WebDataset 风格)
+# ==========================================
+# 几十万个小文件放在网络盘上时，ultralytics 每张图一次随机 open 是训练的瓶颈。
+# 分片格式把 图片 + YOLO 标签 顺序写进若干个 ~SHARD_MB 的 tar:
+#   shards/shard-00000.tar    <key>.jpg / <key>.txt 成对存放 (标准 tar，可以直接用 tar / webdataset 读)
+#   shards/index.json         每个样本所在分片、图片在 tar 内的偏移 / 长度、尺寸和标签行
+# 训练时标签直接来自索引 (不碰分片)，图片按 "分片组内打乱" 的顺序读取:
+# 每个进程整块读入当前分片 (一次顺序大读)，之后的图片都从内存里取。
+SHARD_MB = 64
+# 训练时同时打乱的分片数 (越大越随机，内存占用 = 进程数 x 该值 x SHARD_MB)
+SHUFFLE_SHARDS = 2
+INDEX_NAME = "index.json"
+
+
+class ShardWriter:
+    """
+    与 yolo_dataset.add_sample 相同的接口，但把样本追加进分片:
+        w = ShardWriter(dataset_dir)
+        w.add(src_path, fname, yolo_lines, imgsz)
+        w.close()   # 写索引
+    """
+
+    def __init__(self, dataset_dir, shard_mb=SHARD_MB):
+        self.out_dir = os.path.join(dataset_dir, "shards")
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.shard_bytes = shard_mb * 1024 * 1024
+        self.shards = []
+        self.samples = []
+        self._tar = None
+        self._pending = []
+
+    def _open_shard(self):
+        name = f"shard-{len(self.shards):05d}.tar"
+        self.shards.append(name)
+        self._tar = tarfile.open(os.path.join(self.out_dir, name), "w", format=tarfile.USTAR_FORMAT)
+
+    def _close_shard(self):
+        if self._tar is None:
+            return
+        self._tar.close()
+        self._tar = None
+        # 回读刚写完的 (仍在页缓存里的) tar 头，记下每个成员的数据偏移
+        shard = len(self.shards) - 1
+        with tarfile.open(os.path.join(self.out_dir, self.shards[shard]), "r") as t:
+            offsets = {m.name: (m.offset_data, m.size) for m in t}
+        for entry in self._pending:
+            entry["shard"] = shard
+            entry["offset"], entry["size"] = offsets[entry["key"] + entry.pop("ext")]
+        self._pending = []
+
+    def _add_member(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def add(self, src_path, fname, yolo_lines, imgsz=None):
+        """写入一个样本，返回样本名 (失败返回 None)；imgsz 同 add_sample，使用预缩放缓存"""
+        from common.yolo_dataset import resize_cached, cached_name
+        if imgsz:
+            cached, meta = resize_cached(src_path, imgsz)
+            if cached is None:
+                return None
+            src_path = cached
+            fname = cached_name(fname)
+            h, w = meta['h'], meta['w']
+        with open(src_path, 'rb') as f:
+            data = f.read()
+        if not imgsz:
+            import cv2
+            import numpy as np
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                return None
+            h, w = img.shape[:2]
+
+        if self._tar is None or self._tar.offset >= self.shard_bytes:
+            self._close_shard()
+            self._open_shard()
+        key, ext = os.path.splitext(fname)
+        self._add_member(key + ext, data)
+        self._add_member(key + ".txt", "\n".join(yolo_lines).encode())
+        entry = {"key": key, "ext": ext, "file": fname, "h": h, "w": w, "labels": list(yolo_lines), "repeat": 1}
+        self._pending.append(entry)
+        self.samples.append(entry)
+        return fname
+
+    def oversample(self, fnames, repeat):
+        """过采样只改索引里的重复次数 (训练时同一份数据多读几次)，返回新增的份数"""
+        wanted = set(fnames)
+        added = 0
+        for entry in self.samples:
+            if entry["file"] in wanted:
+                added += repeat - entry["repeat"]
+                entry["repeat"] = repeat
+        return added
+
+    def close(self):
+        self._close_shard()
+        tmp = os.path.join(self.out_dir, INDEX_NAME + ".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"shards": self.shards, "samples": self.samples}, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(self.out_dir, INDEX_NAME))
+        size = sum(os.path.getsize(os.path.join(self.out_dir, s)) for s in self.shards)
+        print(f"📦 {len(self.samples)} 个样本 -> {len(self.shards)} 个分片 ({size / 1e6:.0f} MB): {self.out_dir}")
+        return self.out_dir
+
+
+def write_data_yaml(yaml_path, dataset_dir, class_map, shards=False):
+    """生成 data.yaml；分片格式下 train / val 都指向 shards/ (与文件格式一样，val 与 train 相同)"""
+    split = ("shards", "shards") if shards else ("images/train", "images/val")
+    with open(yaml_path, 'w') as f:
+        f.write(f"path: {dataset_dir}\ntrain: {split[0]}\nval: {split[1]}\nnc: {len(class_map)}\nnames:\n")
+        for name, idx in class_map.items():
+            f.write(f"  {idx}: {name}\n")
+
+
+def shard_dir_from_yaml(yaml_path):
+    """data.yaml 的 train 指向分片目录时返回该目录，否则 None"""
+    conf = {}
+    with open(yaml_path, 'r') as f:
+        for line in f:
+            if ":" in line and not line.startswith(" "):
+                k, v = line.split(":", 1)
+                conf[k.strip()] = v.strip()
+    train = os.path.join(conf.get("path", ""), conf.get("train", ""))
+    return train if os.path.exists(os.path.join(train, INDEX_NAME)) else None
+
+
+# ---------------- 读取 ----------------
+
+def load_index(shard_dir):
+    with open(os.path.join(shard_dir, INDEX_NAME), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class ShardReader:
+    """按样本读取图片字节；每个进程缓存最近 cache_shards 个完整分片 (整块顺序读入)"""
+
+    def __init__(self, shard_dir, cache_shards=SHUFFLE_SHARDS):
+        self.shard_dir = shard_dir
+        index = load_index(shard_dir)
+        self.shards = index["shards"]
+        self.samples = index["samples"]
+        self.cache_shards = cache_shards
+        self._cache = {}
+        self.shard_reads = 0
+
+    def _shard(self, shard):
+        data = self._cache.pop(shard, None)
+        if data is None:
+            with open(os.path.join(self.shard_dir, self.shards[shard]), 'rb') as f:
+                data = f.read()
+            self.shard_reads += 1
+            while len(self._cache) >= self.cache_shards:
+                self._cache.pop(next(iter(self._cache)))
+        self._cache[shard] = data
+        return data
+
+    def read(self, i):
+        s = self.samples[i]
+        return self._shard(s["shard"])[s["offset"]:s["offset"] + s["size"]]
+
+    def __getstate__(self):
+        # DataLoader worker 各自建缓存，不把主进程已读入的分片传过去
+        state = dict(self.__dict__)
+        state["_cache"] = {}
+        return state
+
+
+class ShardSampler:
+    """
+    一个 epoch 的样本顺序: 分片顺序随机，每 group 个分片内的样本一起打乱。
+    shard_ids: 每个样本 (按数据集下标) 所在的分片。
+    """
+
+    def __init__(self, shard_ids, group=SHUFFLE_SHARDS, seed=0):
+        self.shard_ids = list(shard_ids)
+        self.group = group
+        self.seed = seed
+        self.epoch = 0
+
+    def __len__(self):
+        return len(self.shard_ids)
+
+    def __iter__(self):
+        rng = random.Random(self.seed + self.epoch)
+        self.epoch += 1
+        by_shard = {}
+        for i, s in enumerate(self.shard_ids):
+            by_shard.setdefault(s, []).append(i)
+        order = list(by_shard)
+        rng.shuffle(order)
+        for g in range(0, len(order), self.group):
+            idx = [i for s in order[g:g + self.group] for i in by_shard[s]]
+            rng.shuffle(idx)
+            yield from idx
@@ -0,0 +1,209 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from urllib.parse import unquote
+
+from common import metrics
+from common.ls_export import iter_tasks
+
+# ==========================================
+# 📏 离线评估: 预标注结果 vs Label Studio 人工标注
+# ==========================================
+#   python /app/scripts/evaluate.py --project 1                         # 导出项目 1 的标注，评估 outputs/pre_annotations_images.json
+#   python /app/scripts/evaluate.py --project 2 --gt export.jsonl       # 用已有导出文件
+#   python /app/scripts/evaluate.py --project 1 --pred a.json --pred b.json   # 对比多个候选模型的输出
+# 检测 (P1/P4): mAP50、mAP50-95、conf 阈值下的 P/R；转写 (P2/P3): CER、WER、整句正确率。
+DATA_ROOT = os.getenv('DATA_ROOT', '/data')
+LS_URL = os.getenv('LS_URL', 'http://localhost:8080')
+API_KEY = os.getenv('LS_API_KEY', '')
+EVAL_DIR = os.getenv('JOB_WORK_DIR') or os.path.join(DATA_ROOT, "outputs", "eval")
+
+# 项目类型 -> (任务类型, 默认 Label Studio 项目 ID, 默认预标注文件)
+PROJECTS = {
+    "1": ("boxes", 1, "outputs/pre_annotations_images.json"),
+    "4": ("boxes", 4, "outputs/pre_annotations_video_frames.json"),
+    "2": ("text", 2, "outputs/pre_annotations_audio.json"),
+    "3": ("text", 3, "outputs/pre_annotations_video_audio.json"),
+}
+
+
+def task_key(data):
+    """用文件名关联人工标注和预标注 (去掉 Label Studio 上传时加的 8 位前缀)"""
+    url = data.get('image') or data.get('audio') or data.get('video') or ''
+    path = unquote(url)
+    if "?d=" in path:
+        path = path.split("?d=", 1)[1]
+    name = os.path.basename(path.split('?')[0])
+    return re.sub(r'^[0-9a-f]{8}-', '', name)
+
+
+def _annotation_result(task):
+    for ann in task.get('annotations') or []:
+        if not ann.get('was_cancelled'):
+            return ann.get('result') or []
+    return None
+
+
+def _boxes(result):
+    for region in result:
+        if region.get('type') != 'rectanglelabels': continue
+        v = region['value']
+        if not v.get('rectanglelabels'): continue
+        yield v['rectanglelabels'][0], (v['x'], v['y'], v['width'], v['height']), region.get('score', 1.0)
+
+
+def _text(result):
+    return "".join("".join(r['value'].get('text', [])) for r in result if r.get('type') == 'textarea')
+
+
+def load_ground_truth(path, kind):
+    """key -> 框列表 [(标签, xywh%)] 或 转写文本；只保留有人工标注的任务"""
+    gt = {}
+    for task in iter_tasks(path):
+        result = _annotation_result(task)
+        if result is None: continue
+        key = task_key(task.get('data', {}))
+        gt[key] = [(label, box) for label, box, _ in _boxes(result)] if kind == "boxes" else _text(result)
+    return gt
+
+
+def load_predictions(path, kind):
+    with open(path, 'r', encoding='utf-8') as f:
+        tasks = json.load(f)
+    pred = {}
+    for task in tasks:
+        result = (task.get('predictions') or [{}])[0].get('result', [])
+        key = task_key(task.get('data', {}))
+        pred[key] = list(_boxes(result)) if kind == "boxes" else _text(result)
+    return pred
+
+
+def _to_arrays(items, keys, labels, with_score):
+    import numpy as np
+    image, cls, box, score = [], [], [], []
+    for i, key in enumerate(keys):
+        for entry in items.get(key) or []:
+            label, xywh = entry[0], entry[1]
+            image.append(i); cls.append(labels.setdefault(label, len(labels))); box.append(xywh)
+            if with_score: score.append(entry[2])
+    out = {"image": np.array(image, dtype=np.int64), "cls": np.array(cls, dtype=np.int64),
+           "box": np.array(box, dtype=np.float64).reshape(-1, 4)}
+    if with_score:
+        out["score"] = np.array(score, dtype=np.float64)
+    return out
+
+
+def evaluate_boxes_file(gt, pred_path, conf):
+    from common.eval_metrics import evaluate_boxes
+    pred = load_predictions(pred_path, "boxes")
+    keys = sorted(gt)
+    missing = sum(k not in pred for k in keys)
+    labels = {}
+    with metrics.span("to_arrays"):
+        gt_arr = _to_arrays(gt, keys, labels, False)
+        pr_arr = _to_arrays(pred, keys, labels, True)
+    with metrics.span("match"):
+        report = evaluate_boxes(gt_arr, pr_arr, conf=conf)
+    names = {v: k for k, v in labels.items()}
+    report["classes"] = {names[c]: v for c, v in report["classes"].items()}
+    report.update({"images": len(keys), "images_without_pred": missing,
+                   "gt_boxes": len(gt_arr["cls"]), "pred_boxes": len(pr_arr["cls"])})
+    return report
+
+
+def evaluate_text_file(gt, pred_path):
+    from common.eval_metrics import error_rates
+    pred = load_predictions(pred_path, "text")
+    keys = sorted(gt)
+    with metrics.span("edit_distance"):
+        report = error_rates([gt[k] for k in keys], [pred.get(k, "") for k in keys])
+    report["missing"] = sum(k not in pred for k in keys)
+    return report
+
+
+def export_ground_truth(project_id):
+    from label_studio_sdk.client import LabelStudio
+    from common.ls_export import export_tasks_jsonl
+    path = os.path.join(EVAL_DIR, f"gt_project_{project_id}.jsonl")
+    os.makedirs(EVAL_DIR, exist_ok=True)
+    print(f"🎣 导出项目 {project_id} 的人工标注...")
+    client = LabelStudio(base_url=LS_URL, api_key=API_KEY)
+    with metrics.span("ls_export"):
+        total = export_tasks_jsonl(client, project_id, path)
+    print(f"✅ {total} 条任务 -> {path}")
+    return path
+
+
+def print_box_report(name, r):
+    print(f"📦 {name}: {r['images']} 张图 ({r['images_without_pred']} 张无预测), "
+          f"真值 {r['gt_boxes']} 框, 预测 {r['pred_boxes']} 框")
+    print(f"   {'class':<20}{'gt':>8}{'pred':>8}{'P':>8}{'R':>8}{'AP50':>8}{'AP50-95':>9}")
+    for label, c in sorted(r["classes"].items(), key=lambda kv: -kv[1]["gt"]):
+        print(f"   {label:<20}{c['gt']:>8}{c['pred']:>8}{c['precision']:>8.3f}{c['recall']:>8.3f}"
+              f"{c['AP50']:>8.3f}{c['AP50_95']:>9.3f}")
+    print(f"   {'all':<20}{r['gt_boxes']:>8}{'':>8}{r['precision']:>8.3f}{r['recall']:>8.3f}"
+          f"{r['mAP50']:>8.3f}{r['mAP50_95']:>9.3f}")
+
+
+def print_text_report(name, r):
+    print(f"🎤 {name}: {r['utterances']} 条 ({r['missing']} 条无预测), CER {r['cer']:.2%}, "
+          f"WER {r['wer']:.2%}, 整句正确 {r['sentence_acc']:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线评估预标注质量 (对照 Label Studio 人工标注)")
+    parser.add_argument("--project", required=True, choices=sorted(PROJECTS), help="项目类型 1/2/3/4")
+    parser.add_argument("--project_id", type=int, help="Label Studio 项目 ID (默认与项目类型相同)")
+    parser.add_argument("--gt", help="已有的 Label Studio 导出文件 (JSON / JSONL)，不填则现场导出")
+    parser.add_argument("--pred", action="append", help="预标注文件，可重复以对比多个模型 (默认 outputs 下对应文件)")
+    parser.add_argument("--conf", type=float, default=0.25, help="统计 P/R 时的分数阈值")
+    parser.add_argument("--json", help="评估报告输出路径 (默认写到 outputs/eval/)")
+    metrics.add_cli_args(parser)
+    args = parser.parse_args()
+    metrics.setup("evaluate", args)
+
+    kind, default_id, default_pred = PROJECTS[args.project]
+    preds = args.pred or [os.path.join(DATA_ROOT, default_pred)]
+    for p in preds:
+        if not os.path.exists(p):
+            print(f"❌ 找不到预标注文件: {p}")
+            sys.exit(1)
+    gt_path = args.gt
+    if not gt_path:
+        try:
+            gt_path = export_ground_truth(args.project_id or default_id)
+        except Exception as e:
+            print(f"❌ 导出失败: {e}\n👉 可以用 --gt 指定已有的导出文件")
+            sys.exit(1)
+
+    t0 = time.perf_counter()
+    with metrics.span("load_gt"):
+        gt = load_ground_truth(gt_path, kind)
+    if not gt:
+        print(f"❌ 导出中没有已完成的人工标注: {gt_path}")
+        sys.exit(1)
+
+    reports = {}
+    for p in preds:
+        name = os.path.basename(p)
+        if kind == "boxes":
+            reports[p] = evaluate_boxes_file(gt, p, args.conf)
+            print_box_report(name, reports[p])
+        else:
+            reports[p] = evaluate_text_file(gt, p)
+            print_text_report(name, reports[p])
+    print(f"⏱️  评估耗时 {time.perf_counter() - t0:.2f}s")
+
+    out = args.json or os.path.join(EVAL_DIR, f"eval_p{args.project}_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump({"project": args.project, "gt": gt_path, "conf": args.conf, "reports": reports},
+                  f, indent=2, ensure_ascii=False)
+    print(f"📄 评估报告: {out}")
+
+
+if __name__ == "__main__":
+    main()
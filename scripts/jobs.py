@@ -0,0 +1,447 @@
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import sqlite3
+import argparse
+import importlib
+import traceback
+
+# ==========================================
+# ⚙️ 常驻任务队列 (在 ai_toolbox 容器内运行)
+# ==========================================
+#   守护进程: python /app/scripts/jobs.py daemon
+#   提交任务: python /app/scripts/jobs.py submit p1-train --follow
+#   查看队列: python /app/scripts/jobs.py list
+#   跟踪日志: python /app/scripts/jobs.py tail 12 -f
+DATA_ROOT = os.getenv('DATA_ROOT', '/data')
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+JOBS_ROOT = os.getenv('JOBS_ROOT', os.path.join(DATA_ROOT, "jobs"))
+DB_PATH = os.path.join(JOBS_ROOT, "jobs.db")
+POLL_INTERVAL = 1.0
+# 守护进程重启时，被中断的任务最多重新排队的次数
+MAX_ATTEMPTS = 3
+
+# 流水线注册表: 脚本 (相对 scripts 目录)、默认参数、声明的 CPU 核数 / 内存 (GB)
+PIPELINES = {
+    "p1-train": {"script": "yolo_workspace/auto_yolo_manager.py", "args": ["--project_id", "1"], "cpu": 4, "mem": 6},
+    "p1-infer": {"script": "yolo_to_ls.py", "args": ["--project", "1"], "cpu": 2, "mem": 2},
+    "p4-extract": {"script": "train_yolo_video/extract_frames.py", "args": [], "cpu": 2, "mem": 1},
+    "p4-train": {"script": "train_yolo_video/auto_video_yolo.py", "args": [], "cpu": 4, "mem": 6},
+    "p4-infer": {"script": "yolo_to_ls.py", "args": ["--project", "4"], "cpu": 2, "mem": 2},
+    "p2-train": {"script": "whisper_workspace/auto_train_manager.py", "args": [], "cpu": 4, "mem": 10},
+    "p2-infer": {"script": "whisper_to_ls.py", "args": ["--project", "2"], "cpu": 2, "mem": 4},
+    "p3-train": {"script": "train_whisper_video/auto_video_whisper.py", "args": [], "cpu": 4, "mem": 10},
+    "p3-infer": {"script": "whisper_to_ls.py", "args": ["--project", "3"], "cpu": 2, "mem": 4},
+    "p8-track": {"script": "video_tracking_workspace/auto_tracker.py", "args": [], "cpu": 2, "mem": 3},
+    "p38-video": {"script": "video_tracking_workspace/video_pipeline.py", "args": [], "cpu": 4, "mem": 6},
+}
+
+# 守护进程预先导入的重型依赖，子任务 fork 后直接复用 (写时复制)
+DEFAULT_PRELOAD = "torch,ultralytics,transformers"
+
+ACTIVE = ("running", "cancelling")
+FINISHED = ("done", "failed", "cancelled")
+
+
+def connect():
+    os.makedirs(JOBS_ROOT, exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        pipeline TEXT NOT NULL,
+        args TEXT NOT NULL,
+        cpu REAL NOT NULL,
+        mem REAL NOT NULL,
+        status TEXT NOT NULL,
+        work_dir TEXT,
+        pid INTEGER,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        returncode INTEGER,
+        created REAL NOT NULL,
+        started REAL,
+        finished REAL
+    )""")
+    # 旧版数据库补列: 启动任务的守护进程实例、子进程启动时间 (/proc/<pid>/stat 第 22 项)
+    columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+    for name, decl in (("daemon_id", "TEXT"), ("pid_start", "INTEGER")):
+        if name not in columns:
+            conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {decl}")
+    return conn
+
+
+def job_work_dir(job_id):
+    return os.path.join(JOBS_ROOT, f"job_{job_id:05d}")
+
+
+def job_log_path(job_id):
+    return os.path.join(job_work_dir(job_id), "job.log")
+
+
+def _exit_code_path(job_id):
+    return os.path.join(job_work_dir(job_id), "exit_code")
+
+
+# ==========================================
+# 🛠️ 守护进程
+# ==========================================
+
+def detect_capacity():
+    cpus = os.cpu_count() or 1
+    mem_gb = 4.0
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    mem_gb = int(line.split()[1]) / 1024 / 1024
+                    break
+    except OSError:
+        pass
+    return cpus, mem_gb
+
+
+def _proc_start_time(pid):
+    """进程启动时间 (开机后的时钟滴答数)；进程不存在时返回 None"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # 第 2 项 comm 可能含空格和括号，从最后一个 ')' 之后数: 第 3 项起，第 22 项是 starttime
+    return int(stat.rsplit(")", 1)[1].split()[19])
+
+
+def _same_process(job):
+    """
+    记录的 pid 是否仍是当初启动的那个进程。容器重启后 PID 命名空间从头分配，旧 pid 很快会被新进程
+    (常常就是守护进程自己 fork 的下一个任务) 复用，所以必须同时比对启动时间；对不上的一律视为已退出，也绝不发信号。
+    """
+    if not job['pid'] or job['pid_start'] is None:
+        return False
+    return _proc_start_time(job['pid']) == job['pid_start']
+
+
+def _signal_name(signum):
+    try:
+        return signal.Signals(signum).name
+    except ValueError:
+        return f"signal {signum}"
+
+
+def _run_child(job, script_path, argv):
+    """fork 出的子进程: 切换到独立工作目录，重定向日志，在已预热的解释器里运行脚本；无论如何都以 os._exit 结束"""
+    code = 1
+    try:
+        os.setsid()
+        # 恢复默认信号处理，取消任务时 SIGTERM 能直接结束子进程
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        work_dir = job_work_dir(job['id'])
+        os.chdir(work_dir)
+        log_fd = os.open(job_log_path(job['id']), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        os.dup2(log_fd, 1)
+        os.dup2(log_fd, 2)
+        os.close(log_fd)
+
+        threads = str(max(1, int(job['cpu'])))
+        os.environ.update({
+            "JOB_ID": str(job['id']), "JOB_WORK_DIR": work_dir,
+            "OMP_NUM_THREADS": threads, "MKL_NUM_THREADS": threads,
+        })
+        if 'torch' in sys.modules:
+            sys.modules['torch'].set_num_threads(int(threads))
+
+        import runpy
+        sys.argv = [script_path] + argv
+        sys.path.insert(0, os.path.dirname(script_path))
+        runpy.run_path(script_path, run_name="__main__")
+        code = 0
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            # os._exit 不会执行 atexit，脚本用到埋点时在这里补写指标摘要
+            if 'common.metrics' in sys.modules:
+                try:
+                    sys.modules['common.metrics'].write_reports()
+                except Exception:
+                    traceback.print_exc()
+            sys.stdout.flush(); sys.stderr.flush()
+            with open(_exit_code_path(job['id']), 'w') as f:
+                f.write(str(code))
+        finally:
+            # 绝不能返回到 _start_job: 那样子进程会接着跑第二个调度循环
+            os._exit(code)
+
+
+def _start_job(conn, job, use_fork, daemon_id):
+    pipeline = PIPELINES[job['pipeline']]
+    script_path = os.path.join(SCRIPTS_DIR, pipeline['script'])
+    argv = json.loads(job['args'])
+    os.makedirs(job_work_dir(job['id']), exist_ok=True)
+    if os.path.exists(_exit_code_path(job['id'])):
+        os.remove(_exit_code_path(job['id']))
+
+    sys.stdout.flush(); sys.stderr.flush()
+    if use_fork:
+        pid = os.fork()
+        if pid == 0:
+            _run_child(job, script_path, argv)
+    else:
+        # 不预热时退化为独立解释器 (与 run_host.sh 行为一致)
+        import subprocess
+        work_dir = job_work_dir(job['id'])
+        threads = str(max(1, int(job['cpu'])))
+        env = dict(os.environ, JOB_ID=str(job['id']), JOB_WORK_DIR=work_dir,
+                   OMP_NUM_THREADS=threads, MKL_NUM_THREADS=threads)
+        log = open(job_log_path(job['id']), 'ab')
+        wrapper = (
+            "import sys, subprocess; "
+            "rc = subprocess.call(sys.argv[2:]); "
+            "open(sys.argv[1], 'w').write(str(rc)); sys.exit(rc)"
+        )
+        proc = subprocess.Popen(
+            [sys.executable, "-c", wrapper, _exit_code_path(job['id']), sys.executable, script_path] + argv,
+            cwd=work_dir, env=env, stdout=log, stderr=subprocess.STDOUT, start_new_session=True
+        )
+        log.close()
+        pid = proc.pid
+
+    conn.execute(
+        "UPDATE jobs SET status='running', pid=?, pid_start=?, daemon_id=?, work_dir=?, started=?, "
+        "attempts=attempts+1 WHERE id=?",
+        (pid, _proc_start_time(pid), daemon_id, job_work_dir(job['id']), time.time(), job['id'])
+    )
+    print(f"▶️  启动任务 #{job['id']} {job['pipeline']} (pid={pid}, cpu={job['cpu']}, mem={job['mem']}GB)")
+
+
+def _finish(conn, job, status, code, note):
+    conn.execute("UPDATE jobs SET status=?, returncode=?, finished=?, pid=NULL WHERE id=?",
+                 (status, code, time.time(), job['id']))
+    print(f"{'✅' if status == 'done' else '❌'} 任务 #{job['id']} {job['pipeline']} -> {status} ({note})")
+
+
+def _reap(conn, daemon_id):
+    # 回收已退出的子进程 (避免僵尸进程让 pid 看起来仍存活)，保留等待状态: 被信号杀掉的子进程没有 exit_code 文件
+    wait_status = {}
+    while True:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            break
+        wait_status[pid] = status
+
+    for job in conn.execute("SELECT * FROM jobs WHERE status IN ('running', 'cancelling')").fetchall():
+        if _same_process(job):
+            continue
+        cancelled = job['status'] == 'cancelling'
+        code_path = _exit_code_path(job['id'])
+        status = wait_status.get(job['pid']) if job['daemon_id'] == daemon_id else None
+        if os.path.exists(code_path):
+            with open(code_path) as f:
+                code = int(f.read().strip() or 1)
+            if cancelled:
+                _finish(conn, job, 'cancelled', code, code)
+            elif code < 0:
+                # 非预热模式下包装进程转发的 subprocess 返回码: 负数即被信号终止
+                _finish(conn, job, 'failed', code, f"被 {_signal_name(-code)} 终止")
+            else:
+                _finish(conn, job, 'done' if code == 0 else 'failed', code, code)
+        elif cancelled:
+            conn.execute("UPDATE jobs SET status='cancelled', finished=?, pid=NULL WHERE id=?", (time.time(), job['id']))
+        elif status is not None and os.WIFSIGNALED(status):
+            # 本实例的子进程被信号杀掉 (SIGKILL 多半是 OOM killer): 重跑大概率还是一样，直接失败
+            sig = os.WTERMSIG(status)
+            hint = "，可能是内存不足被 OOM killer 杀掉" if sig == signal.SIGKILL else ""
+            _finish(conn, job, 'failed', -sig, f"被 {_signal_name(sig)} 终止{hint}")
+        elif job['daemon_id'] != daemon_id and job['attempts'] < MAX_ATTEMPTS:
+            # 上一个守护进程实例启动的任务 (容器重启等)，进程已不在: 重新排队
+            conn.execute("UPDATE jobs SET status='queued', pid=NULL WHERE id=?", (job['id'],))
+            print(f"🔁 任务 #{job['id']} 在守护进程重启时被中断，重新排队")
+        elif job['daemon_id'] != daemon_id:
+            _finish(conn, job, 'failed', None, "多次中断")
+        else:
+            code = os.WEXITSTATUS(status) if status is not None and os.WIFEXITED(status) else None
+            _finish(conn, job, 'failed', code, "子进程退出但没有写返回码")
+
+
+def _handle_cancels(conn):
+    for job in conn.execute("SELECT * FROM jobs WHERE status='cancelling' AND pid IS NOT NULL").fetchall():
+        # 启动时间对不上说明 pid 已被别的进程复用，不能发信号
+        if not _same_process(job):
+            continue
+        try:
+            os.killpg(job['pid'], signal.SIGTERM)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+def _schedule(conn, total_cpu, total_mem, use_fork, daemon_id):
+    running = conn.execute("SELECT cpu, mem FROM jobs WHERE status IN ('running', 'cancelling')").fetchall()
+    free_cpu = total_cpu - sum(min(j['cpu'], total_cpu) for j in running)
+    free_mem = total_mem - sum(min(j['mem'], total_mem) for j in running)
+    # 按提交顺序 first-fit: 放不下的大任务不阻塞后面的小任务
+    for job in conn.execute("SELECT * FROM jobs WHERE status='queued' ORDER BY id").fetchall():
+        # 声明超过整机容量的任务按整机计，空闲时可以独占运行
+        cpu, mem = min(job['cpu'], total_cpu), min(job['mem'], total_mem)
+        if cpu <= free_cpu + 1e-9 and mem <= free_mem + 1e-9:
+            _start_job(conn, job, use_fork, daemon_id)
+            free_cpu -= cpu
+            free_mem -= mem
+
+
+def run_daemon(total_cpu, total_mem, preload):
+    sys.stdout.reconfigure(line_buffering=True)
+    conn = connect()
+    use_fork = bool(preload)
+    # 每次启动一个新的实例 id: 数据库里不属于本实例的运行中任务都是上次遗留的
+    daemon_id = uuid.uuid4().hex[:12]
+    for name in preload:
+        t0 = time.time()
+        try:
+            importlib.import_module(name)
+            print(f"🔥 预加载 {name} ({time.time() - t0:.1f}s)")
+        except Exception as e:
+            print(f"⚠️ 预加载 {name} 失败: {e}")
+
+    print(f"🛰️  任务守护进程启动: CPU={total_cpu} 内存={total_mem:.1f}GB 队列={DB_PATH}")
+    stop = {"flag": False}
+
+    def _stop(signum, frame):
+        stop["flag"] = True
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    while not stop["flag"]:
+        _reap(conn, daemon_id)
+        _handle_cancels(conn)
+        _schedule(conn, total_cpu, total_mem, use_fork, daemon_id)
+        time.sleep(POLL_INTERVAL)
+    # 子任务在独立会话中运行，守护进程退出后继续执行；重启后 _reap 按 pid + 启动时间确认仍在运行的才接管，
+    # 不在的 (容器重启) 重新排队
+    print("👋 守护进程退出")
+
+
+# ==========================================
+# 💻 命令行
+# ==========================================
+
+def submit(pipeline, extra_args, cpu=None, mem=None):
+    spec = PIPELINES[pipeline]
+    args = spec['args'] + list(extra_args)
+    conn = connect()
+    cur = conn.execute(
+        "INSERT INTO jobs (pipeline, args, cpu, mem, status, created) VALUES (?, ?, ?, ?, 'queued', ?)",
+        (pipeline, json.dumps(args), cpu or spec['cpu'], mem or spec['mem'], time.time())
+    )
+    return cur.lastrowid
+
+
+def _fmt_time(ts):
+    return time.strftime("%m-%d %H:%M:%S", time.localtime(ts)) if ts else "-"
+
+
+def list_jobs(limit=20):
+    conn = connect()
+    rows = conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    print(f"{'ID':>5}  {'流水线':<10} {'状态':<10} {'CPU':>4} {'MEM':>5}  {'提交':<15} {'耗时':>8}")
+    for j in reversed(rows):
+        if j['started']:
+            elapsed = f"{(j['finished'] or time.time()) - j['started']:.0f}s"
+        else:
+            elapsed = "-"
+        print(f"{j['id']:>5}  {j['pipeline']:<10} {j['status']:<10} {j['cpu']:>4g} {j['mem']:>5g}  {_fmt_time(j['created']):<15} {elapsed:>8}")
+
+
+def tail_job(job_id, follow=False):
+    conn = connect()
+    log_path = job_log_path(job_id)
+    pos = 0
+    while True:
+        job = conn.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+        if job is None:
+            print(f"❌ 任务不存在: {job_id}"); return 1
+        if os.path.exists(log_path):
+            with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+                f.seek(pos)
+                chunk = f.read()
+                pos = f.tell()
+            if chunk:
+                sys.stdout.write(chunk); sys.stdout.flush()
+        if not follow or job['status'] in FINISHED:
+            if follow:
+                print(f"\n📌 任务 #{job_id} 结束: {job['status']} (返回码 {job['returncode']})")
+            return 0 if job['status'] in ('done', 'queued', 'running') else 1
+        time.sleep(0.5)
+
+
+def cancel_job(job_id):
+    conn = connect()
+    job = conn.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+    if job is None:
+        print(f"❌ 任务不存在: {job_id}"); return
+    if job['status'] == 'queued':
+        conn.execute("UPDATE jobs SET status='cancelled', finished=? WHERE id=?", (time.time(), job_id))
+    elif job['status'] == 'running':
+        conn.execute("UPDATE jobs SET status='cancelling' WHERE id=?", (job_id,))
+    print(f"🛑 任务 #{job_id}: {job['status']} -> 取消")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ai_toolbox 常驻任务队列")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    cpus, mem_gb = detect_capacity()
+    p = sub.add_parser("daemon", help="启动调度守护进程")
+    p.add_argument("--cpus", type=float, default=cpus)
+    p.add_argument("--mem-gb", type=float, default=mem_gb)
+    p.add_argument("--preload", default=os.getenv('JOBS_PRELOAD', DEFAULT_PRELOAD),
+                   help="逗号分隔的预加载模块，留空则每个任务独立启动解释器")
+
+    p = sub.add_parser("submit", help="提交任务")
+    p.add_argument("pipeline", choices=sorted(PIPELINES))
+    p.add_argument("--cpu", type=float)
+    p.add_argument("--mem", type=float, help="内存 (GB)")
+    p.add_argument("--follow", "-f", action="store_true", help="提交后跟踪日志")
+    p.add_argument("extra", nargs=argparse.REMAINDER, help="追加给脚本的参数 (放在 -- 之后)")
+
+    p = sub.add_parser("list", help="查看任务")
+    p.add_argument("--limit", type=int, default=20)
+
+    p = sub.add_parser("tail", help="查看任务日志")
+    p.add_argument("job_id", type=int)
+    p.add_argument("--follow", "-f", action="store_true")
+
+    p = sub.add_parser("cancel", help="取消任务")
+    p.add_argument("job_id", type=int)
+
+    args = parser.parse_args()
+    if args.cmd == "daemon":
+        preload = [m.strip() for m in args.preload.split(",") if m.strip()]
+        run_daemon(args.cpus, args.mem_gb, preload)
+    elif args.cmd == "submit":
+        extra = args.extra[1:] if args.extra[:1] == ["--"] else args.extra
+        job_id = submit(args.pipeline, extra, args.cpu, args.mem)
+        print(f"📥 已提交任务 #{job_id} ({args.pipeline})")
+        if args.follow:
+            try:
+                sys.exit(tail_job(job_id, follow=True))
+            except KeyboardInterrupt:
+                print(f"\n↩️  已停止跟踪，任务 #{job_id} 仍在后台运行")
+    elif args.cmd == "list":
+        list_jobs(args.limit)
+    elif args.cmd == "tail":
+        try:
+            sys.exit(tail_job(args.job_id, args.follow))
+        except KeyboardInterrupt:
+            pass
+    elif args.cmd == "cancel":
+        cancel_job(args.job_id)
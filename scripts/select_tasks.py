@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+from common.uncertainty import load_index, selected_path, task_file
+
+# ==========================================
+# 🎯 按不确定度挑选下一批标注任务 (不重新跑模型)
+# ==========================================
+#   python /app/scripts/select_tasks.py --project 1 --top 50               # 接着上次往后取 50 个最不确定的任务
+#   python /app/scripts/select_tasks.py --project 2 --top 20 --dry-run     # 只看排名不记录
+#   python /app/scripts/select_tasks.py --project 1 --exclude export.jsonl # 跳过 Label Studio 里已标注的任务
+# 读取推理时写出的 pre_annotations_xxx.uncertainty.json，把选中的任务 (含预标注) 写成一个可直接导入的 JSON，
+# 并记到 pre_annotations_xxx.selected.json，下次从剩下的任务里继续挑。
+DATA_ROOT = os.getenv('DATA_ROOT', '/data')
+
+# 项目类型 -> 推理输出的预标注文件
+PROJECTS = {
+    "1": "outputs/pre_annotations_images.json",
+    "2": "outputs/pre_annotations_audio.json",
+    "3": "outputs/pre_annotations_video_audio.json",
+    "4": "outputs/pre_annotations_video_frames.json",
+}
+
+
+def _load_json(path, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def annotated_files(export_path):
+    """Label Studio 导出里已经有人工标注的任务"""
+    from common.ls_export import iter_tasks
+    done = set()
+    for task in iter_tasks(export_path):
+        if any(not a.get('was_cancelled') for a in task.get('annotations') or []):
+            done.add(task_file(task))
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按预标注不确定度挑选下一批标注任务")
+    parser.add_argument("--project", required=True, choices=sorted(PROJECTS), help="项目类型 1/2/3/4")
+    parser.add_argument("--pred", help="预标注文件 (默认 outputs 下对应文件)")
+    parser.add_argument("--top", type=int, default=50, help="本批挑选的任务数")
+    parser.add_argument("--min-score", type=float, default=0.0, help="不确定度低于该值的任务不选")
+    parser.add_argument("--exclude", action="append", default=[], help="Label Studio 导出文件，其中已标注的任务不选 (可重复)")
+    parser.add_argument("--out", help="输出路径 (默认 outputs/next_tasks_p<项目>_<时间>.json)")
+    parser.add_argument("--dry-run", action="store_true", help="只打印排名，不写文件、不记录")
+    parser.add_argument("--reset", action="store_true", help="清空已挑选记录，从头开始")
+    args = parser.parse_args()
+
+    pred_path = args.pred or os.path.join(DATA_ROOT, PROJECTS[args.project])
+    try:
+        index = load_index(pred_path)
+    except (OSError, ValueError):
+        print(f"❌ 找不到不确定度索引，请先运行推理生成: {pred_path}")
+        sys.exit(1)
+
+    sel_path = selected_path(pred_path)
+    if args.reset and os.path.exists(sel_path) and not args.dry_run:
+        os.remove(sel_path)
+    selected = set(_load_json(sel_path, []))
+    skip = set(selected)
+    for path in args.exclude:
+        skip |= annotated_files(path)
+
+    # 索引已按分数降序
+    picked = [e for e in index["tasks"] if e["file"] not in skip and e["score"] >= args.min_score][:args.top]
+    remaining = sum(e["file"] not in skip for e in index["tasks"]) - len(picked)
+    print(f"📋 {os.path.basename(pred_path)}: 共 {len(index['tasks'])} 个任务 ({index['metric']})，"
+          f"已挑选 {len(selected)}，本批 {len(picked)}，剩余 {remaining}")
+    for rank, e in enumerate(picked[:10], 1):
+        print(f"   {rank:>3}. {e['score']:.3f}  {e['file']}")
+    if len(picked) > 10:
+        print(f"   ... 本批最低分 {picked[-1]['score']:.3f}")
+    if not picked or args.dry_run:
+        return
+
+    files = {e["file"] for e in picked}
+    tasks = [t for t in _load_json(pred_path, []) if task_file(t) in files]
+    # 导入顺序与不确定度一致
+    order = {e["file"]: i for i, e in enumerate(picked)}
+    tasks.sort(key=lambda t: order[task_file(t)])
+    out = args.out or os.path.join(DATA_ROOT, "outputs", f"next_tasks_p{args.project}_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(tasks, f, indent=2, ensure_ascii=False)
+    with open(sel_path, 'w', encoding='utf-8') as f:
+        json.dump(sorted(selected | files), f, ensure_ascii=False)
+    print(f"✅ 已写出 {len(tasks)} 个任务 -> {out}\n👉 在 Label Studio 对应项目中 Import 该文件")
+
+
+if __name__ == "__main__":
+    main()
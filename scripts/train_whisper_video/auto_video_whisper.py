@@ -1,19 +1,26 @@
 import os
 import sys
-import json
 import argparse
-from label_studio_sdk.client import LabelStudio
 
 sys.stdout.reconfigure(line_buffering=True)
-WORK_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 由任务队列 (jobs.py) 调度时使用独立工作目录，多个任务可并发
+WORK_DIR = os.getenv('JOB_WORK_DIR') or SCRIPT_DIR
 os.chdir(WORK_DIR)
 print(f"📂 P3 工作目录: {WORK_DIR}")
 
 LS_URL = os.getenv('LS_URL', 'http://localhost:8080')
 API_KEY = os.getenv('LS_API_KEY', '')
-EXPORT_PATH = os.path.abspath("./project_export.json")
+EXPORT_PATH = os.path.abspath("./project_export.jsonl")
+
+sys.path.insert(0, os.path.dirname(SCRIPT_DIR))
+from common.ls_export import export_tasks_jsonl
+from common import metrics
+from common import mem_budget
 
 def run_pipeline(project_id):
+    from label_studio_sdk.client import LabelStudio
+
     print(f"🔌 连接 Label Studio: {LS_URL}")
     try:
         client = LabelStudio(base_url=LS_URL, api_key=API_KEY)
@@ -23,23 +30,29 @@ def run_pipeline(project_id):
 
     print(f"🎣 导出项目 {project_id}...")
     try:
-        tasks = list(client.projects.exports.as_json(project_id))
-        with open(EXPORT_PATH, 'w', encoding='utf-8') as f:
-            json.dump(tasks, f, ensure_ascii=False, indent=4)
-        print(f"✅ 导出 {len(tasks)} 条数据")
+        with metrics.span("ls_export"):
+            total = export_tasks_jsonl(client, project_id, EXPORT_PATH)
+        print(f"✅ 导出 {total} 条数据")
     except Exception as e:
         print(f"❌ 导出失败: {e}"); return
 
     python_exe = sys.executable
     print("✂️  调用数据准备 (prepare_data.py)...")
-    if os.system(f"{python_exe} prepare_data.py") != 0:
+    with metrics.span("prepare_data"):
+        rc = os.system(f'{python_exe} "{os.path.join(SCRIPT_DIR, "prepare_data.py")}"')
+    if rc != 0:
         print("❌ 数据准备失败"); return
 
     print("🔥 调用微调 (train_whisper.py)...")
-    os.system(f"{python_exe} train_whisper.py")
+    with metrics.span("train"):
+        os.system(f'{python_exe} "{os.path.join(SCRIPT_DIR, "train_whisper.py")}"')
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--project_id", type=int, default=3)
+    mem_budget.add_cli_args(parser)
     args = parser.parse_args()
+    metrics.setup("auto_video_whisper")
+    # train_whisper.py 由 os.system 拉起，预算经环境变量传过去
+    mem_budget.export_budget(args.memory_budget)
     run_pipeline(args.project_id)
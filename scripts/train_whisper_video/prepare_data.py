@@ -1,18 +1,19 @@
-import json
+import csv
 import os
 import sys
-import pandas as pd
-from pydub import AudioSegment
-from tqdm import tqdm
 import urllib.parse 
 
 sys.stdout.reconfigure(line_buffering=True)
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.ls_export import iter_tasks, resolve_export_path
+from common.uncertainty import task_file
+
 # ==========================================
 # ⚙️ Docker 路径配置
 # ==========================================
 DATA_ROOT = os.getenv('DATA_ROOT', '/data')
-EXPORT_FILE = "./project_export.json" 
+EXPORT_FILE = "./project_export.jsonl" 
 # 指向 project_data/video_audio
 AUDIO_DIR = os.path.join(DATA_ROOT, "video_audio")  
 OUTPUT_DIR = "./dataset"
@@ -23,60 +24,72 @@ def prepare_dataset():
         os.makedirs(OUTPUT_DIR)
         os.makedirs(os.path.join(OUTPUT_DIR, "audio"))
 
-    if not os.path.exists(EXPORT_FILE):
+    export_file = resolve_export_path(EXPORT_FILE)
+    if not export_file:
         print(f"❌ 错误：找不到 {EXPORT_FILE}")
         return
 
-    with open(EXPORT_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    from pydub import AudioSegment
+    from tqdm import tqdm
+
+    # 逐条读取任务、逐行写出 metadata，内存占用与项目大小无关
+    meta_path = os.path.join(OUTPUT_DIR, "metadata.csv")
+    with open(meta_path, 'w', encoding='utf-8', newline='') as meta_file:
+        writer = csv.writer(meta_file)
+        writer.writerow(["file_name", "sentence"])
+        count = 0
+        print(f"✂️  开始处理 P3 任务 (音频源: {AUDIO_DIR})...")
 
-    metadata = []
-    print(f"✂️  开始处理 P3 任务 (音频源: {AUDIO_DIR})...")
+        for task in tqdm(iter_tasks(export_file), unit="task"):
+            audio_url = task.get('data', {}).get('audio', '')
+            if not audio_url: continue
 
-    for task in tqdm(data):
-        audio_url = task.get('data', {}).get('audio', '')
-        if not audio_url: continue
+            decoded_url = urllib.parse.unquote(audio_url)
+            fname = os.path.basename(decoded_url).split('?')[0]
+            audio_path = os.path.join(AUDIO_DIR, fname)
+            # 合并流水线 (video_pipeline.py) 的任务直接指向 videos/ 下的原视频: 按 URL 里的相对路径找，
+            # pydub 通过 ffmpeg 直接解出视频里的音轨
+            direct_path = os.path.join(DATA_ROOT, task_file({"data": {"audio": decoded_url}}))
+            if not os.path.exists(audio_path) and os.path.isfile(direct_path):
+                audio_path = direct_path
 
-        decoded_url = urllib.parse.unquote(audio_url)
-        fname = os.path.basename(decoded_url).split('?')[0]
-        audio_path = os.path.join(AUDIO_DIR, fname)
-        
-        if not os.path.exists(audio_path):
-            found = False
-            for root, _, files in os.walk(AUDIO_DIR):
-                if fname in files:
-                    audio_path = os.path.join(root, fname); found = True; break
-            if not found: continue
+            if not os.path.exists(audio_path):
+                found = False
+                for root, _, files in os.walk(AUDIO_DIR):
+                    if fname in files:
+                        audio_path = os.path.join(root, fname); found = True; break
+                if not found: continue
 
-        try:
-            audio = AudioSegment.from_file(audio_path)
-            for ann in task.get('annotations', []):
-                for res in ann.get('result', []):
-                    if res.get('type') == 'textarea':
-                        text = res.get('value', {}).get('text', [''])[0].strip()
-                        if not text or "正在转写" in text: continue
+            try:
+                audio = AudioSegment.from_file(audio_path)
+                for ann in task.get('annotations', []):
+                    for res in ann.get('result', []):
+                        if res.get('type') == 'textarea':
+                            text = res.get('value', {}).get('text', [''])[0].strip()
+                            if not text or "正在转写" in text: continue
                         
-                        # 智能判断时间
-                        if 'start' in res['value'] and 'end' in res['value']:
-                            start_ms = res['value']['start'] * 1000
-                            end_ms = res['value']['end'] * 1000
-                        else:
-                            start_ms = 0
-                            end_ms = len(audio)
+                            # 智能判断时间
+                            if 'start' in res['value'] and 'end' in res['value']:
+                                start_ms = res['value']['start'] * 1000
+                                end_ms = res['value']['end'] * 1000
+                            else:
+                                start_ms = 0
+                                end_ms = len(audio)
                         
-                        chunk_name = f"task{task['id']}_{res['id']}.wav"
-                        save_path = os.path.join(OUTPUT_DIR, "audio", chunk_name)
+                            chunk_name = f"task{task['id']}_{res['id']}.wav"
+                            save_path = os.path.join(OUTPUT_DIR, "audio", chunk_name)
                         
-                        audio[start_ms:end_ms].export(save_path, format="wav")
-                        metadata.append({"file_name": f"audio/{chunk_name}", "sentence": text})
+                            audio[start_ms:end_ms].export(save_path, format="wav")
+                            writer.writerow([f"audio/{chunk_name}", text])
+                            count += 1
 
-        except Exception as e:
-            print(f"⚠️ 错误: {e}")
+            except Exception as e:
+                print(f"⚠️ 错误: {e}")
 
-    if metadata:
-        pd.DataFrame(metadata).to_csv(os.path.join(OUTPUT_DIR, "metadata.csv"), index=False)
-        print(f"✅ 成功生成 {len(metadata)} 条训练数据！")
+    if count:
+        print(f"✅ 成功生成 {count} 条训练数据！")
     else:
+        os.remove(meta_path)
         print("❌ 未提取到数据。")
 
 if __name__ == "__main__":
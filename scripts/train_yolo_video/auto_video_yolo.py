@@ -1,13 +1,15 @@
 import os
 import sys
 import json
+import time
 import shutil
 import argparse
 from urllib.parse import unquote
-import torch
 
 sys.stdout.reconfigure(line_buffering=True)
-WORK_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 由任务队列 (jobs.py) 调度时使用独立工作目录，多个任务可并发
+WORK_DIR = os.getenv('JOB_WORK_DIR') or SCRIPT_DIR
 os.chdir(WORK_DIR)
 print(f"📂 P4 工作目录: {WORK_DIR}")
 
@@ -20,11 +22,25 @@ DATA_ROOT = os.getenv('DATA_ROOT', '/data')
 SOURCE_IMG_ROOT = os.path.join(DATA_ROOT, "video_frames")
 DATASET_DIR = os.path.abspath("datasets")
 YAML_PATH = os.path.abspath("data.yaml")
-
-try:
-    from label_studio_sdk.client import LabelStudio
-except ImportError:
-    sys.exit(1)
+EXPORT_PATH = os.path.abspath("project_export.jsonl")
+RUN_NAME = 'run_video_v1'
+FULL_EPOCHS = 50
+JOBS_ROOT = os.getenv('JOBS_ROOT', os.path.join(DATA_ROOT, "jobs"))
+# 增量训练的热启动候选: 历次训练 (含任务队列工作目录) 的 run_video_v*/weights/best.pt，取最新
+WARM_START = [
+    os.path.join(WORK_DIR, "run_video_v*/weights/best.pt"),
+    os.path.join(SCRIPT_DIR, "run_video_v*/weights/best.pt"),
+    os.path.join(JOBS_ROOT, "job_*/run_video_v*/weights/best.pt"),
+]
+STATE_NAME = "p4"
+
+sys.path.insert(0, os.path.dirname(SCRIPT_DIR))
+from common.ls_export import export_tasks_jsonl, iter_tasks
+from common import metrics
+from common import incremental_train
+from common import mem_budget
+from common.yolo_dataset import add_sample, oversample, attach_epoch_timer, report_epoch_times
+from common.yolo_shards import ShardWriter, write_data_yaml
 
 CLASS_MAP = {"defect": 0, "scratch": 1}
 
@@ -45,7 +61,12 @@ def convert_ls_to_yolo(ls_result, img_width, img_height):
         yolo_lines.append(f"{class_id} {x_center:.6f} {y_center:.6f} {w_norm:.6f} {h_norm:.6f}")
     return yolo_lines
 
-def run_pipeline(project_id):
+def run_pipeline(project_id, imgsz=640, use_cache=True, train_opts=None, dataset_format="files"):
+    try:
+        from label_studio_sdk.client import LabelStudio
+    except ImportError:
+        sys.exit(1)
+
     print(f"🔌 连接 Label Studio: {LS_URL}")
     try:
         client = LabelStudio(base_url=LS_URL, api_key=API_KEY)
@@ -55,18 +76,23 @@ def run_pipeline(project_id):
 
     print(f"🎣 导出项目 {project_id}...")
     try:
-        tasks = list(client.projects.exports.as_json(project_id))
-        print(f"✅ {len(tasks)} 条任务")
+        with metrics.span("ls_export"):
+            total = export_tasks_jsonl(client, project_id, EXPORT_PATH)
+        print(f"✅ {total} 条任务")
     except Exception as e:
         print(f"❌ 导出失败: {e}"); return
 
     if os.path.exists(DATASET_DIR): shutil.rmtree(DATASET_DIR)
-    for d in ["images/train", "labels/train", "images/val", "labels/val"]:
+    # 分片格式: 样本直接追加进大 tar 分片，不落成一个个小文件
+    writer = ShardWriter(DATASET_DIR) if dataset_format == "shards" else None
+    for d in ([] if writer else ["images/train", "labels/train", "images/val", "labels/val"]):
         os.makedirs(os.path.join(DATASET_DIR, d), exist_ok=True)
 
-    print("✂️  转换数据...")
+    print("✂️  转换数据..." + (f" (预缩放缓存 imgsz={imgsz})" if use_cache else ""))
     count = 0
-    for task in tasks:
+    samples = {}
+    imgsz_cache = imgsz if use_cache else None
+    for task in iter_tasks(EXPORT_PATH):
         img_url = task.get('data', {}).get('image', '')
         if not img_url: continue
         fname = os.path.basename(unquote(img_url).split('?')[0])
@@ -83,39 +109,100 @@ def run_pipeline(project_id):
         
         yolo_data = convert_ls_to_yolo(res, orig_w, orig_h)
         if yolo_data:
-            txt_name = os.path.splitext(fname)[0] + ".txt"
-            for split in ['train', 'val']:
-                shutil.copy(src_path, os.path.join(DATASET_DIR, f"images/{split}", fname))
-                with open(os.path.join(DATASET_DIR, f"labels/{split}", txt_name), "w") as f:
-                    f.write("\n".join(yolo_data))
-            count += 1
+            with metrics.span("dataset_build"):
+                if writer:
+                    added = writer.add(src_path, fname, yolo_data, imgsz=imgsz_cache)
+                else:
+                    added = add_sample(DATASET_DIR, src_path, fname, yolo_data, imgsz=imgsz_cache)
+            if added:
+                count += 1
+                samples[added] = incremental_train.label_digest(yolo_data)
+                metrics.count("samples")
 
     print(f"📊 样本数: {count}")
     if count == 0: return
 
+    new = incremental_train.new_samples(STATE_NAME, samples)
+    incremental = bool(train_opts and train_opts.incremental)
+    warm = incremental_train.find_warm_start(WARM_START) if incremental else None
+    if incremental and not warm:
+        print("⚠️ 没有可热启动的权重，改为全量训练")
+        incremental = False
+    if incremental and not new:
+        print(f"✅ 没有新增或修改过的样本，当前模型已是最新: {warm}"); return
+    if incremental and len(new) < len(samples):
+        if writer:
+            dup = writer.oversample(new, train_opts.new_repeat)
+        else:
+            dup = oversample(DATASET_DIR, new, train_opts.new_repeat)
+        print(f"🆕 新样本 {len(new)} 个，train 中各放 {train_opts.new_repeat} 份 (+{dup})")
+
+    if writer:
+        with metrics.span("dataset_build"):
+            writer.close()
+
     # 生成 YAML
-    with open(YAML_PATH, 'w') as f:
-        f.write(f"path: {DATASET_DIR}\ntrain: images/train\nval: images/val\nnc: {len(CLASS_MAP)}\nnames:\n")
-        for name, idx in CLASS_MAP.items():
-            f.write(f"  {idx}: {name}\n")
+    write_data_yaml(YAML_PATH, DATASET_DIR, CLASS_MAP, shards=writer is not None)
 
     # 内置训练逻辑
     print("🔥 启动 YOLO 训练...")
-    device = 0 if torch.cuda.is_available() else 'cpu'
+    import torch
     from ultralytics import YOLO
+    device = 0 if torch.cuda.is_available() else 'cpu'
     
-    # 优先加载离线模型
+    # 增量训练从最新的 best.pt 热启动，否则优先加载离线模型
     local_model = "/app/models/yolov8n.pt"
     model_path = local_model if os.path.exists(local_model) else "yolov8n.pt"
-    
+    if incremental:
+        print(f"🔁 增量训练，热启动: {warm} (新样本 {len(new)} / {len(samples)})")
+        model_path = warm
+
     model = YOLO(model_path)
-    model.train(
-        data=YAML_PATH, epochs=50, imgsz=640, project='.', name='run_video_v1',
-        exist_ok=True, device=device
-    )
+    epoch_times = attach_epoch_timer(model)
+    curve = incremental_train.attach_map_curve(model)
+    if train_opts:
+        train_opts.incremental = incremental
+        train_args = incremental_train.train_kwargs(train_opts, FULL_EPOCHS)
+    else:
+        train_args = {"epochs": FULL_EPOCHS}
+    if writer:
+        # 分片格式由自定义 trainer 读取 (按分片顺序大块读入)
+        from common.yolo_shard_loader import ShardTrainer
+        train_args["trainer"] = ShardTrainer
+    # 按内存预算选 batch (不设预算时用 ultralytics 默认值)；训练中途分配失败时 batch 减半从头重训
+    budget = mem_budget.parse_budget(getattr(train_opts, "memory_budget", None), device)
+    batch = mem_budget.fit_batch(budget, device, lambda: mem_budget.yolo_train_probe(model, imgsz, device),
+                                 "YOLO 训练", default=None)
+
+    def _train(b):
+        del epoch_times[:], curve[:]
+        return model.train(
+            data=YAML_PATH, imgsz=imgsz, project='.', name=RUN_NAME,
+            exist_ok=True, device=device, **train_args, **({"batch": b} if b else {})
+        )
+
+    t0 = time.time()
+    with metrics.span("train"):
+        if budget:
+            _, batch = mem_budget.retry_batches(_train, batch, device, "YOLO 训练")
+            print(f"⚙️  训练 batch={batch}")
+        else:
+            _train(None)
+    report_epoch_times(epoch_times)
+    incremental_train.save_trained_samples(STATE_NAME, samples)
+    incremental_train.record_run(STATE_NAME, "incremental" if incremental else "full", curve, time.time() - t0,
+                                 weights=getattr(model.trainer, "best", None), samples=len(samples), new=len(new))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--project_id", type=int, default=4)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--no-cache", action="store_true", help="直接复制原图，不做预缩放")
+    parser.add_argument("--format", choices=["files", "shards"], default=os.getenv('YOLO_DATASET_FORMAT', 'files'),
+                        help="shards: 图片和标签打包成大 tar 分片，网络盘上训练时顺序读取")
+    incremental_train.add_cli_args(parser)
+    mem_budget.add_cli_args(parser)
     args = parser.parse_args()
-    run_pipeline(args.project_id)
+    metrics.setup("auto_video_yolo")
+    run_pipeline(args.project_id, imgsz=args.imgsz, use_cache=not args.no_cache, train_opts=args,
+                 dataset_format=args.format)
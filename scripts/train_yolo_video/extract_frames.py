@@ -0,0 +1,246 @@
+import os
+import sys
+import glob
+import json
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.video_reader import VideoReader
+from common import metrics
+
+# 🚨 强制开启实时日志
+sys.stdout.reconfigure(line_buffering=True)
+
+# ==========================================
+# ⚙️ Docker 适配配置
+# ==========================================
+DATA_ROOT = os.getenv('DATA_ROOT', '/data')
+# 输入: project_data/videos  输出: project_data/video_frames (P4 推理/训练读取的目录)
+VIDEO_DIR = os.path.join(DATA_ROOT, "videos")
+FRAME_DIR = os.path.join(DATA_ROOT, "video_frames")
+# 每帧来源记录 (一行一帧: 帧文件、源视频、帧号、时间戳)
+MANIFEST_PATH = os.path.join(FRAME_DIR, "frames_manifest.jsonl")
+# 断点续抽的进度文件
+STATE_DIR = os.path.join(FRAME_DIR, ".extract_state")
+VIDEO_EXTS = ['*.mp4', '*.avi', '*.mov', '*.mkv']
+
+# 场景变化打分用的缩略图尺寸 (宽, 高) 和直方图桶数
+THUMB_SIZE = (64, 36)
+HIST_BINS = 32
+JPEG_QUALITY = 95
+# ==========================================
+
+
+def _thumb(frame):
+    import cv2
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, THUMB_SIZE, interpolation=cv2.INTER_AREA)
+
+
+def scene_score(thumb_a, thumb_b):
+    """场景变化分数 (0~1): 像素平均差 与 灰度直方图 L1 距离 取较大者"""
+    import numpy as np
+    a = thumb_a.astype(np.float32)
+    b = thumb_b.astype(np.float32)
+    pixel = np.abs(a - b).mean() / 255.0
+    step = 256 // HIST_BINS
+    ha = np.bincount((thumb_a // step).ravel(), minlength=HIST_BINS)
+    hb = np.bincount((thumb_b // step).ravel(), minlength=HIST_BINS)
+    hist = np.abs(ha - hb).sum() / (2.0 * thumb_a.size)
+    return float(max(pixel, hist))
+
+
+def keyframe_times(video_path):
+    """用 ffprobe 只解析关键帧的时间戳 (不解码其余帧)"""
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0", "-skip_frame", "nokey",
+        "-show_entries", "frame=pts_time,best_effort_timestamp_time", "-of", "csv=p=0", video_path
+    ]
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+    times = []
+    for line in out.splitlines():
+        for field in line.split(','):
+            try:
+                times.append(float(field)); break
+            except ValueError:
+                continue
+    return times
+
+
+def _state_path(video_path):
+    return os.path.join(STATE_DIR, os.path.basename(video_path) + ".json")
+
+
+def _purge_frames(rel_video):
+    """删除某个视频此前写出的帧，并从 frames_manifest.jsonl 去掉它的记录"""
+    if not os.path.exists(MANIFEST_PATH):
+        return 0
+    removed = 0
+    with open(MANIFEST_PATH, 'r', encoding='utf-8') as src, \
+            open(MANIFEST_PATH + ".tmp", 'w', encoding='utf-8') as dst:
+        for line in src:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                rec = None
+            if rec and rec.get("video") == rel_video:
+                try:
+                    os.remove(os.path.join(FRAME_DIR, rec["frame_file"]))
+                except FileNotFoundError:
+                    pass
+                removed += 1
+                continue
+            dst.write(line)
+    os.replace(MANIFEST_PATH + ".tmp", MANIFEST_PATH)
+    return removed
+
+
+def _load_state(video_path, params):
+    st = os.stat(video_path)
+    sig = {"size": st.st_size, "mtime": int(st.st_mtime), "params": params}
+    path = _state_path(video_path)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            state = json.load(f)
+        if state.get("sig") == sig:
+            return state
+        # 视频文件或抽帧参数变了: 旧帧已不对应当前结果，先清掉再从头抽
+        removed = _purge_frames(os.path.relpath(video_path, DATA_ROOT))
+        os.remove(path)
+        print(f"🧹 {os.path.basename(video_path)}: 视频或参数已变化，删除旧帧 {removed} 张")
+    return {"sig": sig, "next_frame": 0, "written": 0, "last_file": None, "done": False}
+
+
+def _save_state(video_path, state):
+    path = _state_path(video_path)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def extract_video(video_path, mode, stride, threshold, min_gap, max_gap):
+    import cv2
+
+    params = {"mode": mode, "stride": stride, "threshold": threshold, "min_gap": min_gap, "max_gap": max_gap}
+    state = _load_state(video_path, params)
+    name = os.path.basename(video_path)
+    if state["done"]:
+        print(f"⏭️  已完成，跳过: {name} ({state['written']} 帧)")
+        return 0, state["written"]
+
+    # 抽出的帧要给标注/训练用，保持原分辨率；解码放在后台线程，与打分、JPEG 编码并行
+    start = state["next_frame"]
+    if mode == "stride":
+        # 向上对齐到跳帧网格，避免重复写出上次的最后一帧
+        start = -(-start // stride) * stride
+    reader = VideoReader(video_path, stride=stride if mode == "stride" else 1, start=start)
+    if not reader.opened:
+        print(f"❌ 无法打开视频: {video_path}")
+        return 0, 0
+    fps, total = reader.fps, reader.total
+    stem = os.path.splitext(name)[0]
+    rel_video = os.path.relpath(video_path, DATA_ROOT)
+
+    def _write(frame, idx, t):
+        fname = f"{stem}_f{idx:07d}.jpg"
+        with metrics.span("write_frame"):
+            cv2.imwrite(os.path.join(FRAME_DIR, fname), frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        manifest.write(json.dumps({"frame_file": fname, "video": rel_video, "frame_index": idx,
+                                   "time": round(t, 3)}, ensure_ascii=False) + "\n")
+        manifest.flush()
+        state["written"] += 1
+        metrics.count("frames_written")
+        state["last_file"] = fname
+        state["next_frame"] = idx + 1
+        _save_state(video_path, state)
+
+    if start:
+        print(f"🔁 断点续抽: {name} 从第 {start} 帧继续 (已写出 {state['written']} 帧)")
+    decoded = 0
+
+    # 按视频打开 manifest: _load_state 清理旧记录时不会有句柄指向被替换的文件
+    with open(MANIFEST_PATH, 'a', encoding='utf-8') as manifest:
+        if mode == "keyframe":
+            # 只跳转到关键帧位置解码，其余帧完全不解码
+            cap = cv2.VideoCapture(video_path)
+            for t in keyframe_times(video_path):
+                idx = int(round(t * fps)) if fps > 0 else 0
+                if idx < start: continue
+                cap.set(cv2.CAP_PROP_POS_MSEC, t * 1000)
+                ok, frame = cap.read()
+                if not ok: continue
+                decoded += 1
+                _write(frame, idx, t)
+            cap.release()
+        else:
+            last_thumb, last_idx = None, -max_gap
+            if mode == "scene" and state["last_file"]:
+                prev = cv2.imread(os.path.join(FRAME_DIR, state["last_file"]))
+                if prev is not None:
+                    last_thumb, last_idx = _thumb(prev), start - 1
+            for idx, frame in reader:
+                decoded += 1
+                t = idx / fps if fps > 0 else 0.0
+                if mode == "stride":
+                    _write(frame, idx, t)
+                else:
+                    with metrics.span("scene_score"):
+                        thumb = _thumb(frame)
+                        gap = idx - last_idx
+                        changed = last_thumb is None or gap >= max_gap or (
+                            gap >= min_gap and scene_score(thumb, last_thumb) >= threshold)
+                    if changed:
+                        _write(frame, idx, t)
+                        last_thumb, last_idx = thumb, idx
+                metrics.step()
+                if decoded % 2000 == 0:
+                    print(f"   {name}: {idx + 1}/{total} 帧, 已写出 {state['written']}")
+            print(f"   {name}: 解码 {reader.decode_fps:.1f} fps ({reader.backend})")
+
+    state["done"] = True
+    _save_state(video_path, state)
+    ratio = total / max(state["written"], 1)
+    print(f"✅ {name}: 共 {total} 帧 -> 写出 {state['written']} 帧 (约 1/{ratio:.0f})")
+    return total, state["written"]
+
+
+def run_extract(mode, stride, threshold, min_gap, max_gap):
+    if not os.path.exists(VIDEO_DIR):
+        print(f"❌ 视频目录不存在: {VIDEO_DIR}")
+        return
+    files = []
+    for ext in VIDEO_EXTS:
+        files.extend(glob.glob(os.path.join(VIDEO_DIR, ext)))
+    if not files:
+        print(f"❌ 未找到视频文件: {VIDEO_DIR}")
+        return
+
+    os.makedirs(FRAME_DIR, exist_ok=True)
+    os.makedirs(STATE_DIR, exist_ok=True)
+    print(f"🎞️  抽帧模式: {mode}，共 {len(files)} 个视频 -> {FRAME_DIR}")
+    total_frames, total_written = 0, 0
+    for v_path in sorted(files):
+        try:
+            n, w = extract_video(v_path, mode, stride, threshold, min_gap, max_gap)
+        except Exception as e:
+            print(f"⚠️ 抽帧失败 {os.path.basename(v_path)}: {e}")
+            continue
+        total_frames += n
+        total_written += w
+    print("-" * 30)
+    print(f"🎉 抽帧完成: 视频总帧数 {total_frames}，写出 {total_written} 帧")
+    print(f"📄 帧来源记录: {MANIFEST_PATH}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="P4 视频抽帧 (project_data/videos -> video_frames)")
+    parser.add_argument("--mode", choices=["scene", "stride", "keyframe"], default="scene")
+    parser.add_argument("--stride", type=int, default=30, help="stride 模式: 每 N 帧取一帧")
+    parser.add_argument("--threshold", type=float, default=0.12, help="scene 模式: 场景变化分数阈值 (0~1)")
+    parser.add_argument("--min-gap", type=int, default=5, help="scene 模式: 两帧之间最少间隔帧数")
+    parser.add_argument("--max-gap", type=int, default=300, help="scene 模式: 画面不变时最多隔多少帧也取一帧")
+    metrics.add_cli_args(parser)
+    args = parser.parse_args()
+    metrics.setup("extract_frames", args)
+    run_extract(args.mode, max(1, args.stride), args.threshold, args.min_gap, args.max_gap)
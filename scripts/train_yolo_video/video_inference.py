@@ -1,8 +1,13 @@
 import os
+import copy
 import glob
 import json
 import sys
-from ultralytics import YOLO
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import metrics
 
 # 🚨 强制开启实时日志
 sys.stdout.reconfigure(line_buffering=True)
@@ -12,13 +17,14 @@ sys.stdout.reconfigure(line_buffering=True)
 # ==========================================
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_ROOT = os.getenv('DATA_ROOT', '/data')  # 从环境变量读取
+# jobs.py 任务队列的工作目录 (P4 训练结果也可能在这里)
+JOBS_ROOT = os.getenv('JOBS_ROOT', os.path.join(DATA_ROOT, "jobs"))
 
 # 1. 图片路径 (对应 project_data/video_frames)
 IMAGE_FOLDER = os.path.join(DATA_ROOT, "video_frames")
 
 # 2. 输出文件 (建议放在 outputs 目录)
 OUTPUT_DIR = os.path.join(DATA_ROOT, "outputs")
-os.makedirs(OUTPUT_DIR, exist_ok=True)
 OUTPUT_JSON = os.path.join(OUTPUT_DIR, "pre_annotations_video.json")
 
 # 3. 标签映射
@@ -26,36 +32,105 @@ LABELS_MAP = {0: "defect", 1: "scratch"}
 
 # 4. Label Studio 本地文件前缀
 LS_URL_PREFIX = "/data/local-files/?d=/data/"
+
+# 5. 近重复帧去重: dHash 缓存文件 和 默认汉明距离阈值 (64 位中允许不同的位数)
+HASH_CACHE = os.path.join(IMAGE_FOLDER, ".dhash_cache.json")
+DEDUP_THRESHOLD = 4
 # ==========================================
 
 def get_best_model():
     """自动寻找最佳模型"""
     # 优先找 Docker 里的训练结果
     candidates = glob.glob(os.path.join(BASE_DIR, "run_video_v*/weights/best.pt"))
+    candidates += glob.glob(os.path.join(JOBS_ROOT, "job_*/run_video_v*/weights/best.pt"))
     if not candidates: return None
     return max(candidates, key=os.path.getmtime)
 
-def run_inference():
+def compute_dhashes(image_files):
+    """计算每张图的 64 位 dHash (9x8 灰度缩略图的水平梯度符号)，按 文件大小+mtime 缓存到磁盘"""
+    import cv2
+    import numpy as np
+
+    cache = {}
+    if os.path.exists(HASH_CACHE):
+        try:
+            with open(HASH_CACHE, 'r') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+
+    hashes, todo, thumbs = {}, [], []
+    for path in image_files:
+        st = os.stat(path)
+        key = os.path.basename(path)
+        entry = cache.get(key)
+        if entry and entry[0] == st.st_size and entry[1] == int(st.st_mtime):
+            hashes[path] = int(entry[2], 16)
+            continue
+        # 解码时直接 1/8 降采样，不做完整解码
+        gray = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        if gray is None: continue
+        thumbs.append(cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA))
+        todo.append((path, key, st))
+
+    if todo:
+        # 所有新图一次性向量化比较，再打包成 64 位整数
+        stack = np.stack(thumbs).astype(np.int16)
+        bits = (stack[:, :, 1:] > stack[:, :, :-1]).reshape(len(todo), 64)
+        packed = np.packbits(bits, axis=1).view('>u8').ravel()
+        for (path, key, st), h in zip(todo, packed.tolist()):
+            hashes[path] = h
+            cache[key] = [st.st_size, int(st.st_mtime), f"{h:016x}"]
+        with open(HASH_CACHE + ".tmp", 'w') as f:
+            json.dump(cache, f)
+        os.replace(HASH_CACHE + ".tmp", HASH_CACHE)
+    return hashes, len(todo)
+
+def group_near_duplicates(image_files, hashes, threshold):
+    """按文件顺序把相邻的近重复帧归为一组，返回 {帧路径: 代表帧路径}"""
+    rep_of = {}
+    rep, rep_hash = None, None
+    for path in image_files:
+        h = hashes.get(path)
+        if h is None:
+            rep_of[path] = path
+            continue
+        # 与组代表帧 (而不是上一帧) 比较，缓慢漂移的画面也会及时开新组
+        if rep is not None and (h ^ rep_hash).bit_count() <= threshold:
+            rep_of[path] = rep
+        else:
+            rep, rep_hash = path, h
+            rep_of[path] = path
+    return rep_of
+
+def _to_predictions(results):
+    predictions = []
+    for r in results:
+        for box in r.boxes:
+            cls_id = int(box.cls[0])
+            label_name = LABELS_MAP.get(cls_id)
+            if not label_name: continue
+
+            x, y, w, h = box.xywhn[0].tolist()
+            predictions.append({
+                "from_name": "label",
+                "to_name": "image",
+                "type": "rectanglelabels",
+                "value": {
+                    "x": (x - w / 2) * 100, "y": (y - h / 2) * 100,
+                    "width": w * 100, "height": h * 100,
+                    "rectanglelabels": [label_name]
+                },
+                "score": float(box.conf[0])
+            })
+    return predictions
+
+def run_inference(dedup_threshold=DEDUP_THRESHOLD):
     print("-" * 40)
     print("🎬 启动视频专用推理 (Docker版)")
     print("-" * 40)
 
-    # 1. 加载模型
-    model_path = get_best_model()
-    if model_path:
-        print(f"✅ 使用训练模型: {os.path.relpath(model_path, BASE_DIR)}")
-        model = YOLO(model_path)
-    else:
-        # 如果没训练过，尝试使用预置的基础模型
-        fallback = "/app/models/yolov8n.pt"
-        if os.path.exists(fallback):
-            print(f"⚠️ 使用基础模型: {fallback}")
-            model = YOLO(fallback)
-        else:
-            print("⚠️ 下载官方 yolov8n.pt...")
-            model = YOLO('yolov8n.pt')
-
-    # 2. 扫描图片
+    # 1. 扫描图片 (目录为空时不必加载模型)
     if not os.path.exists(IMAGE_FOLDER):
         print(f"❌ 错误：找不到图片目录 {IMAGE_FOLDER}")
         return
@@ -69,35 +144,67 @@ def run_inference():
     if not image_files:
         print(f"❌ 目录为空: {IMAGE_FOLDER}")
         return
+    # 按文件名排序，同一视频抽出的帧保持时间顺序
+    image_files.sort()
+
+    if dedup_threshold >= 0:
+        t0 = time.time()
+        with metrics.span("dhash"):
+            hashes, fresh = compute_dhashes(image_files)
+            rep_of = group_near_duplicates(image_files, hashes, dedup_threshold)
+        n_rep = sum(1 for p, r in rep_of.items() if p == r)
+        print(f"🔎 dHash 去重: {len(image_files)} 帧 -> {n_rep} 个代表帧 "
+              f"(新计算 {fresh} 个哈希, {time.time() - t0:.1f}s)")
+    else:
+        rep_of = {p: p for p in image_files}
 
+    # 2. 加载模型
+    t_load = time.perf_counter()
+    from ultralytics import YOLO
+    model_path = get_best_model()
+    if model_path:
+        print(f"✅ 使用训练模型: {model_path}")
+        model = YOLO(model_path)
+    else:
+        # 如果没训练过，尝试使用预置的基础模型
+        fallback = "/app/models/yolov8n.pt"
+        if os.path.exists(fallback):
+            print(f"⚠️ 使用基础模型: {fallback}")
+            model = YOLO(fallback)
+        else:
+            print("⚠️ 下载官方 yolov8n.pt...")
+            model = YOLO('yolov8n.pt')
+
+    metrics.observe("model_load", time.perf_counter() - t_load)
     print(f"🖼️  正在处理 {len(image_files)} 张图片...")
 
-    # 3. 执行推理
+    # 3. 执行推理 (只对代表帧跑模型，组内其他帧复制代表帧的预测)
+    #    代表帧推理失败时，组内下一帧顶上成为代表帧，不会整组丢失
     results_list = []
+    group_predictions = {}
+    infer_time, n_infer, n_skipped = 0.0, 0, 0
+    t_start = time.time()
     for i, img_path in enumerate(image_files):
-        try:
-            results = model(img_path, conf=0.25, verbose=False)
-        except: continue
-        
-        predictions = []
-        for r in results:
-            for box in r.boxes:
-                cls_id = int(box.cls[0])
-                label_name = LABELS_MAP.get(cls_id)
-                if not label_name: continue
-
-                x, y, w, h = box.xywhn[0].tolist()
-                predictions.append({
-                    "from_name": "label",
-                    "to_name": "image",
-                    "type": "rectanglelabels",
-                    "value": {
-                        "x": (x - w / 2) * 100, "y": (y - h / 2) * 100,
-                        "width": w * 100, "height": h * 100,
-                        "rectanglelabels": [label_name]
-                    },
-                    "score": float(box.conf[0])
-                })
+        group = rep_of[img_path]
+        if group in group_predictions:
+            predictions = copy.deepcopy(group_predictions[group])
+            n_skipped += 1
+            metrics.count("frames_skipped")
+        else:
+            t0 = time.time()
+            try:
+                with metrics.span("predict"):
+                    results = model(img_path, conf=0.25, verbose=False)
+            except:
+                metrics.count("errors")
+                continue
+            infer_time += time.time() - t0
+            n_infer += 1
+            with metrics.span("postprocess"):
+                predictions = _to_predictions(results)
+            group_predictions[group] = predictions
+            metrics.count("frames_inferred")
+            metrics.step()
 
         # 生成 Docker 兼容的 URL
         # 物理路径: /data/video_frames/1.jpg
@@ -109,14 +216,34 @@ def run_inference():
             "data": {"image": ls_url},
             "predictions": [{"model_version": "yolo_video_v1", "score": 0.5, "result": predictions}]
         })
-        
+
         if (i + 1) % 10 == 0: print(f"   已处理 {i + 1}/{len(image_files)}...")
 
+    total_time = time.time() - t_start
+    n_failed = len(image_files) - n_infer - n_skipped
+    print(f"⏭️  跳过近重复帧 {n_skipped}/{len(image_files)} ({n_skipped / len(image_files):.0%})"
+          + (f"，推理失败 {n_failed} 帧" if n_failed else ""))
+    if n_infer and n_skipped:
+        # 不是实测: 按代表帧的平均单帧耗时外推；要实测对比请用 --no-dedup 再跑一遍
+        full_estimate = infer_time / n_infer * (n_infer + n_skipped)
+        print(f"⏱️  推理 {total_time:.1f}s；按单帧平均耗时估算，逐帧推理约 {full_estimate:.1f}s "
+              f"(估算加速约 {full_estimate / max(total_time, 1e-6):.1f}x，实测请用 --no-dedup 对比)")
+    else:
+        print(f"⏱️  推理 {total_time:.1f}s")
+
     # 4. 保存
-    with open(OUTPUT_JSON, 'w', encoding='utf-8') as f:
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    with metrics.span("serialize"), open(OUTPUT_JSON, 'w', encoding='utf-8') as f:
         json.dump(results_list, f, indent=2, ensure_ascii=False)
 
     print(f"🎉 推理完成！结果已保存至: {OUTPUT_JSON}")
 
 if __name__ == "__main__":
-    run_inference()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dedup-threshold", type=int, default=DEDUP_THRESHOLD,
+                        help="dHash 汉明距离阈值，不超过该值的相邻帧视为重复 (0 仅合并哈希完全相同的帧)")
+    parser.add_argument("--no-dedup", action="store_true", help="逐帧推理，不做去重")
+    metrics.add_cli_args(parser)
+    args = parser.parse_args()
+    metrics.setup("video_inference", args)
+    run_inference(-1 if args.no_dedup else args.dedup_threshold)
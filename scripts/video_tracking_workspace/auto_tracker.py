@@ -1,12 +1,24 @@
 import os
-import cv2
 import json
 import uuid
 import sys
+import time
 import random
+import shutil
 import glob
+import argparse
 from collections import defaultdict
-from ultralytics import YOLO
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(SCRIPT_DIR))
+from common.trajectory import (MAX_PIXEL_ERROR, MIN_IOU, TrackTable, match_overlap_ids, track_agreement,
+                               simplify_track, reconstruction_error)
+from common.video_reader import VideoReader
+from common.motion_gate import MotionGate, MOTION_THRESHOLD, MAX_SKIP_FRAMES
+from common.batch_tracker import DETECT_BATCH, EVAL_BATCH, BatchTracker, track_single
+from common.seg_masks import MASK_FORMATS, MaskWriter, is_seg_model, mask_path, strip_mask_head
+from common.watch_folder import FolderWatcher, watch_loop, add_cli_args as watch_args
+from common import metrics
 
 # === Docker 适配配置 ===
 DATA_ROOT = os.getenv('DATA_ROOT', '/data')
@@ -14,7 +26,16 @@ DATA_ROOT = os.getenv('DATA_ROOT', '/data')
 VIDEO_DIR = os.path.join(DATA_ROOT, "videos")
 # 结果输出目录
 OUTPUT_DIR = os.path.join(DATA_ROOT, "outputs")
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+# 长视频断点: 每个视频一个目录 (meta.json + 增量 .npz 分片)，meta.json 同时是进度文件
+CKPT_DIR = os.path.join(OUTPUT_DIR, ".track_ckpt")
+# 监听模式下已追踪视频的 (大小, mtime) 记录
+WATCH_STATE = os.path.join(OUTPUT_DIR, ".track_watch.json")
+CHECKPOINT_SECONDS = 60
+# 续跑时从断点前多少帧开始重跑，用于预热追踪器并把新 ID 关联回旧 ID
+RESUME_OVERLAP = 30
+PROGRESS_EVERY = 1000
+# 解码端缩放: 长边缩到模型输入尺寸即可 (YOLO 反正会 letterbox 到 640)，0 表示原分辨率
+DECODE_MAX_SIDE = 640
 
 LS_URL_PREFIX = "/data/local-files/?d=/data/"
 
@@ -23,75 +44,292 @@ XML_BOX_NAME = "box"
 XML_LABEL_NAME = "labels"
 LABEL_MOVING = "Object_Moving"
 LABEL_STATIC = "Object_Static"
-MOVEMENT_SENSITIVITY = 0.5 
+MOVEMENT_SENSITIVITY = 0.5
+
+# 多进程模式下每个 worker 进程各自持有的模型 (只加载一次) 和 run_tracking 参数
+_WORKER_MODEL = None
+_WORKER_OPTS = {}
+
+def load_model(masks=False):
+    """masks=False 时分割模型去掉掩码分支，只算检测框"""
+    from ultralytics import YOLO
 
-def run_tracking(video_path, output_json):
     # 优先加载离线模型
     local_seg = "/app/models/yolov8n-seg.pt"
     local_det = "/app/models/yolov8n.pt"
-    
+
     if os.path.exists(local_seg):
-        print(f"🧠 加载分割模型: {local_seg}")
         model = YOLO(local_seg)
+        if masks:
+            print(f"🧠 加载分割模型: {local_seg} (输出掩码)")
+        elif strip_mask_head(model):
+            print(f"🧠 加载分割模型: {local_seg} (只用检测框，跳过掩码分支)")
+        else:
+            print(f"🧠 加载分割模型: {local_seg} (⚠️ 无法去掉掩码分支，掩码照算但不输出)")
+        return model
     elif os.path.exists(local_det):
         print(f"⚠️ 未找到seg模型，使用检测模型: {local_det}")
-        model = YOLO(local_det)
+        return YOLO(local_det)
     else:
         print("⚠️ 未找到本地模型，下载 yolov8n.pt")
-        model = YOLO("yolov8n.pt")
-    
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened(): 
+        return YOLO("yolov8n.pt")
+
+def _reset_tracker(model):
+    # persist=True 会让追踪器跨调用保留状态，换视频前必须清空 (含轨迹 ID 计数)
+    predictor = getattr(model, 'predictor', None)
+    for tracker in getattr(predictor, 'trackers', None) or []:
+        tracker.reset()
+
+def classify_motion(tracks, img_w, img_h):
+    """行为判定: 百分比坐标下 首尾位移 / 帧跨度 超过阈值视为运动，所有轨迹一次向量化计算"""
+    import numpy as np
+    if not tracks:
+        return []
+    first = np.array([b[0, :2] for _, _, b in tracks], dtype=np.float64)
+    last = np.array([b[-1, :2] for _, _, b in tracks], dtype=np.float64)
+    span = np.array([f[-1] - f[0] for _, f, _ in tracks], dtype=np.float64)
+    delta = (last - first) / [img_w, img_h] * 100
+    dist = np.hypot(delta[:, 0], delta[:, 1])
+    speed = np.divide(dist, span, out=np.zeros_like(dist), where=span > 0)
+    moving = speed > (MOVEMENT_SENSITIVITY / 10.0)
+    return np.where(moving, LABEL_MOVING, LABEL_STATIC).tolist()
+
+def _ckpt_path(video_path, name):
+    return os.path.join(CKPT_DIR, os.path.basename(video_path), name)
+
+def _video_sig(video_path):
+    st = os.stat(video_path)
+    return {"size": st.st_size, "mtime": int(st.st_mtime)}
+
+def load_checkpoint(video_path):
+    """返回 (meta, TrackTable)；没有断点或视频已变化时返回 None"""
+    meta_path = _ckpt_path(video_path, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+    if meta.get("sig") != _video_sig(video_path):
+        print(f"⚠️ 视频已变化，丢弃旧断点: {os.path.basename(video_path)}")
+        clear_checkpoint(video_path)
+        return None
+    # 只读取 meta 里登记过的分片，写到一半的分片会被忽略
+    parts = [_ckpt_path(video_path, f"part_{i:05d}.npz") for i in range(meta["parts"])]
+    return meta, TrackTable.load(parts)
+
+def save_checkpoint(video_path, table, meta):
+    os.makedirs(os.path.dirname(_ckpt_path(video_path, "meta.json")), exist_ok=True)
+    # 只追加上次断点之后的新行，写入量与间隔内的检测数成正比
+    if table.n > meta["rows"]:
+        table.save_rows(_ckpt_path(video_path, f"part_{meta['parts']:05d}.npz"), meta["rows"])
+        meta["parts"] += 1
+        meta["rows"] = table.n
+    meta["updated"] = time.time()
+    meta_path = _ckpt_path(video_path, "meta.json")
+    with open(meta_path + ".tmp", 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+def clear_checkpoint(video_path):
+    shutil.rmtree(os.path.join(CKPT_DIR, os.path.basename(video_path)), ignore_errors=True)
+
+def _fmt_eta(seconds):
+    seconds = int(max(seconds, 0))
+    return f"{seconds // 3600:d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+def _carry_forward(prev, frame_idx, ids, xywh):
+    """记录本次检测结果和每条轨迹的速度 (像素/帧)，静止跳过的帧按匀速外推"""
+    import numpy as np
+    vel = np.zeros_like(xywh)
+    if prev is not None and frame_idx > prev[0] and len(prev[1]):
+        p_frame, p_ids, p_xywh, _ = prev
+        order = np.argsort(p_ids)
+        pos = np.clip(np.searchsorted(p_ids, ids, sorter=order), 0, len(p_ids) - 1)
+        hit = p_ids[order[pos]] == ids
+        vel[hit] = (xywh[hit] - p_xywh[order[pos[hit]]]) / (frame_idx - p_frame)
+    return frame_idx, ids, xywh, vel
+
+def _tracked_frames(reader, engine, batch, gate, last_frame, timing):
+    """
+    按帧顺序产出 (frame_idx, 结果)：凑满 batch 个需要检测的帧后一次检测，再逐帧关联。
+    运动门控跳过的帧结果为 None (门控只比较画面，不依赖检测结果，所以可以在检测前决定)。
+    """
+    pending = []
+    n_detect = 0
+
+    def _flush():
+        frames = [f for _, f in pending if f is not None]
+        t0 = time.time()
+        outs = iter(engine(frames))
+        dt = time.time() - t0
+        timing["infer"] += dt
+        if frames:
+            metrics.observe("track_batch", dt)
+            metrics.count("batches")
+        for frame_idx, frame in pending:
+            yield frame_idx, (next(outs) if frame is not None else None)
+
+    for frame_idx, frame in reader:
+        metrics.gauge("decode_queue", reader.queue_depth())
+        skip = False
+        if gate is not None and frame_idx > last_frame:
+            with metrics.span("motion_gate"):
+                skip = not gate.should_detect(frame_idx, frame)
+        pending.append((frame_idx, None if skip else frame))
+        n_detect += not skip
+        if n_detect >= batch:
+            yield from _flush()
+            pending, n_detect = [], 0
+    yield from _flush()
+
+
+def run_tracking(video_path, output_json, model=None, compress=True,
+                 max_pixel_error=MAX_PIXEL_ERROR, min_iou_tol=MIN_IOU,
+                 checkpoint_seconds=CHECKPOINT_SECONDS, overlap=RESUME_OVERLAP, resume=True,
+                 max_side=DECODE_MAX_SIDE, stride=1, reader_opts=None,
+                 motion_gate=False, motion_threshold=MOTION_THRESHOLD, max_skip=MAX_SKIP_FRAMES, keep_table=False,
+                 batch=DETECT_BATCH, masks="none"):
+    import numpy as np
+
+    if model is None:
+        model = load_model(masks=masks != "none")
+    if masks != "none" and not is_seg_model(model):
+        print("⚠️ 当前模型不输出掩码 (检测模型或已去掉掩码分支)，只输出检测框")
+        masks = "none"
+    batch = max(int(batch), 1)
+    if batch > 1:
+        # 批量检测 + 按帧顺序关联 (与逐帧 model.track 的轨迹 ID 一致)
+        try:
+            engine = BatchTracker(model, masks=masks)
+        except ValueError as e:
+            print(f"⚠️ {e}，改为逐帧追踪")
+            batch = 1
+    if batch == 1:
+        _reset_tracker(model)
+        engine = lambda frames: track_single(model, frames, masks)
+
+    # 元数据来自原视频；解码在后台线程里完成，送进模型的是已缩小的帧
+    probe = VideoReader(video_path)
+    if not probe.opened:
         print(f"❌ 无法打开视频: {video_path}")
-        return
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    orig_w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    orig_h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    cap.release()
-    
-    print(f"🔥 开始追踪: {os.path.basename(video_path)}")
-    results = model.track(source=video_path, persist=True, stream=True, verbose=False)
-    tracks_data = defaultdict(list) 
+        return None
+    fps, orig_w, orig_h, total = probe.fps, probe.orig_w, probe.orig_h, probe.total
+    name = os.path.basename(video_path)
+
+    # 断点续跑: 追踪器内部状态 (卡尔曼滤波等) 不落盘，而是从断点前 overlap 帧重新预热，
+    # 再用重叠窗口内的框把新 ID 对回旧 ID
+    ckpt = load_checkpoint(video_path) if resume else None
+    if not resume:
+        clear_checkpoint(video_path)
+    if ckpt:
+        meta, table = ckpt
+        last_frame = meta["frame"]
+        start = max(0, last_frame + 1 - overlap)
+        id_offset = table.max_id()
+        warmup = TrackTable(256)
+        print(f"🔁 断点续跑: {name} 从第 {last_frame + 1} 帧继续 (已有 {table.n} 个框，重叠 {last_frame + 1 - start} 帧)")
+    else:
+        meta = {"sig": _video_sig(video_path), "frame": -1, "total": total, "parts": 0, "rows": 0}
+        table = TrackTable()
+        last_frame, start, id_offset, warmup = -1, 0, 0, None
+    id_map = {}
+
+    reader = VideoReader(video_path, max_side=max_side or None, stride=stride, start=start, **(reader_opts or {}))
+    start = reader.start
+    # 检测框在缩小后的帧上，乘回原始分辨率后再入库
+    to_orig = np.array([orig_w / reader.out_w, orig_h / reader.out_h] * 2, dtype=np.float32)
+    img_w, img_h = orig_w or 1, orig_h or 1
+    print(f"🔥 开始追踪: {name} ({orig_w}x{orig_h} -> {reader.out_w}x{reader.out_h}, "
+          f"每 {reader.stride} 帧取 1 帧, {reader.backend} 解码, 检测 batch={batch})")
+    t_start = time.time()
+    t_ckpt = t_start
+    timing = {"infer": 0.0}
+    # 运动门控: 画面静止时不跑检测，沿用上一次检测的轨迹按匀速外推
+    gate = MotionGate(motion_threshold, max_skip) if motion_gate else None
+    carry = None
+    mask_writer = None
+    if masks != "none":
+        mask_writer = MaskWriter(mask_path(output_json), masks, append=ckpt is not None, header={
+            "video": name, "width": orig_w, "height": orig_h, "mask_width": reader.out_w, "mask_height": reader.out_h})
 
     # 数据采集
-    for frame_idx, r in enumerate(results):
-        if not r.boxes or r.boxes.id is None: continue
-        boxes = r.boxes.xywh.cpu().numpy()
-        track_ids = r.boxes.id.int().cpu().tolist()
-        img_h, img_w = r.orig_shape[0], r.orig_shape[1]
-
-        for i, (box, track_id) in enumerate(zip(boxes, track_ids)):
-            x_center, y_center, width, height = box
-            # 归一化
-            x = (x_center - width / 2) / img_w * 100
-            y = (y_center - height / 2) / img_h * 100
-            w = width / img_w * 100
-            h = height / img_h * 100
-            
-            tracks_data[track_id].append({
-                "frame": frame_idx + 1,
-                "enabled": True,
-                "rotation": 0,
-                "x": float(x), "y": float(y), "width": float(w), "height": float(h),
-                "time": float(frame_idx / fps) if fps > 0 else 0.0
-            })
+    frame_idx, done = start - 1, 0
+    for frame_idx, res in _tracked_frames(reader, engine, batch, gate, last_frame, timing):
+        done += 1
+        if res is None:
+            metrics.count("frames_skipped")
+            if carry is not None:
+                c_frame, c_ids, c_xywh, c_vel = carry
+                table.append(frame_idx, c_ids, c_xywh + c_vel * (frame_idx - c_frame))
+            continue
+        metrics.step()
+        if warmup is not None and frame_idx > last_frame:
+            id_map = match_overlap_ids(table, warmup)
+            print(f"   🔗 重叠窗口关联 {len(id_map)} 条轨迹")
+            warmup = None
+        ids, xywh, frame_masks = res
+        if len(ids):
+            xywh = xywh * to_orig
+            if frame_idx <= last_frame:
+                # 重叠窗口内的帧已经记录过，只用来关联 ID
+                warmup.append(frame_idx, ids, xywh)
+            else:
+                if id_offset:
+                    # 未能关联的新轨迹顺延到旧 ID 之后，避免撞号
+                    ids = np.array([id_map.get(i, i + id_offset) for i in ids.tolist()], dtype=np.int32)
+                # 整帧批量写入列存表 (像素坐标)，归一化留到输出时向量化完成
+                table.append(frame_idx, ids, xywh)
+                if mask_writer is not None:
+                    mask_writer.write(frame_idx, ids, frame_masks, to_orig)
+                if gate is not None:
+                    carry = _carry_forward(carry, frame_idx, ids, xywh)
+        elif gate is not None and frame_idx > last_frame:
+            carry = None
+
+        if frame_idx > last_frame and done % PROGRESS_EVERY == 0:
+            run_fps = done / max(time.time() - t_start, 1e-6)
+            eta = f", 剩余约 {_fmt_eta((total - frame_idx - 1) / reader.stride / run_fps)}" if total > 0 else ""
+            print(f"   {name}: {frame_idx + 1}/{total} 帧, {run_fps:.1f} fps{eta}")
+        if checkpoint_seconds > 0 and frame_idx > last_frame and time.time() - t_ckpt >= checkpoint_seconds:
+            run_fps = done / max(time.time() - t_start, 1e-6)
+            meta.update({"frame": frame_idx, "fps": run_fps,
+                         "eta_seconds": (total - frame_idx - 1) / reader.stride / run_fps if total > 0 else None})
+            with metrics.span("checkpoint"):
+                save_checkpoint(video_path, table, meta)
+            t_ckpt = time.time()
+    elapsed = time.time() - t_start
+    infer_seconds = timing["infer"]
+    if mask_writer is not None:
+        mask_writer.close()
+        print(f"🎭 掩码 ({masks}): {mask_writer.frames} 帧 -> {mask_writer.path}")
 
     # 生成标注
+    tracks = table.tracks()
+    labels = classify_motion(tracks, img_w, img_h)
+    scale = np.array([img_w, img_h, img_w, img_h], dtype=np.float64) / 100.0
     ls_results = []
-    for track_id, sequence_data in tracks_data.items():
-        if not sequence_data: continue
-        
-        # 行为判定
-        first = sequence_data[0]
-        last = sequence_data[-1]
-        dist = ((last['x'] - first['x'])**2 + (last['y'] - first['y'])**2)**0.5
-        span = last['frame'] - first['frame']
-        
-        final_label = LABEL_STATIC
-        if span > 0:
-            speed = dist / span
-            if speed > (MOVEMENT_SENSITIVITY / 10.0):
-                final_label = LABEL_MOVING
+    n_points, n_keys = 0, 0
+    max_px, min_iou = 0.0, 1.0
+    for (track_id, frames, boxes), final_label in zip(tracks, labels):
+        # 关键帧压缩: Label Studio 会在关键帧之间线性插值
+        if compress:
+            with metrics.span("keyframes"):
+                keep = simplify_track(frames, boxes, max_pixel_error, min_iou_tol)
+                err_px, err_iou = reconstruction_error(frames, boxes, keep)
+            max_px, min_iou = max(max_px, err_px), min(min_iou, err_iou)
+        else:
+            keep = np.arange(len(frames))
+        n_points += len(frames)
+        n_keys += len(keep)
+
+        # 归一化 (整条轨迹一次完成)，只在序列化时才生成 dict
+        key_frames = frames[keep]
+        norm = (boxes[keep] / scale).tolist()
+        times = (key_frames / fps).tolist() if fps > 0 else [0.0] * len(keep)
+        sequence_data = [
+            {"frame": f + 1, "enabled": True, "rotation": 0,
+             "x": x, "y": y, "width": w, "height": h, "time": t}
+            for f, (x, y, w, h), t in zip(key_frames.tolist(), norm, times)
+        ]
 
         shared_id = str(uuid.uuid4())[:8]
         # 轨迹
@@ -99,12 +337,16 @@ def run_tracking(video_path, output_json):
             "id": shared_id, "from_name": XML_BOX_NAME, "to_name": "video", "type": "videorectangle",
             "value": {"sequence": sequence_data, "original_width": orig_w, "original_height": orig_h}
         })
-        # 标签
+        # 标签 (通过相同 id 关联到轨迹，不再重复写一份 sequence)
         ls_results.append({
             "id": shared_id, "from_name": XML_LABEL_NAME, "to_name": "video", "type": "labels",
-            "value": {"labels": [final_label], "sequence": sequence_data, "original_width": orig_w, "original_height": orig_h}
+            "value": {"labels": [final_label], "original_width": orig_w, "original_height": orig_h}
         })
 
+    if compress and n_points:
+        print(f"🗜️  关键帧压缩: {n_points} -> {n_keys} 个框 ({n_points / max(n_keys, 1):.1f}x)，"
+              f"最大重建误差 {max_px:.2f}px，最小 IoU {min_iou:.3f}")
+
     # 封装
     rel_path = os.path.relpath(video_path, DATA_ROOT)
     final_output = [{
@@ -112,21 +354,245 @@ def run_tracking(video_path, output_json):
         "annotations": [{"result": ls_results, "ground_truth": False}]
     }]
 
-    with open(output_json, 'w', encoding='utf-8') as f:
+    with metrics.span("serialize"), open(output_json, 'w', encoding='utf-8') as f:
         json.dump(final_output, f, indent=2, ensure_ascii=False)
-    print(f"✅ 生成: {output_json}")
+    clear_checkpoint(video_path)
+    skipped = gate.skipped if gate is not None else 0
+    if gate is not None:
+        print(f"🚦 运动门控: 跳过 {skipped}/{gate.checked} 帧检测 ({gate.skip_ratio:.0%})")
+    metrics.count("frames", done)
+    metrics.count("boxes", n_points)
+    metrics.count("keyframes", n_keys)
+    detected = done - skipped
+    print(f"✅ 生成: {output_json} (本次 {done} 帧, {done / max(elapsed, 1e-6):.1f} fps; "
+          f"解码 {reader.decode_fps:.1f} fps, 推理 {detected / max(infer_seconds, 1e-6):.1f} fps @ batch={batch})")
+    stats = {"video": name, "frames": done, "seconds": elapsed, "boxes": n_points, "keyframes": n_keys,
+             "decode_seconds": reader.decode_seconds, "infer_seconds": infer_seconds, "skipped": skipped,
+             "batch": batch, "masks": masks}
+    if keep_table:
+        stats["table"] = table
+    return stats
+
+def _output_path(video_path):
+    return os.path.join(OUTPUT_DIR, f"track_{os.path.basename(video_path)}.json")
+
+def _init_worker(threads, opts):
+    global _WORKER_MODEL, _WORKER_OPTS
+    import torch
+    # 每个 worker 只用分到的核数，避免多个进程的线程池互相争抢
+    torch.set_num_threads(threads)
+    _WORKER_MODEL = load_model(masks=opts.get("masks", "none") != "none")
+    _WORKER_OPTS = opts
+
+def _track_in_worker(video_path):
+    try:
+        stats = run_tracking(video_path, _output_path(video_path), _WORKER_MODEL, **_WORKER_OPTS)
+    except Exception as e:
+        print(f"⚠️ 追踪失败 {os.path.basename(video_path)}: {e}")
+        stats = None
+    if stats is not None:
+        stats['worker'] = os.getpid()
+    return stats
+
+def run_batch(files, workers, threads, opts=None):
+    opts = opts or {}
+    all_stats = []
+    t_start = time.time()
+    if workers <= 1:
+        model = load_model(masks=opts.get("masks", "none") != "none")
+        for v_path in files:
+            stats = run_tracking(v_path, _output_path(v_path), model, **opts)
+            if stats:
+                stats['worker'] = os.getpid()
+                all_stats.append(stats)
+    else:
+        import multiprocessing as mp
+        # spawn: 不继承父进程里可能已初始化的 torch 线程池 / CUDA 上下文
+        ctx = mp.get_context("spawn")
+        print(f"🧵 启动 {workers} 个追踪进程 (每个 {threads} 线程)，共 {len(files)} 个视频")
+        with ctx.Pool(workers, initializer=_init_worker, initargs=(threads, opts)) as pool:
+            # chunksize=1: 长短视频混杂时按完成情况动态分配
+            for stats in pool.imap_unordered(_track_in_worker, files, chunksize=1):
+                if not stats: continue
+                all_stats.append(stats)
+                # 子进程里的埋点不会回传，按视频汇总到主进程
+                metrics.count("frames", stats['frames'])
+                metrics.observe("video", stats['seconds'])
+
+    # 汇总每个 worker 的吞吐
+    wall = time.time() - t_start
+    per_worker = defaultdict(lambda: {"videos": 0, "frames": 0, "seconds": 0.0, "decode": 0.0, "infer": 0.0})
+    for s in all_stats:
+        w = per_worker[s['worker']]
+        w['videos'] += 1; w['frames'] += s['frames']; w['seconds'] += s['seconds']
+        w['decode'] += s['decode_seconds']; w['infer'] += s['infer_seconds']
+    print("-" * 30)
+    for pid, w in sorted(per_worker.items()):
+        print(f"   worker {pid}: {w['videos']} 个视频, {w['frames']} 帧, {w['frames'] / max(w['seconds'], 1e-6):.1f} fps "
+              f"(解码 {w['frames'] / max(w['decode'], 1e-6):.1f} fps, 推理 {w['frames'] / max(w['infer'], 1e-6):.1f} fps)")
+    total_frames = sum(s['frames'] for s in all_stats)
+    total_boxes = sum(s['boxes'] for s in all_stats)
+    if total_boxes:
+        print(f"🗜️  关键帧: {total_boxes} -> {sum(s['keyframes'] for s in all_stats)} 个框")
+    total_skipped = sum(s['skipped'] for s in all_stats)
+    if total_skipped:
+        print(f"🚦 运动门控共跳过 {total_skipped}/{sum(s['frames'] for s in all_stats)} 帧检测")
+    print(f"📊 共 {len(all_stats)}/{len(files)} 个视频, {total_frames} 帧, 总耗时 {wall:.1f}s, 整体 {total_frames / max(wall, 1e-6):.1f} fps")
+
+def watch_videos(opts, settle, batch_size):
+    """监听 videos/: 新视频写完后用常驻模型逐个追踪；已有 track_xxx.json 的视频不重跑，内容变了会重新追踪"""
+    model = load_model(masks=opts.get("masks", "none") != "none")
+    watcher = FolderWatcher(VIDEO_DIR, (".mp4", ".avi"), WATCH_STATE, settle=settle)
+    existing = glob.glob(os.path.join(VIDEO_DIR, "*.mp4")) + glob.glob(os.path.join(VIDEO_DIR, "*.avi"))
+    seeded = watcher.seed([p for p in existing if os.path.exists(_output_path(p))])
+    if seeded:
+        print(f"📄 {seeded} 个视频已有追踪结果，记为已处理")
+
+    def _track_batch(paths):
+        for v_path in paths:
+            try:
+                run_tracking(v_path, _output_path(v_path), model, **opts)
+            except Exception as e:
+                print(f"⚠️ 追踪失败 {os.path.basename(v_path)}: {e}")
+
+    watch_loop(watcher, _track_batch, batch_size)
+
+def evaluate_motion_gate(files, opts):
+    """每个视频先逐帧检测跑一遍基线，再开运动门控跑一遍，报告跳过比例、与基线的轨迹一致性和提速"""
+    model = load_model(masks=opts.get("masks", "none") != "none")
+    base_opts = dict(opts, motion_gate=False, resume=False, checkpoint_seconds=0, keep_table=True)
+    for v_path in files:
+        name = os.path.basename(v_path)
+        base = run_tracking(v_path, os.devnull, model, **base_opts)
+        gated = run_tracking(v_path, _output_path(v_path), model, **dict(base_opts, motion_gate=True))
+        if not base or not gated:
+            continue
+        agree = track_agreement(base['table'], gated['table'])
+        print(f"📐 {name}: 跳过 {gated['skipped']}/{gated['frames']} 帧 ({gated['skipped'] / max(gated['frames'], 1):.0%}), "
+              f"基线框召回 {agree['recall']:.1%}, 精确 {agree['precision']:.1%}, 平均 IoU {agree['mean_iou']:.3f}, "
+              f"ID 一致 {agree['id_consistency']:.1%}, 提速 {base['seconds'] / max(gated['seconds'], 1e-6):.2f}x")
+
+def evaluate_batching(files, opts):
+    """逐帧 model.track 基线和批量检测各跑一遍，报告轨迹 ID 是否一致和推理吞吐"""
+    # 两个模型实例: model.track 注册在 predictor 上的追踪回调不能影响批量引擎的 predict
+    keep = opts.get("masks", "none") != "none"
+    single, batched = load_model(keep), load_model(keep)
+    base_opts = dict(opts, resume=False, checkpoint_seconds=0, keep_table=True)
+    if base_opts.get("batch", 1) <= 1:
+        base_opts["batch"] = EVAL_BATCH
+    for v_path in files:
+        name = os.path.basename(v_path)
+        base = run_tracking(v_path, os.devnull, single, **dict(base_opts, batch=1))
+        test = run_tracking(v_path, _output_path(v_path), batched, **base_opts)
+        if not base or not test:
+            continue
+        agree = track_agreement(base['table'], test['table'])
+        fps = lambda s: (s['frames'] - s['skipped']) / max(s['infer_seconds'], 1e-6)
+        print(f"📐 {name}: batch={test['batch']} 推理 {fps(test):.1f} fps vs 逐帧 {fps(base):.1f} fps "
+              f"({fps(test) / max(fps(base), 1e-6):.2f}x), 框召回 {agree['recall']:.1%}, 精确 {agree['precision']:.1%}, "
+              f"平均 IoU {agree['mean_iou']:.4f}, ID 相同 {agree['same_id']:.1%}")
+
+def _init_mask_eval_worker(threads, opts, keep_masks):
+    global _WORKER_MODEL, _WORKER_OPTS
+    import torch
+    torch.set_num_threads(threads)
+    _WORKER_MODEL = load_model(masks=keep_masks)
+    _WORKER_OPTS = opts
+
+def _mask_eval_worker(video_path):
+    import resource
+    import torch
+    stats = _track_in_worker(video_path)
+    if stats is not None:
+        # 每种模式单独一个进程，峰值内存互不影响 (模型本身的占用各模式相同)
+        stats['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        stats['peak_cuda_mb'] = torch.cuda.max_memory_allocated() / 2**20 if torch.cuda.is_available() else 0.0
+    return stats
+
+def evaluate_masks(files, opts, threads):
+    """
+    分割模型三种跑法各用一个独立进程跑一遍，报告每帧推理耗时、峰值内存，以及检测框是否与原来一致:
+    seg (原行为: 掩码算完丢弃) / none (去掉掩码分支) / 输出掩码 (--masks 指定的格式，默认 rle)
+    """
+    import multiprocessing as mp
+    fmt = opts.get("masks", "none")
+    fmt = fmt if fmt != "none" else "rle"
+    base_opts = dict(opts, resume=False, checkpoint_seconds=0, keep_table=True)
+    # (名称, 是否保留掩码分支, 输出格式)
+    modes = [("seg", True, "none"), ("none", False, "none"), (fmt, True, fmt)]
+    ctx = mp.get_context("spawn")
+    results = {}
+    for label, keep, out_fmt in modes:
+        mode_opts = dict(base_opts, masks=out_fmt)
+        with ctx.Pool(1, initializer=_init_mask_eval_worker, initargs=(threads, mode_opts, keep)) as pool:
+            results[label] = {s['video']: s for s in pool.map(_mask_eval_worker, files, chunksize=1) if s}
+    for v_path in files:
+        name = os.path.basename(v_path)
+        runs = [(label, results[label].get(name)) for label, _, _ in modes]
+        if not all(s for _, s in runs):
+            continue
+        base = runs[0][1]
+        print(f"📐 {name}:")
+        for label, s in runs:
+            detected = max(s['frames'] - s['skipped'], 1)
+            agree = track_agreement(base['table'], s['table'])
+            mem = f", 显存峰值 {s['peak_cuda_mb']:.0f}MB" if s['peak_cuda_mb'] else ""
+            print(f"   {label:<8} 每帧推理 {s['infer_seconds'] / detected * 1000:.1f}ms, "
+                  f"总耗时 {s['seconds']:.1f}s, 进程内存峰值 {s['peak_rss_mb']:.0f}MB{mem}, "
+                  f"与 seg 框召回 {agree['recall']:.1%} / 平均 IoU {agree['mean_iou']:.4f}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=0, help="并行追踪进程数 (默认按 CPU 核数和视频数自动选择)")
+    parser.add_argument("--threads", type=int, default=0, help="每个进程的 torch 线程数 (默认平分 CPU 核数)")
+    parser.add_argument("--max-pixel-error", type=float, default=MAX_PIXEL_ERROR, help="关键帧压缩: 插值框允许的最大像素偏差")
+    parser.add_argument("--min-iou", type=float, default=MIN_IOU, help="关键帧压缩: 插值框与真实框的最小 IoU (0 表示不检查)")
+    parser.add_argument("--no-compress", action="store_true", help="保留每一帧，不做关键帧压缩")
+    parser.add_argument("--checkpoint-every", type=float, default=CHECKPOINT_SECONDS, help="每隔多少秒保存一次断点 (0 表示不保存)")
+    parser.add_argument("--overlap", type=int, default=RESUME_OVERLAP, help="续跑时重叠的帧数 (用于关联轨迹 ID)")
+    parser.add_argument("--no-resume", action="store_true", help="忽略并清除已有断点，从头追踪")
+    parser.add_argument("--max-side", type=int, default=DECODE_MAX_SIDE, help="解码时把长边缩到多少像素 (0 表示原分辨率)")
+    parser.add_argument("--stride", type=int, default=1, help="每 N 帧追踪 1 帧 (关键帧之间由 Label Studio 插值)")
+    parser.add_argument("--motion-gate", action="store_true", help="画面静止时跳过检测，用匀速模型外推已有轨迹")
+    parser.add_argument("--motion-threshold", type=float, default=MOTION_THRESHOLD, help="运动门控: 变化像素占比阈值")
+    parser.add_argument("--max-skip", type=int, default=MAX_SKIP_FRAMES, help="运动门控: 最多连续跳过多少帧")
+    parser.add_argument("--gate-eval", action="store_true", help="逐帧基线和运动门控各跑一遍，对比轨迹一致性")
+    parser.add_argument("--batch", type=int, default=int(os.getenv('TRACK_BATCH', DETECT_BATCH)),
+                        help="每次检测的帧数 (检测后按帧顺序关联；默认 1 即逐帧 model.track，开启前先用 --batch-eval 确认 ID 一致)")
+    parser.add_argument("--batch-eval", action="store_true", help=f"逐帧 model.track 和批量检测各跑一遍，对比轨迹 ID 和吞吐 (未指定 --batch 时批量取 {EVAL_BATCH})")
+    parser.add_argument("--masks", choices=MASK_FORMATS, default=os.getenv('TRACK_MASKS', 'none'),
+                        help="分割掩码输出格式 (none 时分割模型去掉掩码分支，只算检测框)")
+    parser.add_argument("--mask-eval", action="store_true", help="对比 seg / 去掉掩码 / 输出掩码 三种跑法的每帧耗时和内存")
+    watch_args(parser)
+    metrics.add_cli_args(parser)
+    args = parser.parse_args()
+    metrics.setup("auto_tracker", args)
+
     if not os.path.exists(VIDEO_DIR):
         print(f"❌ 视频目录不存在: {VIDEO_DIR}")
         sys.exit(1)
-        
+
     files = glob.glob(os.path.join(VIDEO_DIR, "*.mp4")) + glob.glob(os.path.join(VIDEO_DIR, "*.avi"))
-    
-    if not files:
+
+    if not files and not args.watch:
         print(f"❌ 未找到视频文件")
     else:
-        for v_path in files:
-            fname = os.path.basename(v_path)
-            out_path = os.path.join(OUTPUT_DIR, f"track_{fname}.json")
-            run_tracking(v_path, out_path)
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        cpus = os.cpu_count() or 1
+        workers = args.workers or max(1, min(len(files), cpus // 2))
+        threads = args.threads or max(1, cpus // workers)
+        opts = {"compress": not args.no_compress, "max_pixel_error": args.max_pixel_error, "min_iou_tol": args.min_iou,
+                "checkpoint_seconds": args.checkpoint_every, "overlap": max(args.overlap, 1), "resume": not args.no_resume,
+                "max_side": args.max_side, "stride": max(args.stride, 1), "motion_gate": args.motion_gate,
+                "motion_threshold": args.motion_threshold, "max_skip": max(args.max_skip, 1),
+                "batch": max(args.batch, 1), "masks": args.masks}
+        if args.watch:
+            watch_videos(opts, args.settle, args.watch_batch)
+        elif args.gate_eval:
+            evaluate_motion_gate(files, opts)
+        elif args.batch_eval:
+            evaluate_batching(files, opts)
+        elif args.mask_eval:
+            evaluate_masks(files, opts, threads)
+        else:
+            run_batch(files, workers, threads, opts)
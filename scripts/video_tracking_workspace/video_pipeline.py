@@ -0,0 +1,141 @@
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import argparse
+import subprocess
+
+# 🚨 强制开启实时日志
+sys.stdout.reconfigure(line_buffering=True)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+sys.path.insert(0, os.path.dirname(SCRIPT_DIR))
+from auto_tracker import DATA_ROOT, VIDEO_DIR, OUTPUT_DIR, LS_URL_PREFIX, DECODE_MAX_SIDE, DETECT_BATCH, load_model, run_tracking
+from common.whisper_infer import SAMPLE_RATE
+from common import metrics
+from common.uncertainty import token_uncertainty, write_index
+
+# ==========================================
+# ⚙️ P3 + P8 合并流水线: 每个视频只解封装一次
+# ==========================================
+# 画面 -> 追踪 (outputs/track_*.json)；16kHz 音轨 -> Whisper (P3 预标注)，不落地 wav
+# P3 任务直接指向 videos/ 下的原视频，写到单独的文件，不覆盖 whisper_to_ls.py --project 3 的结果
+WHISPER_MODEL_PATH = "/app/models/whisper"
+P3_OUTPUT = os.path.join(OUTPUT_DIR, "pre_annotations_video_pipeline.json")
+VIDEO_EXTS = ['*.mp4', '*.avi', '*.mov', '*.mkv']
+
+# 强制离线，优先使用 Docker 内置模型
+os.environ["HF_HUB_OFFLINE"] = "1"
+os.environ["HF_DATASETS_OFFLINE"] = "1"
+
+
+def has_audio(video_path):
+    """ffprobe 检查是否有音轨 (没有音轨时 ffmpeg 的第二路输出会直接报错)"""
+    if not shutil.which("ffprobe"):
+        return False
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "a", "-show_entries", "stream=index", "-of", "csv=p=0", video_path]
+    out = subprocess.run(cmd, capture_output=True, text=True).stdout
+    return bool(out.strip())
+
+
+def run_pipeline(max_side, stride, language, transcribe=True, backend="torch", int8=False, batch=DETECT_BATCH):
+    if not os.path.exists(VIDEO_DIR):
+        print(f"❌ 视频目录不存在: {VIDEO_DIR}")
+        return
+    files = []
+    for ext in VIDEO_EXTS:
+        files.extend(glob.glob(os.path.join(VIDEO_DIR, ext)))
+    if not files:
+        print(f"❌ 未找到视频文件: {VIDEO_DIR}")
+        return
+    if transcribe and not shutil.which("ffmpeg"):
+        print("⚠️ 未找到 ffmpeg，无法在解码时同时取出音轨，只做追踪")
+        transcribe = False
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    model = load_model()
+    whisper = None
+    if transcribe:
+        from common.whisper_infer import load_whisper, StreamingTranscriber
+        try:
+            whisper = load_whisper(WHISPER_MODEL_PATH, backend=backend, int8=int8)
+        except Exception as e:
+            print(f"❌ Whisper 模型加载失败，只做追踪: {e}")
+
+    p3_results = []
+    read_bytes = 0
+    t_start = time.time()
+    for v_path in sorted(files):
+        name = os.path.basename(v_path)
+        transcriber = None
+        reader_opts = None
+        if whisper is not None and has_audio(v_path):
+            transcriber = StreamingTranscriber(whisper, language)
+            reader_opts = {"audio_sr": SAMPLE_RATE, "on_audio": transcriber.feed}
+        elif whisper is not None:
+            print(f"⚠️ {name} 没有音轨，跳过转写")
+
+        out_json = os.path.join(OUTPUT_DIR, f"track_{name}.json")
+        try:
+            # 转写没有断点，合并模式下追踪也从头跑，保证两路结果覆盖同一段视频
+            stats = run_tracking(v_path, out_json, model, resume=False, checkpoint_seconds=0,
+                                 max_side=max_side, stride=stride, reader_opts=reader_opts, batch=batch)
+        except Exception as e:
+            print(f"⚠️ 追踪失败 {name}: {e}")
+            stats = None
+        if stats:
+            read_bytes += os.path.getsize(v_path)
+
+        if transcriber is not None:
+            t0 = time.time()
+            segments = transcriber.finish()
+            if transcriber.error is not None:
+                print(f"⚠️ {name} 部分窗口转写失败: {transcriber.error}")
+            text = "".join(t for _, t in segments)
+            print(f"🎤 {name}: {len(segments)} 段, {len(text)} 字 (追踪结束后额外等待 {time.time() - t0:.1f}s)")
+            # 浏览器的 <audio> 可以直接播放视频文件里的音轨，任务直接指向原视频
+            rel_path = os.path.relpath(v_path, DATA_ROOT)
+            unc = token_uncertainty(transcriber.logprobs)
+            unc["windows"] = transcriber.window_scores
+            p3_results.append({
+                "data": {"audio": f"{LS_URL_PREFIX}{rel_path}"},
+                "predictions": [{
+                    "model_version": "whisper_v1",
+                    "score": unc["score"],
+                    "result": [{
+                        "from_name": "transcription",
+                        "to_name": "audio",
+                        "type": "textarea",
+                        "value": {"text": [text]}
+                    }]
+                }],
+                "meta": {"uncertainty": unc}
+            })
+
+    if p3_results:
+        with open(P3_OUTPUT, 'w', encoding='utf-8') as f:
+            json.dump(p3_results, f, indent=2, ensure_ascii=False)
+        print(f"✅ P3 预标注: {P3_OUTPUT} ({len(p3_results)} 个视频)")
+        write_index(P3_OUTPUT, p3_results, "token_logprob")
+    print("-" * 30)
+    print(f"📊 {len(files)} 个视频，每个只读一遍 (共 {read_bytes / 1e6:.1f} MB)，总耗时 {time.time() - t_start:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="P3 + P8 合并流水线: 一次解封装同时追踪和语音转写")
+    parser.add_argument("--max-side", type=int, default=DECODE_MAX_SIDE, help="追踪解码时把长边缩到多少像素 (0 表示原分辨率)")
+    parser.add_argument("--stride", type=int, default=1, help="每 N 帧追踪 1 帧")
+    parser.add_argument("--language", default="zh")
+    parser.add_argument("--batch", type=int, default=int(os.getenv('TRACK_BATCH', DETECT_BATCH)),
+                        help="每次前向检测的帧数 (1 = 逐帧 model.track)")
+    parser.add_argument("--no-transcribe", action="store_true", help="只追踪，不转写")
+    parser.add_argument("--whisper-backend", choices=["torch", "onnx"], default=os.getenv('WHISPER_BACKEND', 'torch'))
+    parser.add_argument("--int8", action="store_true", help="onnx 后端使用 int8 动态量化权重")
+    metrics.add_cli_args(parser)
+    args = parser.parse_args()
+    metrics.setup("video_pipeline", args)
+    run_pipeline(args.max_side, max(args.stride, 1), args.language, not args.no_transcribe,
+                 args.whisper_backend, args.int8, max(args.batch, 1))
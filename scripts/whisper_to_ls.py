@@ -1,23 +1,115 @@
 import os
 import glob
 import json
+import time
 import argparse
-import torch
-import librosa
-from transformers import WhisperProcessor, WhisperForConditionalGeneration
-from tqdm import tqdm
+
+from common import metrics
+from common.work_queue import WorkQueue, queue_dir, add_cli_args as work_queue_args
+from common.whisper_infer import load_whisper, generate_scored, generate_scored_batch
+from common.mem_budget import fit_batch, is_oom, map_batches, parse_budget, whisper_generate_probe, \
+    add_cli_args as memory_args
+from common.uncertainty import token_uncertainty, write_index
+from common.watch_folder import (SETTLE_SECONDS, WATCH_BATCH, FolderWatcher, TaskOutput, watch_loop, watch_state_path,
+                                 add_cli_args as watch_args)
 
 # ==========================================
 # ⚙️ Docker 适配配置
 # ==========================================
 DATA_ROOT = os.getenv('DATA_ROOT', '/data')
 LS_URL_PREFIX = "/data/local-files/?d=/data/"
+AUDIO_EXTENSIONS = ['*.wav', '*.mp3', '*.flac', '*.m4a', '*.ogg']
 
 # 强制离线，优先使用 Docker 内置模型
 os.environ["HF_HUB_OFFLINE"] = "1"
 os.environ["HF_DATASETS_OFFLINE"] = "1"
 
-def run_inference(project_type):
+def build_task(audio_path, transcription, logprobs, seconds):
+    """转写结果 -> Label Studio 预标注任务"""
+    unc = token_uncertainty(logprobs)
+    metrics.count("audio_files")
+    metrics.count("audio_seconds", seconds)
+    metrics.step()
+
+    # 生成相对路径 URL
+    rel_path = os.path.relpath(audio_path, DATA_ROOT)
+    ls_url = f"{LS_URL_PREFIX}{rel_path}"
+
+    return {
+        "data": {"audio": ls_url},
+        "predictions": [{
+            "model_version": "whisper_v1",
+            "score": unc["score"],
+            "result": [{
+                "from_name": "transcription",
+                "to_name": "audio",
+                "type": "textarea",
+                "value": {"text": [transcription]}
+            }]
+        }],
+        "meta": {"uncertainty": unc}
+    }
+
+def transcribe_file(whisper, audio_path):
+    """转写单个音频文件，返回一条 Label Studio 预标注任务 (出错返回 None)"""
+    import librosa
+    model, processor, device = whisper
+    try:
+        # 读取并转写
+        with metrics.span("audio_decode"):
+            speech, _ = librosa.load(audio_path, sr=16000)
+        with metrics.span("features"):
+            input_features = processor(speech, sampling_rate=16000, return_tensors="pt").input_features.to(device)
+        
+        # 生成时顺带取 token 概率，作为不确定度
+        with metrics.span("generate"):
+            transcription, logprobs = generate_scored(whisper, input_features, language="zh")
+        return build_task(audio_path, transcription, logprobs, len(speech) / 16000)
+    except Exception as e:
+        print(f"⚠️ 跳过文件 {os.path.basename(audio_path)}: {e}")
+        metrics.count("errors")
+        return None
+
+def transcribe_files(whisper, audio_paths):
+    """一批音频一次 generate；内存不足时抛出 (由 map_batches 减半重试)，其他错误退回逐个转写"""
+    if len(audio_paths) == 1:
+        task = transcribe_file(whisper, audio_paths[0])
+        return [task] if task is not None else []
+    import librosa
+    model, processor, device = whisper
+    speeches, paths = [], []
+    for audio_path in audio_paths:
+        try:
+            with metrics.span("audio_decode"):
+                speeches.append(librosa.load(audio_path, sr=16000)[0])
+            paths.append(audio_path)
+        except Exception as e:
+            print(f"⚠️ 跳过文件 {os.path.basename(audio_path)}: {e}")
+            metrics.count("errors")
+    if not speeches:
+        return []
+    try:
+        with metrics.span("features"):
+            input_features = processor(speeches, sampling_rate=16000, return_tensors="pt").input_features.to(device)
+        with metrics.span("generate"):
+            outs = generate_scored_batch(whisper, input_features, language="zh")
+    except Exception as e:
+        if is_oom(e):
+            raise
+        tasks = [transcribe_file(whisper, p) for p in paths]
+        return [t for t in tasks if t is not None]
+    return [build_task(p, text, logprobs, len(speech) / 16000)
+            for p, speech, (text, logprobs) in zip(paths, speeches, outs)]
+
+def transcribe_all(whisper, audio_paths, batch):
+    """batch=1 逐个转写；否则按 batch 分批 generate，内存不足时减半重试。返回 (任务列表, 最终 batch)"""
+    if batch <= 1:
+        tasks = [transcribe_file(whisper, p) for p in audio_paths]
+        return [t for t in tasks if t is not None], batch
+    return map_batches(lambda chunk: transcribe_files(whisper, chunk), audio_paths, batch, whisper[2], "Whisper 推理")
+
+def run_inference(project_type, opts=None):
+    opts = opts or {}
     # === P2: 纯音频 ===
     if project_type == '2':
         print("🎧 模式: 项目 2 (纯音频)")
@@ -45,78 +137,103 @@ def run_inference(project_type):
         print(f"❌ 找不到音频文件夹: {config['audio_dir']}")
         return
 
-    # 2. 加载模型
-    print(f"🧠 加载模型: {config['model_path']}")
+    # 2. 扫描文件 (目录为空时不必加载 torch / transformers)
+    audio_files = []
+    for ext in AUDIO_EXTENSIONS:
+        audio_files.extend(glob.glob(os.path.join(config['audio_dir'], ext)))
+        audio_files.extend(glob.glob(os.path.join(config['audio_dir'], ext.upper())))
+
+    watch = bool(opts.get("watch"))
+    if not audio_files and not watch:
+        print(f"❌ 未找到音频文件: {config['audio_dir']}")
+        return
+
+    queue = None
+    if opts.get("queue") and not watch:
+        # 清单里存相对 DATA_ROOT 的路径，各节点挂载位置不同也能对上
+        rel_files = [os.path.relpath(p, DATA_ROOT) for p in audio_files]
+        queue = WorkQueue(queue_dir(config['output'], opts['queue']), rel_files,
+                          batch_size=opts['batch_size'], lease_seconds=opts['lease_seconds'],
+                          worker_id=opts.get('worker_id'))
+        st = queue.status()
+        print(f"🗂️  分布式队列 {opts['queue']} (worker {queue.worker_id}): "
+              f"{st['done']}/{st['batches']} 批已完成")
+        if st['merged']:
+            print(f"✅ 队列已完成并合并: {config['output']}")
+            return
+
+    # 3. 加载模型
+    if opts.get("model"):
+        config['model_path'] = opts['model']
+    t0 = time.perf_counter()
     try:
-        if os.path.exists(os.path.join(config['model_path'], "config.json")):
-            model = WhisperForConditionalGeneration.from_pretrained(config['model_path'])
-            processor = WhisperProcessor.from_pretrained(config['model_path'])
-        else:
-            print("⚠️ 离线模型未找到，尝试联网加载 openai/whisper-small...")
-            os.environ["HF_HUB_OFFLINE"] = "0" # 临时开启联网
-            model = WhisperForConditionalGeneration.from_pretrained("openai/whisper-small")
-            processor = WhisperProcessor.from_pretrained("openai/whisper-small")
-        
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        model.to(device)
-        print(f"🚀 模型已加载至 {device}")
+        whisper = load_whisper(config['model_path'], backend=opts.get("backend", "torch"),
+                               int8=opts.get("int8", False))
     except Exception as e:
         print(f"❌ 模型加载失败: {e}")
         return
+    metrics.observe("model_load", time.perf_counter() - t0)
+    # 按内存预算一次转写多个文件 (不设预算时逐个转写)
+    budget = parse_budget(opts.get("memory_budget"), whisper[2])
+    state = {"batch": fit_batch(budget, whisper[2], lambda: whisper_generate_probe(whisper), "Whisper 推理")}
 
-    # 3. 扫描文件
-    extensions = ['*.wav', '*.mp3', '*.flac', '*.m4a', '*.ogg']
-    audio_files = []
-    for ext in extensions:
-        audio_files.extend(glob.glob(os.path.join(config['audio_dir'], ext)))
-        audio_files.extend(glob.glob(os.path.join(config['audio_dir'], ext.upper())))
+    if watch:
+        # 已经在输出里的音频不重跑，之后新到 / 改动的文件逐批转写，结果追加进同一个预标注文件
+        output = TaskOutput(config['output'], "token_logprob")
+        watcher = FolderWatcher(config['audio_dir'], {e.lstrip('*') for e in AUDIO_EXTENSIONS},
+                                watch_state_path(config['output']), settle=opts.get("settle", SETTLE_SECONDS))
+        seeded = watcher.seed([os.path.join(DATA_ROOT, f) for f in output.files()])
+        if seeded:
+            print(f"📄 已有预标注 {len(output.tasks)} 条 ({seeded} 个文件记为已处理): {config['output']}")
 
-    if not audio_files:
-        print(f"❌ 未找到音频文件: {config['audio_dir']}")
+        def _transcribe_batch(paths):
+            tasks, state["batch"] = transcribe_all(whisper, paths, state["batch"])
+            output.update(tasks)
+
+        watch_loop(watcher, _transcribe_batch, max(opts.get("watch_batch", WATCH_BATCH), state["batch"]))
         return
 
-    print(f"🎤 开始处理 {len(audio_files)} 个文件...")
-    results_list = []
+    if queue is not None:
+        for batch_id, batch in queue.batches():
+            tasks, state["batch"] = transcribe_all(whisper, [os.path.join(DATA_ROOT, p) for p in batch], state["batch"])
+            queue.complete(batch_id, tasks)
+        if not queue.merge(config['output']):
+            print(f"✅ 本 worker 已无可领取批次，输出由最后完成的 worker 合并: {config['output']}")
+            return
+        with open(config['output'], 'r', encoding='utf-8') as f:
+            write_index(config['output'], json.load(f), "token_logprob")
+        return
 
-    for audio_path in tqdm(audio_files):
-        try:
-            # 读取并转写
-            speech, _ = librosa.load(audio_path, sr=16000)
-            input_features = processor(speech, sampling_rate=16000, return_tensors="pt").input_features.to(device)
-            
-            with torch.no_grad():
-                predicted_ids = model.generate(input_features, language="zh", task="transcribe")
-            
-            transcription = processor.batch_decode(predicted_ids, skip_special_tokens=True)[0]
-
-            # 生成相对路径 URL
-            rel_path = os.path.relpath(audio_path, DATA_ROOT)
-            ls_url = f"{LS_URL_PREFIX}{rel_path}"
-
-            results_list.append({
-                "data": {"audio": ls_url},
-                "predictions": [{
-                    "model_version": "whisper_v1",
-                    "result": [{
-                        "from_name": "transcription",
-                        "to_name": "audio",
-                        "type": "textarea",
-                        "value": {"text": [transcription]}
-                    }]
-                }]
-            })
-        except Exception as e:
-            print(f"⚠️ 跳过文件 {os.path.basename(audio_path)}: {e}")
+    print(f"🎤 开始处理 {len(audio_files)} 个文件...")
+    if state["batch"] > 1:
+        results_list, _ = transcribe_all(whisper, audio_files, state["batch"])
+    else:
+        from tqdm import tqdm
+        results_list = []
+        for audio_path in tqdm(audio_files):
+            task = transcribe_file(whisper, audio_path)
+            if task is not None:
+                results_list.append(task)
 
     # 4. 保存
     os.makedirs(os.path.dirname(config['output']), exist_ok=True)
-    with open(config['output'], 'w', encoding='utf-8') as f:
+    with metrics.span("serialize"), open(config['output'], 'w', encoding='utf-8') as f:
         json.dump(results_list, f, indent=2, ensure_ascii=False)
+    write_index(config['output'], results_list, "token_logprob")
 
     print(f"✅ 生成完毕: {config['output']}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--project", type=str, required=True)
+    parser.add_argument("--model", help="Whisper 模型目录 (默认 /app/models/whisper，也可指向 whisper-finetuned-model)")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default=os.getenv('WHISPER_BACKEND', 'torch'),
+                        help="onnx: 首次导出 ONNX 并缓存，之后用 ONNX Runtime (带 KV cache) 推理")
+    parser.add_argument("--int8", action="store_true", help="onnx 后端使用 int8 动态量化权重")
+    metrics.add_cli_args(parser)
+    work_queue_args(parser)
+    watch_args(parser)
+    memory_args(parser)
     args = parser.parse_args()
-    run_inference(args.project)
+    metrics.setup("whisper_to_ls", args)
+    run_inference(args.project, vars(args))
@@ -1,16 +1,16 @@
-import json
+import csv
 import os
 import sys
-import pandas as pd
-from pydub import AudioSegment
-from tqdm import tqdm
 import urllib.parse
 
 sys.stdout.reconfigure(line_buffering=True)
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.ls_export import iter_tasks, resolve_export_path
+
 # === ⚙️ Docker 路径配置 ===
 DATA_ROOT = os.getenv('DATA_ROOT', '/data')
-EXPORT_FILE = "./project_export.json" 
+EXPORT_FILE = "./project_export.jsonl" 
 # 指向 project_data/audio
 AUDIO_DIR = os.path.join(DATA_ROOT, "audio") 
 OUTPUT_DIR = "./dataset"
@@ -21,58 +21,65 @@ def prepare_dataset():
         os.makedirs(OUTPUT_DIR)
         os.makedirs(os.path.join(OUTPUT_DIR, "audio"))
 
-    if not os.path.exists(EXPORT_FILE):
+    export_file = resolve_export_path(EXPORT_FILE)
+    if not export_file:
         print(f"❌ 错误：找不到 {EXPORT_FILE}")
         return
 
-    with open(EXPORT_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    from pydub import AudioSegment
+    from tqdm import tqdm
 
-    metadata = []
-    print(f"✂️  开始处理 {len(data)} 个任务 (音频源: {AUDIO_DIR})...")
+    # 逐条读取任务、逐行写出 metadata，内存占用与项目大小无关
+    meta_path = os.path.join(OUTPUT_DIR, "metadata.csv")
+    with open(meta_path, 'w', encoding='utf-8', newline='') as meta_file:
+        writer = csv.writer(meta_file)
+        writer.writerow(["file_name", "sentence"])
+        count = 0
+        print(f"✂️  开始处理任务 (音频源: {AUDIO_DIR})...")
 
-    for task in tqdm(data):
-        audio_url = task.get('data', {}).get('audio', '')
-        if not audio_url: continue
+        for task in tqdm(iter_tasks(export_file), unit="task"):
+            audio_url = task.get('data', {}).get('audio', '')
+            if not audio_url: continue
 
-        decoded_url = urllib.parse.unquote(audio_url)
-        fname = os.path.basename(decoded_url).split('?')[0]
+            decoded_url = urllib.parse.unquote(audio_url)
+            fname = os.path.basename(decoded_url).split('?')[0]
 
-        # 在 /data/audio 查找文件
-        audio_path = os.path.join(AUDIO_DIR, fname)
+            # 在 /data/audio 查找文件
+            audio_path = os.path.join(AUDIO_DIR, fname)
         
-        if not os.path.exists(audio_path):
-            # 尝试递归搜索
-            found = False
-            for root, _, files in os.walk(AUDIO_DIR):
-                if fname in files:
-                    audio_path = os.path.join(root, fname)
-                    found = True; break
-            if not found: continue
+            if not os.path.exists(audio_path):
+                # 尝试递归搜索
+                found = False
+                for root, _, files in os.walk(AUDIO_DIR):
+                    if fname in files:
+                        audio_path = os.path.join(root, fname)
+                        found = True; break
+                if not found: continue
 
-        try:
-            audio = AudioSegment.from_file(audio_path)
-            for ann in task.get('annotations', []):
-                for res in ann.get('result', []):
-                    if res.get('type') == 'textarea':
-                        text = res.get('value', {}).get('text', [''])[0].strip()
-                        if not text or "正在转写" in text: continue
+            try:
+                audio = AudioSegment.from_file(audio_path)
+                for ann in task.get('annotations', []):
+                    for res in ann.get('result', []):
+                        if res.get('type') == 'textarea':
+                            text = res.get('value', {}).get('text', [''])[0].strip()
+                            if not text or "正在转写" in text: continue
                             
-                        start_ms = res['value'].get('start', 0) * 1000
-                        end_ms = res['value'].get('end', len(audio)/1000) * 1000
+                            start_ms = res['value'].get('start', 0) * 1000
+                            end_ms = res['value'].get('end', len(audio)/1000) * 1000
                         
-                        chunk_name = f"task{task['id']}_{res['id']}.wav"
-                        save_path = os.path.join(OUTPUT_DIR, "audio", chunk_name)
+                            chunk_name = f"task{task['id']}_{res['id']}.wav"
+                            save_path = os.path.join(OUTPUT_DIR, "audio", chunk_name)
                         
-                        audio[start_ms:end_ms].export(save_path, format="wav")
-                        metadata.append({"file_name": f"audio/{chunk_name}", "sentence": text})
-        except Exception as e:
-            print(f"⚠️ 错误: {e}")
+                            audio[start_ms:end_ms].export(save_path, format="wav")
+                            writer.writerow([f"audio/{chunk_name}", text])
+                            count += 1
+            except Exception as e:
+                print(f"⚠️ 错误: {e}")
 
-    if metadata:
-        pd.DataFrame(metadata).to_csv(os.path.join(OUTPUT_DIR, "metadata.csv"), index=False)
-        print(f"✅ 成功切分 {len(metadata)} 条数据！")
+    if count:
+        print(f"✅ 成功切分 {count} 条数据！")
     else:
+        os.remove(meta_path)
         print("❌ 未提取到数据。请检查音频文件是否已放入 project_data/audio")
 
 if __name__ == "__main__":
@@ -1,46 +1,25 @@
 import os
 import sys
-import torch
-import evaluate
-import librosa
-import numpy as np
 from dataclasses import dataclass
 from typing import Any, Dict, List, Union
 
 sys.stdout.reconfigure(line_buffering=True)
 
 # === 🛡️ 路径与设备安全配置 ===
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 任务队列下读写 jobs.py 分配的独立工作目录
+BASE_DIR = os.getenv('JOB_WORK_DIR') or SCRIPT_DIR
 DATASET_DIR = os.path.join(BASE_DIR, "dataset")
 OUTPUT_DIR = os.path.join(BASE_DIR, "whisper-finetuned-model")
 
 # 🔥 核心修改：优先使用离线模型
 OFFLINE_MODEL_PATH = "/app/models/whisper"
-if os.path.exists(os.path.join(OFFLINE_MODEL_PATH, "config.json")):
-    print(f"✅ 检测到离线模型，使用: {OFFLINE_MODEL_PATH}")
-    MODEL_NAME = OFFLINE_MODEL_PATH
-else:
-    print("⚠️ 未找到离线模型，将尝试从 HuggingFace 下载 openai/whisper-small")
-    MODEL_NAME = "openai/whisper-small"
-
-# 智能设备检测
-USE_CUDA = torch.cuda.is_available()
-if USE_CUDA:
-    print(f"🚀 检测到 GPU: {torch.cuda.get_device_name(0)}")
-else:
-    print("⚠️ 降级为 CPU 模式")
+# 不设内存预算 (环境变量 MEMORY_BUDGET) 时的固定 batch，也是有效 batch 的下限 (不足时用梯度累积补齐)
+TRAIN_BATCH = 4
 # ========================================
 
-# P40/离线 补丁
-os.environ["HF_DATASETS_OFFLINE"] = "0"
-sys.modules['torchcodec'] = None 
-from datasets import config, load_dataset
-config.USE_TORCHCODEC = False
-
-from transformers import (
-    WhisperTokenizer, WhisperProcessor, WhisperForConditionalGeneration, 
-    Seq2SeqTrainingArguments, Seq2SeqTrainer
-)
+sys.path.insert(0, os.path.dirname(SCRIPT_DIR))
+from common import mem_budget
 
 def main():
     metadata_path = os.path.join(DATASET_DIR, "metadata.csv")
@@ -48,6 +27,36 @@ def main():
         print(f"❌ 找不到数据集 {metadata_path}")
         sys.exit(1)
 
+    if os.path.exists(os.path.join(OFFLINE_MODEL_PATH, "config.json")):
+        print(f"✅ 检测到离线模型，使用: {OFFLINE_MODEL_PATH}")
+        MODEL_NAME = OFFLINE_MODEL_PATH
+    else:
+        print("⚠️ 未找到离线模型，将尝试从 HuggingFace 下载 openai/whisper-small")
+        MODEL_NAME = "openai/whisper-small"
+
+    # 数据集就绪后才导入重型依赖
+    import torch
+    import evaluate
+    import librosa
+
+    # 智能设备检测
+    USE_CUDA = torch.cuda.is_available()
+    if USE_CUDA:
+        print(f"🚀 检测到 GPU: {torch.cuda.get_device_name(0)}")
+    else:
+        print("⚠️ 降级为 CPU 模式")
+
+    # P40/离线 补丁 (必须在导入 datasets 之前生效)
+    os.environ["HF_DATASETS_OFFLINE"] = "0"
+    sys.modules['torchcodec'] = None 
+    from datasets import config, load_dataset
+    config.USE_TORCHCODEC = False
+
+    from transformers import (
+        WhisperTokenizer, WhisperProcessor, WhisperForConditionalGeneration, 
+        Seq2SeqTrainingArguments, Seq2SeqTrainer
+    )
+
     print("🚀 加载数据集...")
     dataset = load_dataset("csv", data_files=metadata_path)
     dataset = dataset["train"].train_test_split(test_size=0.1)
@@ -84,6 +93,14 @@ def main():
             batch["labels"] = labels
             return batch
 
+    # 按内存预算选 batch (探测一次前向 + 反向，另算 AdamW 状态)
+    device = "cuda" if USE_CUDA else "cpu"
+    budget = mem_budget.parse_budget(os.getenv(mem_budget.BUDGET_ENV), device)
+    batch = mem_budget.fit_batch(budget, device, lambda: mem_budget.whisper_train_probe(model, device),
+                                 "Whisper 训练", default=TRAIN_BATCH)
+    accum = mem_budget.grad_accum(batch, TRAIN_BATCH)
+    print(f"⚙️  per_device_train_batch_size={batch}, gradient_accumulation_steps={accum}")
+
     metric = evaluate.load("wer")
     def compute_metrics(pred):
         pred_ids = pred.predictions
@@ -95,7 +112,11 @@ def main():
 
     training_args = Seq2SeqTrainingArguments(
         output_dir=OUTPUT_DIR,
-        per_device_train_batch_size=4,
+        per_device_train_batch_size=batch,
+        per_device_eval_batch_size=batch if budget else 8,  # 8 是 transformers 的默认值
+        gradient_accumulation_steps=accum,
+        # 设了预算时训练中途分配失败由 Trainer 把 batch 减半重试 (accelerate.find_executable_batch_size)
+        auto_find_batch_size=budget is not None,
         learning_rate=1e-5,
         max_steps=500,
         gradient_checkpointing=False,
@@ -1,8 +1,16 @@
 import os
 import glob
 import json
+import time
 import argparse
-from ultralytics import YOLO
+
+from common import metrics
+from common.uncertainty import CANDIDATE_CONF, detection_uncertainty, write_index
+from common.mem_budget import fit_batch, is_oom, map_batches, parse_budget, yolo_predict_probe, \
+    add_cli_args as memory_args
+from common.work_queue import WorkQueue, queue_dir, add_cli_args as work_queue_args
+from common.watch_folder import (SETTLE_SECONDS, WATCH_BATCH, FolderWatcher, TaskOutput, watch_loop, watch_state_path,
+                                 add_cli_args as watch_args)
 
 # ==========================================
 # ⚙️ Docker 适配配置
@@ -13,8 +21,90 @@ DATA_ROOT = os.getenv('DATA_ROOT', '/data')
 LS_URL_PREFIX = "/data/local-files/?d=/data/"
 # 基础模型路径 (离线)
 BASE_MODEL_PATH = "/app/models/yolov8n.pt"
+# 写进预标注的框的置信度下限 (更低的候选框只用来估计不确定度)
+PRED_CONF = 0.25
+IMAGE_EXTENSIONS = ['*.jpg', '*.jpeg', '*.png', '*.JPG', '*.PNG', '*.webp']
+
+def predict_image(model, img_path, labels):
+    """单张图片推理，返回一条 Label Studio 预标注任务 (出错返回 None)"""
+    try:
+        with metrics.span("predict"):
+            results = model.predict(img_path, conf=CANDIDATE_CONF, verbose=False)
+    except Exception as e:
+        print(f"⚠️ 推理出错 {os.path.basename(img_path)}: {e}")
+        metrics.count("errors")
+        return None
+    return build_task(results, img_path, labels)
+
+def predict_images(model, img_paths, labels):
+    """一批图片一次前向 (监听模式的微批)；整批出错时退回逐张推理，跳过坏图"""
+    try:
+        with metrics.span("predict"):
+            results = model.predict(list(img_paths), conf=CANDIDATE_CONF, batch=len(img_paths), verbose=False)
+    except Exception as e:
+        if is_oom(e) and len(img_paths) > 1:
+            raise
+        tasks = [predict_image(model, p, labels) for p in img_paths]
+        return [t for t in tasks if t is not None]
+    return [build_task([r], p, labels) for r, p in zip(results, img_paths)]
+
+def predict_all(model, img_paths, labels, batch, device):
+    """batch=1 逐张推理；否则按 batch 分批，内存不足时减半重试。返回 (任务列表, 最终 batch)"""
+    if batch <= 1:
+        tasks = [predict_image(model, p, labels) for p in img_paths]
+        return [t for t in tasks if t is not None], batch
+    return map_batches(lambda chunk: predict_images(model, chunk, labels), img_paths, batch, device, "YOLO 推理")
+
+def build_task(results, img_path, labels):
+    """推理结果 -> Label Studio 预标注任务"""
+    t_post = time.perf_counter()
+    predictions = []
+    confs = []
+    for result in results:
+        for box in result.boxes:
+            conf = float(box.conf[0])
+            confs.append(conf)
+            if conf < PRED_CONF: continue
+            cls = int(box.cls[0])
+            label_name = labels.get(cls)
+            if not label_name: continue 
+            
+            # 坐标归一化
+            x, y, w, h = box.xywhn[0].tolist()
+            
+            predictions.append({
+                "from_name": "rect_label", 
+                "to_name": "image",
+                "type": "rectanglelabels",
+                "value": {
+                    "x": (x-w/2)*100, "y": (y-h/2)*100, 
+                    "width": w*100, "height": h*100, 
+                    "rectanglelabels": [label_name]
+                },
+                "score": conf
+            })
+    
+    # 🔥 生成 Docker 相对路径
+    # 物理路径: /data/images/1.jpg
+    # 相对路径: images/1.jpg
+    # URL: /data/local-files/?d=/data/images/1.jpg
+    rel_path = os.path.relpath(img_path, DATA_ROOT)
+    ls_url = f"{LS_URL_PREFIX}{rel_path}"
+
+    # 任务级分数 = 不确定度 (Label Studio 里按 Prediction score 降序即为建议的标注顺序)
+    unc = detection_uncertainty(confs)
+    task = {
+        "data": {"image": ls_url},
+        "predictions": [{"result": predictions, "score": unc["score"]}],
+        "meta": {"uncertainty": unc}
+    }
+    metrics.observe("postprocess", time.perf_counter() - t_post)
+    metrics.count("images")
+    metrics.count("boxes", len(predictions))
+    metrics.step()
+    return task
 
-def run_inference(project_type):
+def run_inference(project_type, queue_opts=None):
     # === P1: 产品图片 ===
     if project_type == '1':
         print("📦 模式: 项目 1 (产品图片)")
@@ -39,7 +129,21 @@ def run_inference(project_type):
         print(f"❌ 未知项目类型: {project_type}")
         return
 
-    # 1. 检查模型
+    # 1. 扫描图片 (先做廉价检查，目录为空时不必加载模型)
+    if not os.path.exists(config['images']):
+        print(f"❌ 图片目录不存在: {config['images']}")
+        return
+
+    image_files = []
+    for ext in IMAGE_EXTENSIONS:
+        image_files.extend(glob.glob(os.path.join(config['images'], ext)))
+
+    watch = bool(queue_opts and queue_opts.get("watch"))
+    if not image_files and not watch:
+        print(f"❌ 未找到图片: {config['images']}")
+        return
+
+    # 2. 检查模型
     if not os.path.exists(config['model']):
         print(f"⚠️ 指定模型不存在: {config['model']}")
         if os.path.exists(BASE_MODEL_PATH):
@@ -49,76 +153,79 @@ def run_inference(project_type):
             print("⚠️ 基础模型也没找到，尝试在线下载 yolov8n.pt...")
             config['model'] = 'yolov8n.pt'
     
+    queue = None
+    if queue_opts and queue_opts.get("queue") and not watch:
+        # 清单里存相对 DATA_ROOT 的路径，各节点挂载位置不同也能对上
+        rel_files = [os.path.relpath(p, DATA_ROOT) for p in image_files]
+        queue = WorkQueue(queue_dir(config['output'], queue_opts['queue']), rel_files,
+                          batch_size=queue_opts['batch_size'], lease_seconds=queue_opts['lease_seconds'],
+                          worker_id=queue_opts.get('worker_id'))
+        st = queue.status()
+        print(f"🗂️  分布式队列 {queue_opts['queue']} (worker {queue.worker_id}): "
+              f"{st['done']}/{st['batches']} 批已完成")
+        if st['merged']:
+            print(f"✅ 队列已完成并合并: {config['output']}")
+            return
+
     print(f"🧠 加载模型: {config['model']}")
-    model = YOLO(config['model'])
+    with metrics.span("model_load"):
+        from ultralytics import YOLO
+        model = YOLO(config['model'])
 
-    # 2. 扫描图片
-    if not os.path.exists(config['images']):
-        print(f"❌ 图片目录不存在: {config['images']}")
-        return
+    # 按内存预算一次推理多张 (不设预算时逐张；监听模式默认整个微批一次前向)
+    import torch
+    opts = queue_opts or {}
+    device = 0 if torch.cuda.is_available() else "cpu"
+    budget = parse_budget(opts.get("memory_budget"), device)
+    state = {"batch": fit_batch(budget, device, lambda: yolo_predict_probe(model), "YOLO 推理",
+                                default=opts.get('watch_batch', WATCH_BATCH) if watch else 1)}
 
-    image_files = []
-    for ext in ['*.jpg', '*.jpeg', '*.png', '*.JPG', '*.PNG', '*.webp']:
-        image_files.extend(glob.glob(os.path.join(config['images'], ext)))
+    def _predict(paths):
+        tasks, state["batch"] = predict_all(model, paths, config['labels'], state["batch"], device)
+        return tasks
 
-    if not image_files:
-        print(f"❌ 未找到图片: {config['images']}")
+    if watch:
+        # 已经在输出里的图片不重跑，之后新到 / 改动的图片攒成小批推理，结果追加进同一个预标注文件
+        output = TaskOutput(config['output'], "detection_entropy")
+        watcher = FolderWatcher(config['images'], {e.lstrip('*') for e in IMAGE_EXTENSIONS},
+                                watch_state_path(config['output']), settle=opts.get('settle', SETTLE_SECONDS))
+        seeded = watcher.seed([os.path.join(DATA_ROOT, f) for f in output.files()])
+        if seeded:
+            print(f"📄 已有预标注 {len(output.tasks)} 条 ({seeded} 张图片记为已处理): {config['output']}")
+        watch_loop(watcher, lambda paths: output.update(_predict(paths)),
+                   max(opts.get('watch_batch', WATCH_BATCH), state["batch"]))
+        return
+
+    if queue is not None:
+        for batch_id, batch in queue.batches():
+            queue.complete(batch_id, _predict([os.path.join(DATA_ROOT, p) for p in batch]))
+        if not queue.merge(config['output']):
+            print("-" * 30)
+            print(f"✅ 本 worker 已无可领取批次，输出由最后完成的 worker 合并: {config['output']}")
+            return
+        with open(config['output'], 'r', encoding='utf-8') as f:
+            write_index(config['output'], json.load(f), "detection_entropy")
         return
 
     print(f"🔍 扫描到 {len(image_files)} 张图片，开始推理...")
-    results_list = []
-
-    for img_path in image_files:
-        try:
-            results = model.predict(img_path, conf=0.25, verbose=False)
-        except Exception as e:
-            print(f"⚠️ 推理出错 {os.path.basename(img_path)}: {e}")
-            continue
-
-        predictions = []
-        for result in results:
-            for box in result.boxes:
-                cls = int(box.cls[0])
-                label_name = config['labels'].get(cls)
-                if not label_name: continue 
-                
-                # 坐标归一化
-                x, y, w, h = box.xywhn[0].tolist()
-                
-                predictions.append({
-                    "from_name": "rect_label", 
-                    "to_name": "image",
-                    "type": "rectanglelabels",
-                    "value": {
-                        "x": (x-w/2)*100, "y": (y-h/2)*100, 
-                        "width": w*100, "height": h*100, 
-                        "rectanglelabels": [label_name]
-                    },
-                    "score": float(box.conf[0])
-                })
-        
-        # 🔥 生成 Docker 相对路径
-        # 物理路径: /data/images/1.jpg
-        # 相对路径: images/1.jpg
-        # URL: /data/local-files/?d=/data/images/1.jpg
-        rel_path = os.path.relpath(img_path, DATA_ROOT)
-        ls_url = f"{LS_URL_PREFIX}{rel_path}"
-
-        results_list.append({
-            "data": {"image": ls_url},
-            "predictions": [{"result": predictions, "score": 0.5}]
-        })
+    results_list = _predict(image_files)
 
     # 3. 保存结果
     os.makedirs(os.path.dirname(config['output']), exist_ok=True)
-    with open(config['output'], 'w', encoding='utf-8') as f:
+    with metrics.span("serialize"), open(config['output'], 'w', encoding='utf-8') as f:
         json.dump(results_list, f, indent=2, ensure_ascii=False)
-    
+    write_index(config['output'], results_list, "detection_entropy")
+
     print("-" * 30)
     print(f"✅ 生成完毕: {config['output']}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--project", type=str, required=True)
+    metrics.add_cli_args(parser)
+    work_queue_args(parser)
+    watch_args(parser)
+    memory_args(parser)
     args = parser.parse_args()
-    run_inference(args.project)
+    metrics.setup("yolo_to_ls", args)
+    run_inference(args.project, vars(args))
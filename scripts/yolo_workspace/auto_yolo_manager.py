@@ -9,7 +9,9 @@ from urllib.parse import unquote
 sys.stdout.reconfigure(line_buffering=True)
 
 # 锁定工作目录
-WORK_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 由任务队列 (jobs.py) 调度时使用独立工作目录，多个任务可并发
+WORK_DIR = os.getenv('JOB_WORK_DIR') or SCRIPT_DIR
 os.chdir(WORK_DIR)
 print(f"📂 P1 工作目录: {WORK_DIR}")
 
@@ -22,13 +24,17 @@ DATA_ROOT = os.getenv('DATA_ROOT', '/data')
 SOURCE_IMG_ROOT = os.path.join(DATA_ROOT, "images")
 DATASET_DIR = os.path.abspath("datasets")
 YAML_PATH = os.path.abspath("data.yaml")
-
-# 导入 SDK
-try:
-    from label_studio_sdk.client import LabelStudio
-except ImportError:
-    print("❌ 未安装 label-studio-sdk")
-    sys.exit(1)
+EXPORT_PATH = os.path.abspath("project_export.jsonl")
+# 本次样本清单，train.py 训练成功后据此更新 "已训练样本"
+PENDING_SAMPLES = os.path.abspath("train_samples.json")
+
+sys.path.insert(0, os.path.dirname(SCRIPT_DIR))
+from common.ls_export import export_tasks_jsonl, iter_tasks
+from common import metrics
+from common import incremental_train
+from common import mem_budget
+from common.yolo_dataset import add_sample, oversample
+from common.yolo_shards import ShardWriter, write_data_yaml
 
 CLASS_MAP = {"物体框(Box)": 0, "文字区域": 1, "复杂轮廓(Poly)": 2}
 
@@ -49,7 +55,14 @@ def convert_ls_to_yolo(ls_result, img_width, img_height):
         yolo_lines.append(f"{class_id} {x_center:.6f} {y_center:.6f} {w_norm:.6f} {h_norm:.6f}")
     return yolo_lines
 
-def run_pipeline(project_id):
+def run_pipeline(project_id, imgsz=640, use_cache=True, train_opts=None, dataset_format="files"):
+    # 导入 SDK (延迟到真正需要连接时)
+    try:
+        from label_studio_sdk.client import LabelStudio
+    except ImportError:
+        print("❌ 未安装 label-studio-sdk")
+        sys.exit(1)
+
     print(f"🔌 连接 Label Studio: {LS_URL}")
     try:
         client = LabelStudio(base_url=LS_URL, api_key=API_KEY)
@@ -59,21 +72,25 @@ def run_pipeline(project_id):
 
     print(f"🎣 导出项目 {project_id} 数据...")
     try:
-        tasks = client.projects.exports.as_json(project_id)
-        # 兼容列表或生成器
-        tasks = list(tasks)
-        print(f"✅ 获取到 {len(tasks)} 条任务")
+        # 流式写入 JSONL，后续逐条转换，不在内存中保留整个导出
+        with metrics.span("ls_export"):
+            total = export_tasks_jsonl(client, project_id, EXPORT_PATH)
+        print(f"✅ 获取到 {total} 条任务")
     except Exception as e:
         print(f"❌ 导出失败: {e}"); return
 
     # 清理数据集目录
     if os.path.exists(DATASET_DIR): shutil.rmtree(DATASET_DIR)
-    for d in ["images/train", "labels/train", "images/val", "labels/val"]:
+    # 分片格式: 样本直接追加进大 tar 分片，不落成一个个小文件
+    writer = ShardWriter(DATASET_DIR) if dataset_format == "shards" else None
+    for d in ([] if writer else ["images/train", "labels/train", "images/val", "labels/val"]):
         os.makedirs(os.path.join(DATASET_DIR, d), exist_ok=True)
 
-    print("✂️  开始转换...")
+    print("✂️  开始转换..." + (f" (预缩放缓存 imgsz={imgsz})" if use_cache else ""))
     count = 0
-    for task in tasks:
+    samples = {}
+    imgsz_cache = imgsz if use_cache else None
+    for task in iter_tasks(EXPORT_PATH):
         # 获取文件名: /data/local-files/?d=/data/images/1.jpg -> 1.jpg
         img_url = task.get('data', {}).get('image', '')
         if not img_url: continue
@@ -98,28 +115,54 @@ def run_pipeline(project_id):
         yolo_data = convert_ls_to_yolo(res, orig_w, orig_h)
         
         if yolo_data:
-            txt_name = os.path.splitext(fname)[0] + ".txt"
-            for split in ['train', 'val']:
-                shutil.copy(src_path, os.path.join(DATASET_DIR, f"images/{split}", fname))
-                with open(os.path.join(DATASET_DIR, f"labels/{split}", txt_name), "w") as f:
-                    f.write("\n".join(yolo_data))
-            count += 1
+            with metrics.span("dataset_build"):
+                if writer:
+                    added = writer.add(src_path, fname, yolo_data, imgsz=imgsz_cache)
+                else:
+                    added = add_sample(DATASET_DIR, src_path, fname, yolo_data, imgsz=imgsz_cache)
+            if added:
+                count += 1
+                samples[added] = incremental_train.label_digest(yolo_data)
+                metrics.count("samples")
 
     print(f"📊 准备了 {count} 个样本")
     if count == 0:
         print("❌ 无有效样本，终止训练。"); return
 
+    # 上次训练之后新增 / 改过标注的样本；增量训练时在 train 里过采样
+    new = incremental_train.new_samples("p1", samples)
+    if train_opts and train_opts.incremental and 0 < len(new) < len(samples):
+        if writer:
+            dup = writer.oversample(new, train_opts.new_repeat)
+        else:
+            dup = oversample(DATASET_DIR, new, train_opts.new_repeat)
+        print(f"🆕 新样本 {len(new)} 个，train 中各放 {train_opts.new_repeat} 份 (+{dup})")
+    incremental_train.write_pending(PENDING_SAMPLES, samples, new)
+
+    if writer:
+        with metrics.span("dataset_build"):
+            writer.close()
+
     # 生成 YAML
-    with open(YAML_PATH, 'w') as f:
-        f.write(f"path: {DATASET_DIR}\ntrain: images/train\nval: images/val\nnc: {len(CLASS_MAP)}\nnames:\n")
-        for name, idx in CLASS_MAP.items():
-            f.write(f"  {idx}: {name}\n")
+    write_data_yaml(YAML_PATH, DATASET_DIR, CLASS_MAP, shards=writer is not None)
 
     print("🔥 调用 train.py 开始训练...")
-    os.system(f"{sys.executable} train.py")
+    extra = incremental_train.forward_args(train_opts) if train_opts else ""
+    with metrics.span("train"):
+        os.system(f'{sys.executable} "{os.path.join(SCRIPT_DIR, "train.py")}" --imgsz {imgsz} {extra}')
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--project_id", type=int, default=1)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--no-cache", action="store_true", help="直接复制原图，不做预缩放")
+    parser.add_argument("--format", choices=["files", "shards"], default=os.getenv('YOLO_DATASET_FORMAT', 'files'),
+                        help="shards: 图片和标签打包成大 tar 分片，网络盘上训练时顺序读取")
+    incremental_train.add_cli_args(parser)
+    mem_budget.add_cli_args(parser)
     args = parser.parse_args()
-    run_pipeline(args.project_id)
+    metrics.setup("auto_yolo_manager")
+    # train.py 由 os.system 拉起，预算经环境变量传过去
+    mem_budget.export_budget(args.memory_budget)
+    run_pipeline(args.project_id, imgsz=args.imgsz, use_cache=not args.no_cache, train_opts=args,
+                 dataset_format=args.format)
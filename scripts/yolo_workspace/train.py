@@ -1,47 +1,137 @@
 import os
 import sys
-import torch
-from ultralytics import YOLO
+import time
+import argparse
 
 # 强制开启日志
 sys.stdout.reconfigure(line_buffering=True)
 
-# 1. 设备检测
-if torch.cuda.is_available():
-    DEVICE = '0'
-    print(f"🚀 GPU 模式: {torch.cuda.get_device_name(0)}")
-else:
-    DEVICE = 'cpu'
-    print("⚠️ CPU 模式")
-
-# 2. 路径配置
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# 1. 路径配置
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 任务队列下读写 jobs.py 分配的独立工作目录
+BASE_DIR = os.getenv('JOB_WORK_DIR') or SCRIPT_DIR
 YAML_PATH = os.path.join(BASE_DIR, 'data.yaml')
 PROJECT_DIR = os.path.join(BASE_DIR, 'runs/detect')
-
-# 3. 加载模型 (优先使用 Docker 映射的离线模型)
 LOCAL_MODEL = "/app/models/yolov8n.pt"
-if os.path.exists(LOCAL_MODEL):
-    print(f"📥 加载离线模型: {LOCAL_MODEL}")
-    model = YOLO(LOCAL_MODEL)
-else:
-    print("⚠️ 未找到离线模型，尝试下载...")
-    model = YOLO('yolov8n.pt') 
-
-# 4. 开始训练
-print(f"🚀 读取配置: {YAML_PATH}")
-try:
-    results = model.train(
-        data=YAML_PATH,
-        epochs=100,
-        imgsz=640,
-        batch=8,
-        device=DEVICE,
-        project=PROJECT_DIR,
-        name='my_defect_project', 
-        exist_ok=True
-    )
-    print("🎉 P1 训练成功！")
-except Exception as e:
-    print(f"❌ 训练失败: {e}")
-    sys.exit(1)
+RUN_NAME = 'my_defect_project'
+FULL_EPOCHS = 100
+# 不设 --memory-budget 时的固定 batch
+TRAIN_BATCH = 8
+# auto_yolo_manager 写出的本次样本清单 (增量训练用来区分新样本)
+PENDING_SAMPLES = os.path.join(BASE_DIR, 'train_samples.json')
+DATA_ROOT = os.getenv('DATA_ROOT', '/data')
+JOBS_ROOT = os.getenv('JOBS_ROOT', os.path.join(DATA_ROOT, "jobs"))
+# 增量训练的热启动候选: 手动发布的最佳模型 + 历次训练 (含任务队列工作目录) 的 best.pt，取最新
+WARM_START = [
+    os.path.join(DATA_ROOT, "outputs/my_best_model.pt"),
+    os.path.join(PROJECT_DIR, f"{RUN_NAME}/weights/best.pt"),
+    os.path.join(SCRIPT_DIR, f"runs/detect/{RUN_NAME}/weights/best.pt"),
+    os.path.join(JOBS_ROOT, f"job_*/runs/detect/{RUN_NAME}/weights/best.pt"),
+]
+STATE_NAME = "p1"
+
+sys.path.insert(0, os.path.dirname(SCRIPT_DIR))
+from common import metrics
+from common import incremental_train
+from common import mem_budget
+from common.yolo_dataset import attach_epoch_timer, report_epoch_times
+from common.yolo_shards import shard_dir_from_yaml
+
+
+def main(args):
+    if not os.path.exists(YAML_PATH):
+        print(f"❌ 找不到数据配置: {YAML_PATH}")
+        sys.exit(1)
+
+    pending = incremental_train.read_pending(PENDING_SAMPLES)
+    warm = incremental_train.find_warm_start(WARM_START) if args.incremental else None
+    if args.incremental and not warm:
+        print("⚠️ 没有可热启动的权重，改为全量训练")
+        args.incremental = False
+    if args.incremental and pending["samples"] and not pending["new"]:
+        print(f"✅ 没有新增或修改过的样本，当前模型已是最新: {warm}")
+        return
+
+    # 配置就绪后才导入 torch / ultralytics
+    import torch
+    from ultralytics import YOLO
+
+    # 2. 设备检测
+    if torch.cuda.is_available():
+        device = '0'
+        print(f"🚀 GPU 模式: {torch.cuda.get_device_name(0)}")
+    else:
+        device = 'cpu'
+        print("⚠️ CPU 模式")
+
+    # 3. 加载模型 (增量: 当前最佳权重；全量: 优先使用 Docker 映射的离线模型)
+    if args.incremental:
+        print(f"🔁 增量训练，热启动: {warm} (新样本 {len(pending['new'])} / {len(pending['samples'])})")
+        model = YOLO(warm)
+    elif os.path.exists(LOCAL_MODEL):
+        print(f"📥 加载离线模型: {LOCAL_MODEL}")
+        model = YOLO(LOCAL_MODEL)
+    else:
+        print("⚠️ 未找到离线模型，尝试下载...")
+        model = YOLO('yolov8n.pt')
+
+    # 4. 开始训练
+    print(f"🚀 读取配置: {YAML_PATH}")
+    epoch_times = attach_epoch_timer(model)
+    curve = incremental_train.attach_map_curve(model)
+    train_args = incremental_train.train_kwargs(args, FULL_EPOCHS)
+    print(f"⚙️  训练参数: {train_args}")
+    shard_dir = shard_dir_from_yaml(YAML_PATH)
+    if shard_dir:
+        # 分片格式由自定义 trainer 读取 (按分片顺序大块读入)
+        from common.yolo_shard_loader import ShardTrainer
+        train_args["trainer"] = ShardTrainer
+        print(f"📦 分片数据集: {shard_dir}")
+    # 按内存预算选 batch；训练中途分配失败时 batch 减半从头重训
+    budget = mem_budget.parse_budget(args.memory_budget, device)
+    batch = mem_budget.fit_batch(budget, device, lambda: mem_budget.yolo_train_probe(model, args.imgsz, device),
+                                 "YOLO 训练", default=TRAIN_BATCH)
+
+    def _train(b):
+        del epoch_times[:], curve[:]
+        return model.train(
+            data=YAML_PATH,
+            imgsz=args.imgsz,
+            batch=b,
+            device=device,
+            project=PROJECT_DIR,
+            name=RUN_NAME,
+            exist_ok=True,
+            **train_args
+        )
+
+    t0 = time.time()
+    try:
+        with metrics.span("train"):
+            if budget:
+                results, batch = mem_budget.retry_batches(_train, batch, device, "YOLO 训练")
+            else:
+                results = _train(batch)
+        print(f"⚙️  训练 batch={batch}")
+        report_epoch_times(epoch_times)
+        print("🎉 P1 训练成功！")
+    except Exception as e:
+        print(f"❌ 训练失败: {e}")
+        sys.exit(1)
+
+    # 5. 记下本次训练过的样本和 mAP 曲线 (增量训练对照全量基线计算节省的时间)
+    if pending["samples"]:
+        incremental_train.save_trained_samples(STATE_NAME, pending["samples"])
+    incremental_train.record_run(STATE_NAME, "incremental" if args.incremental else "full", curve,
+                                 time.time() - t0, weights=getattr(model.trainer, "best", None),
+                                 samples=len(pending["samples"]), new=len(pending["new"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--imgsz", type=int, default=640)
+    incremental_train.add_cli_args(parser)
+    mem_budget.add_cli_args(parser)
+    args = parser.parse_args()
+    metrics.setup("train")
+    main(args)